@@ -0,0 +1,91 @@
+# audio_source.py
+"""
+Memory-mapped WAV streaming.
+
+WavStream maps the file instead of reading it, and yields normalized float32
+blocks lazily, so a multi-hour recording costs a block of memory rather than
+the whole file (twice, once converted). 24-bit PCM cannot be mapped (scipy
+has no 3-byte sample type); such files are read into memory as int32.
+Blocks can be paced in real time, as
+if they came from the microphone, or delivered as fast as possible.
+
+Feed it through the same engine as the live microphone:
+
+    stream = SirenStream(sample_rate=source.sample_rate)
+    stream.run_source(WavStream("siren.wav"))
+"""
+
+import time
+import numpy as np
+from scipy.io import wavfile
+
+def full_scale(dtype):
+    """(offset, scale) mapping raw samples of dtype into [-1, 1]."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return 0.0, 1.0
+    if dtype.kind == "u":  # 8-bit WAV is unsigned
+        half = 2 ** (8 * dtype.itemsize - 1)
+        return float(half), 1.0 / half
+    return 0.0, 1.0 / 2 ** (8 * dtype.itemsize - 1)
+
+class WavStream:
+    """Lazily yields normalized blocks of a WAV file.
+
+    block_seconds: samples per yielded block.
+    realtime: pace blocks at the file's sample rate; False = as fast as possible.
+    loop: start over at the end of the file (demo playback).
+    mono: average channels; False yields (block, channels) for a mic array.
+    """
+
+    def __init__(self, path, block_seconds=0.1, realtime=True, loop=False, mono=True):
+        self.path = path
+        try:
+            self.sample_rate, self.data = wavfile.read(path, mmap=True)
+        except ValueError:
+            # 24-bit PCM: no mmap support, read it whole (left-aligned int32)
+            self.sample_rate, self.data = wavfile.read(path)
+        self.channels = 1 if self.data.ndim == 1 else self.data.shape[1]
+        self.block = max(1, int(block_seconds * self.sample_rate))
+        self.realtime = realtime
+        self.loop = loop
+        self.mono = mono
+        self.offset, self.scale = full_scale(self.data.dtype)
+        self.position = 0  # samples yielded from the current pass
+        self.running = True
+
+    @property
+    def duration(self):
+        return len(self.data) / self.sample_rate
+
+    def _normalize(self, raw):
+        block = raw.astype(np.float32)
+        if self.offset:
+            block -= self.offset
+        block *= self.scale
+        if block.ndim > 1 and self.mono:
+            block = block.mean(axis=1)
+        return block
+
+    def blocks(self):
+        """Generator of float32 blocks; only the current block is in memory."""
+        start = time.monotonic()
+        emitted = 0
+        while self.running:
+            if self.position >= len(self.data):
+                if not self.loop or len(self.data) == 0:
+                    return
+                self.position = 0
+            raw = self.data[self.position:self.position + self.block]
+            self.position += len(raw)
+            emitted += len(raw)
+            yield self._normalize(raw)
+            if self.realtime:
+                delay = start + emitted / self.sample_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def close(self):
+        self.running = False
+        # drop the mapping so the file can be closed/removed
+        self.data = None
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Compare detector backends on recorded clips.
+
+For each backend this measures batch latency, throughput (frames/s) and how
+well its detections agree with the PyTorch baseline (IoU-matched F1 on boxes
+of the same class), so the fastest backend that stays accurate can be picked.
+
+Usage:
+    python benchmark_backends.py --clips lane_n.mp4 lane_e.mp4
+    python benchmark_backends.py --clips clip.mp4 --backends torch onnx onnx-int8 --frames 200
+"""
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+import detections
+from camera_detection import resize_for_inference
+from detector_backends import BACKENDS
+from model_registry import DEFAULT_WEIGHTS, get_model, registry
+from tracker import iou_matrix
+
+def load_frames(clips, max_frames):
+    """Decode up to max_frames per clip up front so decoding isn't timed."""
+    frames = []
+    for clip in clips:
+        cap = cv2.VideoCapture(clip)
+        n = 0
+        while n < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+            n += 1
+        cap.release()
+        print(f"Loaded {n} frames from {clip}")
+    return frames
+
+def run_backend(backend, frames, weights, batch, conf):
+    model = get_model(weights, backend, warmup_batch=batch)
+    smalls = [resize_for_inference(f) for f in frames]
+    latencies = []
+    outputs = []
+    t_start = time.perf_counter()
+    for i in range(0, len(smalls), batch):
+        chunk = smalls[i:i + batch]
+        t0 = time.perf_counter()
+        results = model(chunk, conf=conf, verbose=False)
+        latencies.append(time.perf_counter() - t0)
+        for frame, small, res in zip(frames[i:i + batch], chunk, results):
+            outputs.append(detections.from_yolo(res, frame.shape, small.shape))
+    total = time.perf_counter() - t_start
+    return outputs, np.array(latencies), total
+
+def agreement(baseline, candidate, iou_thresh=0.5):
+    """Mean precision/recall/F1 of candidate boxes against the baseline."""
+    tp = fp = fn = 0
+    for ref, cand in zip(baseline, candidate):
+        if len(ref) == 0 or len(cand) == 0:
+            fp += len(cand)
+            fn += len(ref)
+            continue
+        rb = np.stack([ref["x1"], ref["y1"], ref["x2"], ref["y2"]], 1).astype(np.float32)
+        cb = np.stack([cand["x1"], cand["y1"], cand["x2"], cand["y2"]], 1).astype(np.float32)
+        iou = iou_matrix(rb, cb)
+        iou[ref["cls"][:, None] != cand["cls"][None, :]] = 0.0
+        matched = 0
+        while iou.size and iou.max() >= iou_thresh:
+            r, c = np.unravel_index(np.argmax(iou), iou.shape)
+            iou[r, :] = 0.0
+            iou[:, c] = 0.0
+            matched += 1
+        tp += matched
+        fp += len(cand) - matched
+        fn += len(ref) - matched
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detector backends against PyTorch")
+    parser.add_argument("--clips", nargs="+", required=True, help="Recorded video clips")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--frames", type=int, default=100, help="Frames per clip")
+    parser.add_argument("--batch", type=int, default=4, help="Frames per forward pass")
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.clips, args.frames)
+    if not frames:
+        print("No frames decoded")
+        return
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    baseline = None
+    rows = []
+    for backend in backends:
+        try:
+            outputs, latencies, total = run_backend(backend, frames, args.weights,
+                                                    args.batch, args.conf)
+        except Exception as e:
+            print(f"[{backend}] skipped: {e}")
+            continue
+        if baseline is None:
+            baseline = outputs
+        precision, recall, f1 = agreement(baseline, outputs)
+        timings = registry.stats().get((args.weights, backend), {})
+        rows.append({
+            "backend": backend,
+            "load_s": timings.get("load", 0.0),
+            "latency_ms_mean": float(latencies.mean() * 1000),
+            "latency_ms_p95": float(np.percentile(latencies, 95) * 1000),
+            "fps": len(frames) / total,
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+        })
+
+    print(f"\n{len(frames)} frames, batch {args.batch}\n")
+    print(f"{'backend':15} {'load s':>7} {'lat ms':>8} {'p95 ms':>8} {'fps':>7} {'prec':>6} {'recall':>6} {'F1':>6}")
+    for r in rows:
+        print(f"{r['backend']:15} {r['load_s']:7.2f} {r['latency_ms_mean']:8.1f} "
+              f"{r['latency_ms_p95']:8.1f} {r['fps']:7.1f} {r['precision']:6.3f} "
+              f"{r['recall']:6.3f} {r['f1']:6.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+if __name__ == "__main__":
+    main()
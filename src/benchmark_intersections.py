@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Step cost of the vectorized IntersectionEngine vs one Python controller per
+intersection.
+
+The reference is the original TrafficController logic (per-lane Python
+loops over a lights dict), driven with an explicit clock. Both run the same
+simulated timeline with random ambulances first and must agree on every
+light, mode and priority lane; then each is timed per step.
+
+Usage:
+    python benchmark_intersections.py
+    python benchmark_intersections.py --sizes 10 1000 100000 --steps 200
+"""
+
+import argparse
+import time
+import numpy as np
+from intersections import CYCLE_TIME, GREEN_TIME, MODES, NO_LANE, POST_PRIORITY_BUFFER, \
+    YELLOW_TIME, IntersectionEngine
+from records import LIGHT_CODE
+
+LANES = ["N", "E", "S", "W"]
+
+class LoopController:
+    """The single-intersection controller as it was: dicts and per-lane loops."""
+
+    def __init__(self, now):
+        self.current_lane_idx = 0
+        self.mode = "NORMAL"
+        self.lights = {l: "RED" for l in LANES}
+        self.lights["N"] = "GREEN"
+        self.last_switch = now
+        self.priority_lane = None
+        self.last_emergency = 0.0
+
+    def set_priority(self, lane, now):
+        self.mode = "PRIORITY"
+        self.priority_lane = lane
+        for l in LANES:
+            self.lights[l] = "RED"
+        self.lights[lane] = "GREEN"
+        self.last_switch = now
+
+    def normal_cycle_step(self, now):
+        if now - self.last_switch > CYCLE_TIME:
+            self.current_lane_idx = (self.current_lane_idx + 1) % len(LANES)
+            self.last_switch = now
+        for i, lane in enumerate(LANES):
+            elapsed = now - self.last_switch
+            if i == self.current_lane_idx:
+                if elapsed <= GREEN_TIME:
+                    self.lights[lane] = "GREEN"
+                elif elapsed <= GREEN_TIME + YELLOW_TIME:
+                    self.lights[lane] = "YELLOW"
+                else:
+                    self.lights[lane] = "RED"
+            else:
+                self.lights[lane] = "RED"
+
+    def update(self, now, ambulance_lane, receding):
+        if ambulance_lane:
+            self.set_priority(ambulance_lane, now)
+            self.last_emergency = now
+        else:
+            if self.mode == "PRIORITY":
+                if receding or now - self.last_emergency > POST_PRIORITY_BUFFER:
+                    self.mode = "NORMAL"
+                    self.priority_lane = None
+            if self.mode == "NORMAL":
+                self.normal_cycle_step(now)
+
+def _inputs(rng, n, steps, rate):
+    """Per step: ambulance lane per intersection (-1: none) and receding flags."""
+    ambulance = np.where(rng.random((steps, n)) < rate, rng.integers(0, 4, (steps, n)), NO_LANE)
+    return ambulance.astype(np.int8), rng.random((steps, n)) < 0.3
+
+def check(n=200, steps=2000, dt=0.05, seed=0):
+    """Run engine and loop controllers side by side; return the number of mismatches."""
+    rng = np.random.default_rng(seed)
+    ambulance, receding = _inputs(rng, n, steps, rate=0.01)
+    engine = IntersectionEngine(n, now=0.0)
+    loops = [LoopController(0.0) for _ in range(n)]
+    codes = {state: code for state, code in LIGHT_CODE.items()}
+    mismatches = 0
+    for k in range(steps):
+        now = (k + 1) * dt
+        engine.ambulance[:] = ambulance[k]
+        engine.receding[:] = receding[k]
+        engine.step(now)
+        for i, ctrl in enumerate(loops):
+            lane = ambulance[k, i]
+            ctrl.update(now, LANES[lane] if lane != NO_LANE else None, receding[k, i])
+            expected = [codes[ctrl.lights[l]] for l in LANES]
+            priority = engine.priority[i]
+            if (engine.lights[i].tolist() != expected or MODES[engine.mode[i]] != ctrl.mode
+                    or (LANES[priority] if priority != NO_LANE else None) != ctrl.priority_lane):
+                mismatches += 1
+    return mismatches
+
+def time_engine(n, steps, rng):
+    engine = IntersectionEngine(n, now=0.0, offsets=rng.uniform(0, 4 * CYCLE_TIME, n))
+    ambulance, receding = _inputs(rng, n, min(steps, 50), rate=0.001)
+    t0 = time.perf_counter()
+    for k in range(steps):
+        engine.ambulance[:] = ambulance[k % len(ambulance)]
+        engine.receding[:] = receding[k % len(receding)]
+        engine.step(k * 0.05)
+    return (time.perf_counter() - t0) / steps
+
+def time_loop(n, steps, rng):
+    loops = [LoopController(-rng.uniform(0, 4 * CYCLE_TIME)) for _ in range(n)]
+    ambulance, receding = _inputs(rng, n, min(steps, 50), rate=0.001)
+    lanes = [[LANES[l] if l != NO_LANE else None for l in row] for row in ambulance.tolist()]
+    receding = receding.tolist()
+    t0 = time.perf_counter()
+    for k in range(steps):
+        now = k * 0.05
+        row, rec = lanes[k % len(lanes)], receding[k % len(receding)]
+        for i, ctrl in enumerate(loops):
+            ctrl.update(now, row[i], rec[i])
+    return (time.perf_counter() - t0) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description="IntersectionEngine step benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000],
+                        help="Numbers of intersections")
+    parser.add_argument("--steps", type=int, default=200, help="Timed steps per size")
+    parser.add_argument("--loop-limit", type=int, default=100000,
+                        help="Largest size to time the per-intersection Python loop at")
+    args = parser.parse_args()
+
+    mismatches = check()
+    print(f"Agreement with the per-intersection controller: {mismatches} mismatches "
+          f"(200 intersections x 2000 steps)\n")
+
+    rng = np.random.default_rng(1)
+    print(f"{'intersections':>13} {'engine/step':>12} {'per int.':>10} "
+          f"{'loop/step':>12} {'per int.':>10} {'speedup':>8}")
+    for n in args.sizes:
+        engine = time_engine(n, args.steps, rng)
+        line = f"{n:13d} {engine * 1e3:10.3f}ms {engine / n * 1e9:8.1f}ns"
+        if n <= args.loop_limit:
+            loop = time_loop(n, max(1, min(args.steps, 2_000_000 // (n * 10))), rng)
+            line += f" {loop * 1e3:10.3f}ms {loop / n * 1e9:8.1f}ns {loop / engine:7.1f}x"
+        print(line)
+
+if __name__ == "__main__":
+    main()
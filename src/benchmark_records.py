@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Memory and allocation benchmark: dict records vs the compact record layer.
+
+Two workloads, each run both ways under tracemalloc:
+
+- detections: a frame's detections as a list of dicts vs DETECTION_DTYPE
+- lights: published light states as dicts vs records.Lights
+
+Reported per workload: time per operation, retained memory (what the
+records keep alive), peak traced memory during the run (transient churn)
+and the number of live allocated blocks the records add.
+
+Usage:
+    python benchmark_records.py
+    python benchmark_records.py --detections 60 --frames 3000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+import numpy as np
+from detections import empty_detections, to_dicts
+from records import Lights
+
+def measure(name, build, run, repeat):
+    """(seconds per run() call, retained bytes, peak bytes, live blocks added).
+
+    Timed without tracemalloc (it slows every allocation down), then run
+    again traced for the memory figures.
+    """
+    state = build()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        run(state)
+    per_op = (time.perf_counter() - t0) / repeat
+    del state
+
+    blocks0 = sys.getallocatedblocks()
+    tracemalloc.start()
+    state = build()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    for _ in range(repeat):
+        run(state)
+    peak = tracemalloc.get_traced_memory()[1] - retained
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks0
+    del state
+    return name, per_op, retained, peak, blocks
+
+def report(rows):
+    print(f"{'':28} {'time/op':>10} {'retained':>10} {'peak churn':>11} {'blocks':>8}")
+    for name, per_op, retained, peak, blocks in rows:
+        print(f"{name:28} {per_op * 1e6:8.1f}us {retained / 1024:8.1f}KB {peak / 1024:9.1f}KB {blocks:8d}")
+    print()
+
+# --- detections ---
+
+def _random_detections(n, seed=0):
+    rng = np.random.default_rng(seed)
+    dets = empty_detections(n)
+    dets["x1"] = rng.integers(0, 1800, n)
+    dets["y1"] = rng.integers(0, 1000, n)
+    dets["x2"] = dets["x1"] + rng.integers(20, 200, n)
+    dets["y2"] = dets["y1"] + rng.integers(20, 200, n)
+    dets["conf"] = rng.uniform(0.3, 1.0, n)
+    dets["label"] = rng.choice([b"car", b"truck", b"bus", b"ambulance"], n)
+    dets["lane"] = rng.integers(0, 4, n)
+    dets["track_id"] = -1
+    return dets
+
+def main():
+    parser = argparse.ArgumentParser(description="Dict records vs compact records")
+    parser.add_argument("--frames", type=int, default=2000, help="Operations per workload")
+    parser.add_argument("--detections", type=int, default=30, help="Detections per frame")
+    parser.add_argument("--frames-kept", type=int, default=300,
+                        help="Frames of detections held at once (e.g. a replay buffer)")
+    args = parser.parse_args()
+
+    source = _random_detections(args.detections)
+    print(f"Detections: {args.frames_kept} frames x {args.detections}, "
+          f"time/op = building one frame's records")
+    report([
+        measure("list of dicts", lambda: [to_dicts(source) for _ in range(args.frames_kept)],
+                lambda kept: kept.append(to_dicts(source)) or kept.pop(0), args.frames),
+        measure("DETECTION_DTYPE array", lambda: [source.copy() for _ in range(args.frames_kept)],
+                lambda kept: kept.append(source.copy()) or kept.pop(0), args.frames),
+    ])
+
+    cycle = [{"N": "GREEN", "E": "RED", "S": "RED", "W": "RED"},
+             {"N": "YELLOW", "E": "RED", "S": "RED", "W": "RED"},
+             {"N": "RED", "E": "GREEN", "S": "RED", "W": "RED"}]
+    print(f"Lights: {args.frames_kept} published states kept")
+    report([
+        measure("dict", lambda: [dict(cycle[i % 3]) for i in range(args.frames_kept)],
+                lambda kept: kept.append(dict(cycle[0])) or kept.pop(0), args.frames),
+        measure("Lights", lambda: [Lights.from_mapping(cycle[i % 3]) for i in range(args.frames_kept)],
+                lambda kept: kept.append(Lights.from_mapping(cycle[0])) or kept.pop(0), args.frames),
+    ])
+
+if __name__ == "__main__":
+    main()
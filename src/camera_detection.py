@@ -1,107 +1,276 @@
 # camera_detection.py
 import cv2
-from ultralytics import YOLO
+import numpy as np
 import threading
 import time
 from utils import shared_state
-
-# Load YOLO (will auto-download yolov8n.pt)
-model = YOLO("yolov8n.pt")
+from capture import start_capture_thread
+from motion_gate import MotionGate
+from model_registry import DEFAULT_BACKEND, INFER_WIDTH, get_model
+from inference_pool import ProcessInferencePool
+from tracker import IoUTracker
+import emergency_classifier
+import detections
+from detections import LANES
 
 # Adjust this set to match YOLO class names that correspond to emergency vehicles.
 EMERGENCY_CLASSES = set(["ambulance", "fire truck", "police car", "fireengine", "fire_engine", "ambulance"]) 
 
 def map_x_y_to_lane(x, y, w, h, frame_w, frame_h):
-    cx = x + w/2
-    cy = y + h/2
-    # divide into 3x3 grid roughly; map center zones to lanes
-    # top zone = North, bottom = South, left = West, right = East.
-    if cy < frame_h * 0.35:
-        return "N"
-    if cy > frame_h * 0.65:
-        return "S"
-    if cx < frame_w * 0.35:
-        return "W"
-    if cx > frame_w * 0.65:
-        return "E"
-    # else default to nearest axis
-    if abs(cx - frame_w/2) > abs(cy - frame_h/2):
-        return "E" if cx > frame_w/2 else "W"
-    else:
-        return "S" if cy > frame_h/2 else "N"
-
-def camera_loop(camera_index=0, conf_thresh=0.35):
-    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW if hasattr(cv2, 'CAP_DSHOW') else 0)
-    if not cap.isOpened():
-        print("ERROR: Could not open camera")
-        return
+    """Lane ("N"/"E"/"S"/"W") of a box centre; x, y, w, h may be arrays."""
+    codes = detections.lane_codes(x, y, w, h, frame_w, frame_h)
+    if codes.ndim == 0:
+        return LANES[int(codes)]
+    return np.array(LANES)[codes]
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            time.sleep(0.1)
-            continue
-
-        # store frame for UI
-        with shared_state.lock:
-            shared_state.camera_frame = frame.copy()
-
-        # Run YOLO on frame (resize to speed up)
-        small = cv2.resize(frame, (640, int(frame.shape[0] * 640 / frame.shape[1])))
-        results = model(small, conf=conf_thresh, verbose=False)
-
-        # default no detection
-        detected = False
-        lane = None
-        detections = []  # collect all boxes for visualization
-
-        # The results list contains one 'result' object
-        for res in results:
-            boxes = res.boxes
-            if boxes is None or len(boxes) == 0:
+def resize_for_inference(frame, width=INFER_WIDTH):
+    return cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])))
+
+def camera_loop(camera_index=0, conf_thresh=0.35, gate=None, backend=DEFAULT_BACKEND, stop=None,
+                emergency_stage=None, tick=None):
+    """Single overhead camera: boxes are mapped to lanes by position.
+
+    emergency_stage: None runs the second-stage classifier only when its
+    trained weights are installed (emergency_classifier.make_stage).
+
+    Runs until stop (a threading.Event) is set; raises IOError when the
+    camera cannot be opened or is lost, so a supervisor can restart it.
+    tick() is called per published frame (a supervisor's heartbeat).
+    """
+    source = start_capture_thread(camera_index, name=f"camera {camera_index}")
+    gate = gate or MotionGate()
+    tracker = IoUTracker()
+    stage = emergency_classifier.make_stage(emergency_stage)
+    # load + warm up before the first real frame (shared, loaded once per process)
+    model = get_model(backend=backend)
+
+    try:
+        while stop is None or not stop.is_set():
+            item = source.ring.latest()
+            if item is None:
+                if source.error is not None:
+                    raise source.error
+                time.sleep(0.005)
                 continue
-            for box in boxes:
-                cls_id = int(box.cls[0])
-                name = res.names.get(cls_id, "").lower()
-                # get bounding box coords (on small frame)
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0])
-                w = x2 - x1
-                h = y2 - y1
-                # map back to original frame scale
-                scale_x = frame.shape[1] / small.shape[1]
-                scale_y = frame.shape[0] / small.shape[0]
-                rx1 = x1 * scale_x
-                ry1 = y1 * scale_y
-                rx2 = x2 * scale_x
-                ry2 = y2 * scale_y
-                rw = w * scale_x
-                rh = h * scale_y
-                
-                # store all detections for UI overlay
-                detections.append({
-                    "x1": int(rx1),
-                    "y1": int(ry1),
-                    "x2": int(rx2),
-                    "y2": int(ry2),
-                    "label": name,
-                    "conf": conf,
-                    "is_emergency": any(k in name for k in ["ambulance", "fire", "police"])
-                })
-                
-                # check label for emergency keywords
-                if any(k in name for k in ["ambulance", "fire", "police"]):
-                    lane = map_x_y_to_lane(rx1, ry1, rw, rh, frame.shape[1], frame.shape[0])
-                    detected = True
-
-        with shared_state.lock:
-            shared_state.ambulance_detected = detected
-            shared_state.ambulance_lane = lane if detected else None
-            shared_state.detections = detections
-            if detected:
-                shared_state.last_emergency_time = time.time()
-
-    cap.release()
+            _, _, frame = item
+
+            # store frame for UI: the pooled buffer itself, no copy
+            shared_state.publish_overhead(frame)
+
+            if gate.should_infer(frame):
+                # Run YOLO on frame (resize to speed up)
+                small = resize_for_inference(frame)
+                results = model(small, conf=conf_thresh, verbose=False)
+
+                # The results list contains one 'result' object; boxes are mapped
+                # to lanes by position
+                dets = detections.from_yolo(results[0], frame.shape, small.shape)
+                now = time.time()
+                if stage is not None:
+                    # classifier hits are votes; the tracker confirms them over
+                    # frames (track ids from match() key the classifier cache)
+                    dets = stage.apply(frame, tracker.match(dets, now), now)
+                dets = tracker.update(dets, now)
+            else:
+                # quiet scene: carry the tracks forward instead of re-detecting
+                dets = tracker.predict(time.time())
+
+            now = time.time()
+            for i, lane in enumerate(LANES):
+                lane_dets = dets[dets["lane"] == i]
+                shared_state.publish_lane(lane, detections=lane_dets,
+                                          ambulance=lane_dets["is_emergency"].any(), now=now)
+            if tick is not None:
+                tick()
+    finally:
+        source.running = False
+
+class LaneInferenceEngine:
+    """Runs the newest frame of every lane through YOLO as one batch.
+
+    Frames come from one FrameRing per lane (filled by capture threads) and
+    results are split back into one snapshot per lane
+    (shared_state.publish_lane).
+    """
+
+    def __init__(self, rings, conf_thresh=0.35, target_fps=15.0,
+                 motion_gating=True, min_rate=1.0, workers=0, tracking=True,
+                 backend=DEFAULT_BACKEND, emergency_stage=None):
+        self.rings = dict(rings)  # lane -> FrameRing
+        self.lanes = list(self.rings)
+        self.conf_thresh = conf_thresh
+        # per-lane motion gates; target_fps is the ceiling rate
+        self.gates = {lane: MotionGate(min_rate=min_rate, max_rate=target_fps)
+                      for lane in self.lanes} if motion_gating else {}
+        # per-lane trackers keep boxes alive (and predicted) between inferences
+        self.trackers = {lane: IoUTracker() for lane in self.lanes} if tracking else {}
+        self.captured_at = {}  # lane -> capture time of its newest frame
+        # second stage: classify car/truck/bus crops as emergency vs civilian
+        # (None: only when its trained weights are installed)
+        self.emergency_stage = emergency_classifier.make_stage(emergency_stage)
+        self.period = 1.0 / target_fps if target_fps else 0.0
+        self.running = True
+        # stats
+        self.batches = 0
+        self.frames_inferred = 0
+        self.last_batch_time = 0.0
+        self.last_frame_age = 0.0  # capture -> published detections, seconds
+        self.model = None
+        self.backend = backend
+        # workers > 0: detect in a process pool instead of this interpreter
+        self.pool = ProcessInferencePool(workers=workers, backend=backend, conf_thresh=conf_thresh,
+                                         infer_width=INFER_WIDTH) if workers else None
+
+    def gather(self):
+        """Return ([(lane, capture_time, frame)] to infer, {lane: frame} to show)."""
+        items = []
+        for lane in self.lanes:
+            item = self.rings[lane].latest()
+            if item is not None:
+                items.append((lane,) + item[1:])
+        return self.select(items)
+
+    def select(self, items):
+        """Split new frames [(lane, capture_time, frame)] like gather()."""
+        batch = []
+        fresh = {}
+        for lane, captured_at, frame in items:
+            fresh[lane] = frame
+            self.captured_at[lane] = captured_at
+            gate = self.gates.get(lane)
+            if gate is None or gate.should_infer(frame, captured_at):
+                batch.append((lane, captured_at, frame))
+        return batch, fresh
+
+    def infer(self, batch):
+        """Run one batched forward pass and return {lane: (detections, emergency)}."""
+        if self.pool is not None:
+            return self._infer_pool(batch)
+        smalls = [resize_for_inference(frame) for _, _, frame in batch]
+        if self.model is None:
+            self.model = get_model(backend=self.backend, warmup_batch=len(self.lanes))
+        t0 = time.time()
+        results = self.model(smalls, conf=self.conf_thresh, verbose=False)
+        self.last_batch_time = time.time() - t0
+        self.batches += 1
+        self.frames_inferred += len(batch)
+
+        out = {}
+        for (lane, _, frame), small, res in zip(batch, smalls, results):
+            dets = detections.from_yolo(res, frame.shape, small.shape, lane=lane)
+            out[lane] = (dets, bool(dets["is_emergency"].any()))
+        return out
+
+    def _infer_pool(self, batch):
+        t0 = time.time()
+        lane_dets = self.pool.infer([(lane, frame) for lane, _, frame in batch])
+        self.last_batch_time = time.time() - t0
+        self.batches += 1
+        self.frames_inferred += len(batch)
+        return {lane: (dets, bool(dets["is_emergency"].any()))
+                for lane, dets in lane_dets.items()}
+
+    def publish(self, batch, lane_results, fresh):
+        now = time.time()
+        for lane in set(fresh) | set(lane_results):
+            fields = {}
+            if lane in fresh:
+                # pooled and never rewritten while referenced: no copy for the UI
+                fields["frame"] = fresh[lane]
+            if lane in lane_results:
+                fields["detections"], fields["ambulance"] = lane_results[lane]
+            # one snapshot per lane: frame and detections always match
+            shared_state.publish_lane(lane, now=now, **fields)
+        if batch:
+            self.last_frame_age = now - min(captured_at for _, captured_at, _ in batch)
+
+    def track(self, batch, lane_results, fresh):
+        """Fold detector output into the lane trackers; predict skipped lanes."""
+        if not self.trackers:
+            return lane_results
+        tracked = {}
+        for lane in fresh:
+            tracker = self.trackers[lane]
+            if lane in lane_results:
+                dets = tracker.update(lane_results[lane][0], self.captured_at[lane])
+            else:
+                dets = tracker.predict(self.captured_at[lane])
+            # emergency status is decided per track, not per frame
+            tracked[lane] = (dets, tracker.has_emergency())
+        return tracked
+
+    def classify(self, lane_results, fresh):
+        """Run the emergency classifier on vehicle boxes of the inferred frames.
+
+        Its hits are votes for the trackers. Without trackers only a trained
+        classifier may raise the lane's emergency flag; heuristic hits just
+        mark the boxes.
+        """
+        if self.emergency_stage is None:
+            return lane_results
+        trained = self.emergency_stage.trained
+        out = {}
+        for lane, (dets, emergency) in lane_results.items():
+            now = self.captured_at[lane]
+            if lane in self.trackers:
+                dets = self.trackers[lane].match(dets, now)  # cache by track id
+            dets = self.emergency_stage.apply(fresh[lane], dets, now)
+            out[lane] = (dets, emergency or (trained and bool(dets["is_emergency"].any())))
+        return out
+
+    def detect(self, batch, fresh):
+        """Detector, emergency stage and trackers: {lane: (detections, emergency)}."""
+        lane_results = self.infer(batch) if batch else {}
+        return self.track(batch, self.classify(lane_results, fresh), fresh)
+
+    def step(self):
+        batch, fresh = self.gather()
+        if not fresh:
+            return False
+        self.publish(batch, self.detect(batch, fresh), fresh)
+        return True
+
+    def gate_stats(self):
+        """Per-lane inferred/skipped counters from the motion gates."""
+        return {lane: gate.stats() for lane, gate in self.gates.items()}
+
+    def dropped_frames(self):
+        """Frames each lane captured but never reached inference."""
+        return {lane: ring.dropped for lane, ring in self.rings.items()}
+
+    def pool_stats(self):
+        """Per-lane frame pool counters (allocations, copies, buffers in use)."""
+        return {lane: ring.pool.stats() for lane, ring in self.rings.items()}
+
+    def run(self):
+        # warm up with a full batch before the first frame arrives
+        if self.pool is None:
+            self.model = get_model(backend=self.backend, warmup_batch=len(self.lanes))
+        while self.running:
+            start = time.time()
+            if not self.step():
+                time.sleep(0.005)
+                continue
+            # hold a steady rate; never sleep when inference already took longer
+            remaining = self.period - (time.time() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+
+def start_multi_lane_threads(sources, conf_thresh=0.35, target_fps=15.0,
+                             motion_gating=True, min_rate=1.0, workers=0, tracking=True,
+                             backend=DEFAULT_BACKEND, emergency_stage=None):
+    """sources: dict lane -> camera index or video path. Returns the engine."""
+    captures = {lane: start_capture_thread(source, name=f"lane {lane}")
+                for lane, source in sources.items()}
+    engine = LaneInferenceEngine({lane: c.ring for lane, c in captures.items()},
+                                 conf_thresh=conf_thresh, target_fps=target_fps,
+                                 motion_gating=motion_gating, min_rate=min_rate,
+                                 workers=workers, tracking=tracking, backend=backend,
+                                 emergency_stage=emergency_stage)
+    engine.captures = captures
+    t = threading.Thread(target=engine.run, daemon=True)
+    t.start()
+    return engine
 
 def start_camera_thread(camera_index=0):
     t = threading.Thread(target=camera_loop, args=(camera_index,), daemon=True)
@@ -110,8 +279,6 @@ def start_camera_thread(camera_index=0):
 
 if __name__ == "__main__":
     start_camera_thread()
-    import time
     while True:
-        with shared_state.lock:
-            print("Detected:", shared_state.ambulance_detected, shared_state.ambulance_lane)
+        print("Detected:", shared_state.ambulance_detected)
         time.sleep(1)
@@ -0,0 +1,148 @@
+# capture.py
+"""
+Decoupled camera capture with latest-frame-wins buffers.
+
+Each source gets its own capture thread that reads straight into pooled,
+preallocated frame buffers (frame_pool.py). The inference stage always takes
+the newest frame; frames it never got to are counted as dropped instead of
+queueing up in the driver, so latency stays bounded however slow inference is.
+"""
+
+import threading
+import time
+import cv2
+import numpy as np
+from frame_pool import FramePool, readonly
+
+class FrameRing:
+    """Latest-frame-wins handoff of pooled frames.
+
+    The capture thread fills a buffer from the ring's FramePool and commits
+    it as the newest frame; the reader takes that buffer itself, as a
+    read-only view, and can hand it on (inference, shared_state, UIs)
+    without copying. A frame the reader never took is reused for the next
+    capture. Buffers go back to the pool once nobody references them.
+    """
+
+    def __init__(self, pool=None):
+        self._lock = threading.Lock()
+        self.pool = pool or FramePool()
+        self._write = None  # buffer being filled by the capture thread
+        self._ready = None  # newest complete frame, not yet taken
+        self._ready_time = 0.0
+        self.seq = 0  # frames committed
+        self.dropped = 0  # frames overwritten before the reader took them
+
+    def write_slot(self, shape=None, dtype=np.uint8):
+        """Return the array the next frame should be written into."""
+        if shape is not None and (self._write is None or self._write.shape != tuple(shape)):
+            self._write = self.pool.acquire(shape, dtype)
+        elif self._write is None and self.pool.shape is not None:
+            self._write = self.pool.acquire(self.pool.shape, self.pool.dtype)
+        return self._write
+
+    def commit(self, timestamp=None):
+        """Publish the frame in the write slot as the newest frame."""
+        with self._lock:
+            if self._ready is not None:
+                self.dropped += 1
+            # an untaken frame is only referenced here: reuse it for writing
+            self._write, self._ready = self._ready, self._write
+            self._ready_time = timestamp if timestamp is not None else time.time()
+            self.seq += 1
+
+    def latest(self):
+        """Return (seq, capture_time, frame) for a new frame, or None.
+
+        The frame is a read-only view that stays valid as long as it is
+        referenced; the capture thread never writes to it again.
+        """
+        with self._lock:
+            if self._ready is None:
+                return None
+            frame, self._ready = self._ready, None
+            return self.seq, self._ready_time, readonly(frame)
+
+MAX_READ_FAILURES = 50  # consecutive failed reads (~5 s) before a source counts as lost
+
+class CaptureSource:
+    """Capture thread body for one camera index or video path.
+
+    A source that cannot be opened, or stops delivering frames for
+    MAX_READ_FAILURES reads in a row, raises IOError; with
+    start_capture_thread the error is kept in `error` for the consumer.
+    """
+
+    def __init__(self, source, ring=None, name=None):
+        self.source = source
+        self.ring = ring or FrameRing()
+        self.name = name or str(source)
+        self.running = True
+        self.error = None
+        self.frames_captured = 0
+        self.read_failures = 0
+        self._failed_reads = 0  # consecutive
+
+    def open(self):
+        if isinstance(self.source, int):
+            cap = cv2.VideoCapture(self.source, cv2.CAP_DSHOW if hasattr(cv2, 'CAP_DSHOW') else 0)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise IOError(f"Could not open capture source {self.name}")
+        # keep the driver queue as short as possible; the ring does the buffering
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def read(self, cap):
+        """Read one frame into the ring; returns False if the read failed."""
+        slot = self.ring.write_slot()
+        ret, frame = cap.read(slot) if slot is not None else cap.read()
+        if not ret:
+            self.read_failures += 1
+            self._failed_reads += 1
+            if self._failed_reads >= MAX_READ_FAILURES:
+                self._failed_reads = 0
+                raise IOError(f"Capture source {self.name} stopped delivering frames")
+            return False
+        self._failed_reads = 0
+        if slot is None or frame.shape != slot.shape:
+            # first frame or the source changed resolution: (re)allocate
+            slot = self.ring.write_slot(frame.shape, frame.dtype)
+            np.copyto(slot, frame)
+        elif frame is not slot and frame.ctypes.data != slot.ctypes.data:
+            np.copyto(slot, frame)
+        self.ring.commit()
+        self.frames_captured += 1
+        return True
+
+    def run(self):
+        try:
+            cap = self.open()
+        except IOError as e:
+            print(f"ERROR: {e}")
+            self.error = e
+            return
+        try:
+            while self.running:
+                if not self.read(cap):
+                    time.sleep(0.1)
+        except IOError as e:
+            print(f"ERROR: {e}")
+            self.error = e
+        finally:
+            cap.release()
+
+    def stats(self):
+        return {
+            "captured": self.frames_captured,
+            "dropped": self.ring.dropped,
+            "read_failures": self.read_failures,
+            "pool": self.ring.pool.stats(),
+        }
+
+def start_capture_thread(source, name=None):
+    cap_src = CaptureSource(source, name=name)
+    t = threading.Thread(target=cap_src.run, daemon=True)
+    t.start()
+    return cap_src
@@ -11,19 +11,22 @@ Features:
 Usage:
     python demo.py                          # Use default demo files
     python demo.py --video path/to/video.mp4 --audio path/to/siren.wav
+    python demo.py --offline --video N=north.mp4 --video E=east.mp4   # Batch-analyse recordings
     python demo.py --generate               # Generate synthetic test data
 
 Note: Run main.py in another terminal to see the UI respond to the demo data.
 """
 
 import argparse
-import threading
 import time
 import numpy as np
 import cv2
 import random
-from traffic_controller import controller
+from runtime import Runtime, add_controller_stage
 from utils import shared_state
+from frame_pool import FramePool
+from detections import empty_detections, make_detection
+from offline_analysis import analyze, parse_lane_paths
 from scipy import signal
 try:
     import sounddevice as sd
@@ -44,6 +47,8 @@ class DemoCamera:
         self.ambulance_cycle_time = 0
         self.ambulance_start_time = time.time()  # Track when ambulance started on current lane
         self.current_lane_idx = 0  # Track which lane is active
+        # frames are drawn into pooled buffers and published without a copy
+        self.pool = FramePool(slots=16)
 
         # Vehicle simulation state per lane
         self.vehicles = {"N": [], "E": [], "S": [], "W": []}
@@ -56,7 +61,8 @@ class DemoCamera:
     
     def generate_test_frame(self, lane, ambulance_traverse_time=4.0):
         """Generate a synthetic test frame for a specific lane."""
-        frame = np.ones((300, 400, 3), dtype=np.uint8) * 100
+        frame = self.pool.acquire((300, 400, 3))
+        frame[:] = 100
         
         # Draw background: sky and road
         frame[:150] = (135, 206, 235)  # Sky blue
@@ -202,24 +208,20 @@ class DemoCamera:
             else:
                 self.ambulance_lanes = []
 
-            # Update traffic controller to get latest lights
-            try:
-                controller.update()
-            except Exception:
-                pass
-
-            lights = controller.lights.copy()
+            # Latest lights as published by the controller thread, which
+            # reacts to the detections below on its own
+            lights = shared_state.control.lights
 
             # Read runtime vehicle params from shared_state if available
             try:
-                with shared_state.lock:
-                    params = getattr(shared_state, 'vehicle_params', None)
-                    if params is not None:
-                        # Validate tuple-like spawn_interval
-                        sv = params.get('spawn_interval', None)
-                        if sv and isinstance(sv, (list, tuple)) and len(sv) == 2:
-                            self.vehicle_spawn_interval = (float(sv[0]), float(sv[1]))
-                        self.speed_multiplier = float(params.get('speed_multiplier', 1.0))
+                # replaced as a whole by the dashboard, so one read is consistent
+                params = getattr(shared_state, 'vehicle_params', None)
+                if params is not None:
+                    # Validate tuple-like spawn_interval
+                    sv = params.get('spawn_interval', None)
+                    if sv and isinstance(sv, (list, tuple)) and len(sv) == 2:
+                        self.vehicle_spawn_interval = (float(sv[0]), float(sv[1]))
+                    self.speed_multiplier = float(params.get('speed_multiplier', 1.0))
             except Exception:
                 pass
 
@@ -290,30 +292,23 @@ class DemoCamera:
             for lane in ["N", "E", "S", "W"]:
                 frame = self.generate_test_frame(lane, ambulance_traverse_time)
 
-                with shared_state.lock:
-                    shared_state.camera_frames[lane] = frame.copy()
-                    shared_state.ambulance_detected[lane] = (lane in self.ambulance_lanes)
+                # Update detections for this lane
+                if lane in self.ambulance_lanes:
+                    # Calculate ambulance position (left to right over full duration)
+                    current_time_sec = time.time()
+                    time_since_ambulance_start = current_time_sec - self.ambulance_start_time
+                    progress = min(time_since_ambulance_start / ambulance_traverse_time, 1.0)  # 0 to 1
+                    ambulance_x = int(progress * 350)  # Move across full width
 
-                    # Update detections for this lane
-                    if lane in self.ambulance_lanes:
-                        # Calculate ambulance position (left to right over full duration)
-                        current_time_sec = time.time()
-                        time_since_ambulance_start = current_time_sec - self.ambulance_start_time
-                        progress = min(time_since_ambulance_start / ambulance_traverse_time, 1.0)  # 0 to 1
-                        ambulance_x = int(progress * 350)  # Move across full width
+                    dets = make_detection(
+                        int(ambulance_x - 5), 120, int(ambulance_x + 55), 165,
+                        "ambulance", 0.95, is_emergency=True, lane=lane)
+                else:
+                    dets = empty_detections()
 
-                        shared_state.detections[lane] = [{
-                            "x1": int(ambulance_x - 5),
-                            "y1": 120,
-                            "x2": int(ambulance_x + 55),
-                            "y2": 165,
-                            "label": "ambulance",
-                            "conf": 0.95,
-                            "is_emergency": True
-                        }]
-                        shared_state.last_emergency_time = time.time()
-                    else:
-                        shared_state.detections[lane] = []
+                # frame is freshly generated, so it is handed over without a copy
+                shared_state.publish_lane(lane, frame=frame, detections=dets,
+                                          ambulance=lane in self.ambulance_lanes)
             
             time.sleep(0.033)  # ~30 FPS
     
@@ -321,12 +316,16 @@ class DemoCamera:
         """Run appropriate demo mode."""
         self.run_synthetic()
 
+    def stop(self):
+        self.running = False
+
 class DemoAudio:
     """Simulates siren detection from audio."""
     
     def __init__(self, audio_path=None):
         self.audio_path = audio_path
         self.running = True
+        self.stream = None  # SirenStream when playing a file
     
     def generate_test_siren(self):
         """Generate synthetic siren audio chunk."""
@@ -365,54 +364,23 @@ class DemoAudio:
             current_time = time.time() % cycle_time
             is_siren = current_time < cycle_on
             
-            with shared_state.lock:
-                shared_state.siren_detected = is_siren
-                if is_siren:
-                    shared_state.last_emergency_time = time.time()
+            shared_state.publish_audio(siren_detected=is_siren)
             
             time.sleep(0.1)
     
     def run_audio_file(self):
-        """Play audio file and simulate detection."""
+        """Play audio file through the live siren detection engine."""
         print(f"[DEMO] Opening audio file: {self.audio_path}")
         
         try:
-            # Try to load audio file
-            import scipy.io.wavfile as wavfile
-            sample_rate, audio = wavfile.read(self.audio_path)
-            
-            if audio.ndim > 1:
-                audio = audio[:, 0]  # Take first channel
-            
-            # Normalize
-            audio = audio.astype(np.float32) / np.max(np.abs(audio))
-            
-            chunk_size = int(0.8 * sample_rate)
-            pos = 0
-            
-            while self.running:
-                # Get chunk
-                if pos + chunk_size > len(audio):
-                    pos = 0  # Loop
-                
-                chunk = audio[pos:pos + chunk_size]
-                
-                # Simple siren detection (check frequency content)
-                fft = np.fft.rfft(chunk)
-                freqs = np.fft.rfftfreq(len(chunk), 1.0 / sample_rate)
-                band_mask = (freqs > 500) & (freqs < 2000)
-                band_energy = np.sum(np.abs(fft[band_mask]))
-                total_energy = np.sum(np.abs(fft)) + 1e-8
-                
-                is_siren = (band_energy / total_energy) > 0.1
-                
-                with shared_state.lock:
-                    shared_state.siren_detected = is_siren
-                    if is_siren:
-                        shared_state.last_emergency_time = time.time()
-                
-                pos += chunk_size
-                time.sleep(0.15)
+            from audio_source import WavStream
+            from sound_detection import SirenStream
+
+            # memory-mapped, paced like the microphone, looping
+            source = WavStream(self.audio_path, realtime=True, loop=True)
+            self.stream = SirenStream(sample_rate=source.sample_rate)
+            print(f"[DEMO] Streaming {source.duration:.1f}s of audio at {source.sample_rate} Hz")
+            self.stream.run_source(source)
         
         except Exception as e:
             print(f"[ERROR] Could not load audio: {e}")
@@ -426,19 +394,39 @@ class DemoAudio:
         else:
             self.run_synthetic()
 
+    def stop(self):
+        self.running = False
+        if self.stream is not None:
+            self.stream.running = False
+
 def main():
     """Main demo entry point."""
     parser = argparse.ArgumentParser(
         description="Demo mode for Emergency Traffic AI system"
     )
-    parser.add_argument("--video", type=str, default=None,
-                       help="Path to video file (default: synthetic)")
+    parser.add_argument("--video", action="append", default=None,
+                       help="LANE=path per recorded lane, or one path for lane N (default: synthetic)")
     parser.add_argument("--audio", type=str, default=None,
                        help="Path to audio file (default: synthetic)")
     parser.add_argument("--generate", action="store_true",
                        help="Generate and save demo video/audio files")
+    parser.add_argument("--offline", action="store_true",
+                       help="Analyse the --video recordings as fast as possible and exit")
+    parser.add_argument("--out", type=str, default="offline_results",
+                       help="Output directory for --offline")
+    parser.add_argument("--share", nargs="?", const="emergency_traffic_state", default=None,
+                       metavar="NAME",
+                       help="Publish to a shared-memory segment other processes can attach to "
+                            "(e.g. flask_dashboard.py --attach)")
     
     args = parser.parse_args()
+    video_paths = parse_lane_paths(v if "=" in v else f"N={v}" for v in args.video or [])
+
+    if args.offline:
+        if not video_paths:
+            parser.error("--offline needs at least one --video")
+        analyze(video_paths, args.out)
+        return
     
     print("=" * 70)
     print("Emergency Traffic AI - DEMO MODE")
@@ -451,34 +439,40 @@ def main():
         print("(Feature for future implementation)")
         return
     
-    # Start demo camera thread
-    camera = DemoCamera(args.video)
-    camera_thread = threading.Thread(target=camera.run, daemon=True)
-    camera_thread.start()
-    print("[DEMO] Camera simulator started")
-    
-    # Start demo audio thread
+    # Simulators and the traffic controller (so the simulated vehicles obey
+    # the lights) run as supervised stages
+    runtime = Runtime()
+    add_controller_stage(runtime)
+    camera = DemoCamera(video_paths)
     audio = DemoAudio(args.audio)
-    audio_thread = threading.Thread(target=audio.run, daemon=True)
-    audio_thread.start()
-    print("[DEMO] Audio simulator started")
+    for name, sim in (("camera", camera), ("audio", audio)):
+        runtime.stage(name, lambda stage, sim=sim: stage.call(sim.run))
+        runtime.on_stop(sim.stop)
+
+    if args.share:
+        from shm_state import share
+        share(export=("lanes", "audio", "control"), follow=("params",), name=args.share)
+        print(f"[DEMO] Sharing state as '{args.share}'")
+
+    runtime.start_thread()
+    print("[DEMO] Camera and audio simulators started")
     
     print("\n[DEMO] Running... Press Ctrl+C to stop.\n")
     
     try:
         while True:
             # Print current status
-            with shared_state.lock:
-                amb = shared_state.ambulance_detected
-                lane = shared_state.ambulance_lane
-                siren = shared_state.siren_detected
+            snap = shared_state.snapshot()
+            lanes = [l for l, s in snap.lanes.items() if s.ambulance]
+            siren = snap.audio.siren_detected
             
-            print(f"\r[DEMO] Ambulance: {amb} (Lane: {lane}) | Siren: {siren}", end="", flush=True)
+            print(f"\r[DEMO] Ambulance: {bool(lanes)} (Lane: {lanes[0] if lanes else None}) | Siren: {siren}", end="", flush=True)
             time.sleep(0.5)
     except KeyboardInterrupt:
         print("\n[DEMO] Stopping...")
-        camera.running = False
-        audio.running = False
+        runtime.stop()
+        runtime.join()
+        print(runtime.report())
         print("[DEMO] Demo stopped.")
 
 if __name__ == "__main__":
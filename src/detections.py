@@ -0,0 +1,144 @@
+# detections.py
+"""
+Compact detection format shared by the detector, controller and overlays.
+
+A frame's detections are one NumPy structured array (DETECTION_DTYPE) instead
+of a list of dicts, so post-processing is a handful of vector operations and
+readers copy a single small buffer.
+"""
+
+import numpy as np
+
+LANES = ["N", "E", "S", "W"]
+LANE_INDEX = {lane: i for i, lane in enumerate(LANES)}
+NO_LANE = -1
+
+EMERGENCY_KEYWORDS = ("ambulance", "fire", "police")
+
+DETECTION_DTYPE = np.dtype([
+    ("x1", np.int32),
+    ("y1", np.int32),
+    ("x2", np.int32),
+    ("y2", np.int32),
+    ("conf", np.float32),
+    ("cls", np.int16),           # detector class id (-1 when injected)
+    ("is_emergency", np.bool_),
+    ("lane", np.int8),           # index into LANES, NO_LANE if unknown
+    ("label", "S16"),
+    ("track_id", np.int32),      # tracker id, -1 until a tracker assigns one
+])
+
+def empty_detections(n=0):
+    return np.zeros(n, dtype=DETECTION_DTYPE)
+
+def is_emergency_label(name):
+    name = name.lower()
+    return any(k in name for k in EMERGENCY_KEYWORDS)
+
+# per-names-table lookups: (labels, emergency flags) indexed by class id
+_class_tables = {}
+
+def _tables_for(names):
+    key = id(names)
+    tables = _class_tables.get(key)
+    if tables is None:
+        n = max(names) + 1 if names else 0
+        labels = np.zeros(n, dtype="S16")
+        emergency = np.zeros(n, dtype=np.bool_)
+        for cls_id, name in names.items():
+            labels[cls_id] = name.lower().encode()[:16]
+            emergency[cls_id] = is_emergency_label(name)
+        tables = (labels, emergency)
+        _class_tables[key] = tables
+    return tables
+
+def lane_codes(x, y, w, h, frame_w, frame_h):
+    """Vectorized lane mapping: LANES index of each box centre.
+
+    Top zone = North, bottom = South, left = West, right = East; boxes in the
+    middle go to the nearest axis.
+    """
+    cx = np.asarray(x, dtype=np.float32) + np.asarray(w, dtype=np.float32) / 2
+    cy = np.asarray(y, dtype=np.float32) + np.asarray(h, dtype=np.float32) / 2
+    dx = cx - frame_w / 2
+    dy = cy - frame_h / 2
+    # centre zone: nearest axis
+    codes = np.where(np.abs(dx) > np.abs(dy),
+                     np.where(dx > 0, LANE_INDEX["E"], LANE_INDEX["W"]),
+                     np.where(dy > 0, LANE_INDEX["S"], LANE_INDEX["N"]))
+    codes = np.where(cx > frame_w * 0.65, LANE_INDEX["E"], codes)
+    codes = np.where(cx < frame_w * 0.35, LANE_INDEX["W"], codes)
+    codes = np.where(cy > frame_h * 0.65, LANE_INDEX["S"], codes)
+    codes = np.where(cy < frame_h * 0.35, LANE_INDEX["N"], codes)
+    return codes.astype(np.int8)
+
+def from_xyxy(xyxy, conf, cls, names, scale_x=1.0, scale_y=1.0,
+              frame_w=None, frame_h=None, lane=None):
+    """Build a detection array from raw detector outputs.
+
+    xyxy (n, 4), conf (n,), cls (n,) are in inference-frame coordinates and
+    are scaled back to the original frame. If lane is None each box is mapped
+    to a lane by position (frame_w/frame_h required).
+    """
+    n = len(conf)
+    out = np.empty(n, dtype=DETECTION_DTYPE)
+    if n == 0:
+        return out
+    xyxy = np.asarray(xyxy, dtype=np.float32) * np.array(
+        [scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+    cls = np.asarray(cls).astype(np.int16)
+    labels, emergency = _tables_for(names)
+
+    out["x1"] = xyxy[:, 0]
+    out["y1"] = xyxy[:, 1]
+    out["x2"] = xyxy[:, 2]
+    out["y2"] = xyxy[:, 3]
+    out["conf"] = conf
+    out["cls"] = cls
+    out["label"] = labels[cls]
+    out["is_emergency"] = emergency[cls]
+    out["track_id"] = -1
+    if lane is None:
+        out["lane"] = lane_codes(xyxy[:, 0], xyxy[:, 1], xyxy[:, 2] - xyxy[:, 0],
+                                 xyxy[:, 3] - xyxy[:, 1], frame_w, frame_h)
+    else:
+        out["lane"] = LANE_INDEX[lane]
+    return out
+
+def from_yolo(res, frame_shape, small_shape, lane=None):
+    """Convert one ultralytics result (run on a resized frame) in one pass."""
+    boxes = res.boxes
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+    return from_xyxy(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                     boxes.cls.cpu().numpy(), res.names,
+                     scale_x=frame_shape[1] / small_shape[1],
+                     scale_y=frame_shape[0] / small_shape[0],
+                     frame_w=frame_shape[1], frame_h=frame_shape[0], lane=lane)
+
+def make_detection(x1, y1, x2, y2, label, conf, is_emergency=None, lane=None, cls=-1):
+    """Single-row detection array, for simulated/injected detections."""
+    out = np.empty(1, dtype=DETECTION_DTYPE)
+    out[0] = (x1, y1, x2, y2, conf, cls,
+              is_emergency_label(label) if is_emergency is None else is_emergency,
+              LANE_INDEX.get(lane, NO_LANE), label.encode()[:16], -1)
+    return out
+
+def concat(arrays):
+    arrays = [a for a in arrays if len(a)]
+    return np.concatenate(arrays) if arrays else empty_detections()
+
+def iter_boxes(dets):
+    """Yield (x1, y1, x2, y2, label, conf, is_emergency) for drawing."""
+    return zip(dets["x1"].tolist(), dets["y1"].tolist(), dets["x2"].tolist(),
+               dets["y2"].tolist(), [b.decode() for b in dets["label"].tolist()],
+               dets["conf"].tolist(), dets["is_emergency"].tolist())
+
+def to_dicts(dets):
+    """JSON-friendly list of dicts (dashboard API)."""
+    return [{"x1": x1, "y1": y1, "x2": x2, "y2": y2, "label": label,
+             "conf": conf, "is_emergency": emergency,
+             "lane": LANES[lane] if lane >= 0 else None,
+             "track_id": track_id if track_id >= 0 else None}
+            for (x1, y1, x2, y2, label, conf, emergency), lane, track_id
+            in zip(iter_boxes(dets), dets["lane"].tolist(), dets["track_id"].tolist())]
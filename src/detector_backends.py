@@ -0,0 +1,72 @@
+# detector_backends.py
+"""
+Pluggable detector backends.
+
+The same YOLO weights can run through:
+- "torch":         default ultralytics/PyTorch path
+- "onnx":          ONNX export run with ONNX Runtime (CPU)
+- "onnx-int8":     ONNX export with dynamically quantized int8 weights
+- "openvino":      OpenVINO IR export
+- "openvino-int8": OpenVINO IR with int8 post-training quantization
+
+Exports are created next to the weights on first use and reused afterwards.
+Every backend is loaded back through ultralytics, so results (and the
+post-processing in detections.py) are identical in format.
+"""
+
+import os
+
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino", "openvino-int8")
+
+# dataset ultralytics uses to calibrate OpenVINO int8 (downloaded on demand)
+INT8_CALIBRATION_DATA = "coco8.yaml"
+
+def _stem(weights):
+    return os.path.splitext(weights)[0]
+
+def exported_path(weights, backend):
+    """Where the export for a backend lives (it may not exist yet)."""
+    stem = _stem(weights)
+    return {
+        "torch": weights,
+        "onnx": stem + ".onnx",
+        "onnx-int8": stem + "-int8.onnx",
+        "openvino": stem + "_openvino_model",
+        "openvino-int8": stem + "_int8_openvino_model",
+    }[backend]
+
+def _quantize_onnx(src, dst):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+    return dst
+
+def export_model(weights, backend, imgsz=640):
+    """Export weights for a backend if needed; returns the path to load."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        return weights  # nothing to export; ultralytics downloads missing weights
+    path = exported_path(weights, backend)
+    if os.path.exists(path):
+        return path
+
+    from ultralytics import YOLO
+    print(f"[BACKEND] Exporting {weights} for {backend}...")
+    if backend == "onnx":
+        # dynamic axes so the multi-lane engine can send whole batches
+        out = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+    elif backend == "onnx-int8":
+        out = _quantize_onnx(export_model(weights, "onnx", imgsz), path)
+    elif backend == "openvino":
+        out = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True)
+    elif backend == "openvino-int8":
+        out = YOLO(weights).export(format="openvino", imgsz=imgsz, int8=True,
+                                   data=INT8_CALIBRATION_DATA)
+    if os.path.abspath(out) != os.path.abspath(path) and not os.path.exists(path):
+        os.replace(out, path)
+    return path
+
+def load_model(path):
+    """Load any exported backend through ultralytics."""
+    from ultralytics import YOLO
+    return YOLO(path, task="detect")
@@ -0,0 +1,254 @@
+# doppler.py
+"""
+Approach/recede and time-to-closest-approach from siren pitch.
+
+A siren driving past drops in pitch: observed f = f0 * c / (c - v_r), with
+the radial speed v_r going from +v (approaching) through 0 at the closest
+point to -v (receding). Its own wail/yelp sweep is much larger than that
+shift, but periodic: its period is found by autocorrelation and a few
+harmonics of it are projected out of the log-pitch, which is then fitted to a
+straight pass,
+
+    log f(t) = a - b * (t - t0) / sqrt(tau^2 + (t - t0)^2)
+
+over a grid of (t0, tau), solving a and b in closed form for every grid
+point at once. t0 is the moment of closest approach, b ~ v / c gives the
+speed and tau ~ distance / speed. Before t0 the siren is APPROACHING with
+ETA t0 - now; after it the vehicle is RECEDING and preemption can end.
+
+Far from the intersection the heard pitch is flat (a + b), so t0 is not
+identifiable until the pitch starts to drop, about tau before the pass.
+Until the fits that explain the track about as well as the best one agree
+on t0 (within MAX_T0_SPREAD), the status, ETA and speed are None rather
+than a guess.
+
+So the ETA arrives at most a second or so before the pass, and for wide or
+slow passes APPROACHING may not be reported at all: it cannot give the
+controller lead time. The controller preempts on the mic array's lane
+confidence and uses this estimator only to release priority once the
+siren is RECEDING (traffic_controller.py).
+"""
+
+import numpy as np
+
+SPEED_OF_SOUND = 343.0  # m/s
+HISTORY_SECONDS = 20.0
+GRID_RATE = 20.0  # Hz, resampled pitch track
+MIN_SPAN = 2.0  # seconds of siren before estimating
+MIN_SHIFT = 0.005  # b below this (~1.7 m/s) is treated as no Doppler
+MIN_FIT = 0.6  # r^2 of the pass model
+MAX_SPEED = 40.0  # m/s; faster fits are the sweep leaking into the Doppler term
+FIT_TOLERANCE = 0.02  # r^2 below the best fit that still counts as plausible
+MAX_T0_SPREAD = 2.0  # seconds the plausible t0s may span for an estimate
+RESET_AFTER = 3.0  # seconds without siren pitch before starting over
+SWEEP_HARMONICS = 3  # harmonics of the sweep period projected out
+STEADY_SPREAD = 0.01  # log-pitch spread of a non-sweeping tone
+CONFIRM_RECEDING = 1.0  # seconds a RECEDING fit must persist before it sticks
+
+class DopplerEstimator:
+    """Collects (time, pitch) points of one siren and fits a pass to them."""
+
+    def __init__(self, history_seconds=HISTORY_SECONDS, max_rate=200.0):
+        self.capacity = int(history_seconds * max_rate)
+        self.history_seconds = history_seconds
+        self.times = np.zeros(self.capacity)
+        self.pitches = np.zeros(self.capacity, dtype=np.float32)
+        self.count = 0
+        self.taus = np.geomspace(0.3, 8.0, 16)
+        self.last = {"status": None, "eta": None, "speed": None, "rest_freq": None}
+        self.receding = False  # latched: a vehicle does not come back
+        self._receding_since = None
+
+    def reset(self):
+        self.count = 0
+        self.receding = False
+        self._receding_since = None
+
+    def add(self, t, pitch):
+        """Record the siren pitch heard at time t (seconds, any monotonic clock)."""
+        if self.count and t - self.last_heard() > RESET_AFTER:
+            self.reset()  # a new siren
+        self.times[self.count % self.capacity] = t
+        self.pitches[self.count % self.capacity] = pitch
+        self.count += 1
+
+    def last_heard(self):
+        """Time of the latest pitch point, or None."""
+        return float(self.times[(self.count - 1) % self.capacity]) if self.count else None
+
+    def _track(self, now):
+        """Points of the last history_seconds, oldest first."""
+        n = min(self.count, self.capacity)
+        order = (np.arange(self.count - n, self.count)) % self.capacity
+        t, p = self.times[order], self.pitches[order]
+        keep = t >= now - self.history_seconds
+        return t[keep], p[keep]
+
+    @staticmethod
+    def sweep_period(track, rate):
+        """Dominant period (s) of the siren's own sweep, by autocorrelation."""
+        n = len(track)
+        idx = np.arange(n)
+        x = track - np.polyval(np.polyfit(idx, track, 1), idx)  # drop the Doppler trend
+        spec = np.fft.rfft(x, 2 * n)
+        ac = np.fft.irfft(spec * np.conj(spec))[:n]
+        hi = min(n // 2, int(6.0 * rate))
+        if ac[0] <= 0 or hi < 3:
+            return None
+        # first peak after the autocorrelation has gone negative
+        below = np.flatnonzero(ac[:hi] < 0)
+        if len(below) == 0:
+            return None
+        lag = below[0] + int(np.argmax(ac[below[0]:hi]))
+        return lag / rate if ac[lag] > 0.2 * ac[0] else None
+
+    @staticmethod
+    def _harmonics(grid, period):
+        cols = []
+        for h in range(1, SWEEP_HARMONICS + 1):
+            w = 2 * np.pi * h * grid / period
+            cols += [np.sin(w), np.cos(w)]
+        return cols
+
+    def _refine_period(self, grid, y, period):
+        """The autocorrelation lag is only grid-accurate; a slightly wrong
+        period leaks sweep into the Doppler fit. Pick the candidate near it
+        that leaves the smallest residual."""
+        best, best_err = period, np.inf
+        trend = [np.ones_like(grid), grid - grid.mean()]
+        for candidate in period * np.linspace(0.95, 1.05, 21):
+            z = np.stack(trend + self._harmonics(grid, candidate), axis=1)
+            err = np.sum((y - z @ np.linalg.lstsq(z, y, rcond=None)[0]) ** 2)
+            if err < best_err:
+                best, best_err = candidate, err
+        return best
+
+    def estimate(self, now):
+        """Current status dict: status (None, "APPROACHING", "RECEDING"),
+        eta (seconds to closest approach), speed (m/s), rest_freq (Hz).
+
+        Single fits can flip while the pass is still ambiguous, so RECEDING
+        only counts once it has persisted for CONFIRM_RECEDING seconds, and
+        then holds until the siren is gone.
+        """
+        result = self._fit(now)
+        if result["status"] == "RECEDING" and not self.receding:
+            if self._receding_since is None:
+                self._receding_since = now
+            if now - self._receding_since >= CONFIRM_RECEDING:
+                self.receding = True
+            elif self.last["status"] == "APPROACHING":
+                result = dict(self.last, eta=0.0)
+            else:
+                result = dict(result, status=None, eta=None, speed=None, rest_freq=None)
+        elif result["status"] != "RECEDING":
+            self._receding_since = None
+        if self.receding:
+            result = dict(result, status="RECEDING", eta=0.0)
+        self.last = result
+        return result
+
+    def _fit(self, now):
+        """One fit of the current history (no persistence)."""
+        t, p = self._track(now)
+        result = {"status": None, "eta": None, "speed": None, "rest_freq": None}
+        if len(t) < 4 or t[-1] - t[0] < MIN_SPAN:
+            return result
+
+        # uniform grid; the siren's own sweep is periodic and, in log pitch,
+        # simply adds to the Doppler term, so it is removed by projecting out
+        # a few harmonics of the sweep period (no smoothing lag)
+        grid = np.arange(t[0], t[-1], 1.0 / GRID_RATE)
+        y = np.log(np.interp(grid, t, np.maximum(p, 1.0)))
+        nuisance = [np.ones_like(grid)]
+        period = self.sweep_period(y, GRID_RATE)
+        if period:
+            period = self._refine_period(grid, y, period)
+            nuisance += self._harmonics(grid, period)
+        elif np.std(y - np.polyval(np.polyfit(grid, y, 1), grid)) > STEADY_SPREAD:
+            # sweeping, but not yet two periods of it to measure
+            return result
+        # least squares on the few nuisance columns: an orthonormal basis of
+        # them (points x k), never a points x points projection matrix
+        q = np.linalg.qr(np.stack(nuisance, axis=1))[0]
+        y_res = y - q @ (q.T @ y)
+
+        # every (t0, tau) candidate at once: g has shape (t0s, taus, points)
+        t0s = np.arange(grid[0] - 5.0, now + 15.0, 0.1)
+        d = grid[None, None, :] - t0s[:, None, None]
+        g = -d / np.sqrt(self.taus[None, :, None] ** 2 + d ** 2)
+        g_res = g - (g @ q) @ q.T
+        var_g = (g_res ** 2).sum(axis=2)
+        cov = g_res @ y_res
+        var_y = (y_res ** 2).sum()
+        b = cov / np.maximum(var_g, 1e-12)
+        r2 = cov ** 2 / np.maximum(var_g * var_y, 1e-18)
+        # pitch must fall, not rise, through the pass, and at a road speed
+        r2[(b <= 0) | (b > MAX_SPEED / SPEED_OF_SOUND)] = 0.0
+        i, j = np.unravel_index(np.argmax(r2), r2.shape)
+        best_b = float(b[i, j])
+        if r2[i, j] < MIN_FIT or best_b < MIN_SHIFT:
+            return result
+        plausible = t0s[(r2 >= r2[i, j] - FIT_TOLERANCE).any(axis=1)]
+        if plausible[-1] - plausible[0] > MAX_T0_SPREAD:
+            return result  # t0 not identifiable yet (still on the flat approach)
+
+        t0 = float(t0s[i])
+        result["speed"] = best_b * SPEED_OF_SOUND
+        # rest pitch: the mean heard pitch with the Doppler term taken out
+        result["rest_freq"] = float(np.exp(np.mean(y - best_b * g[i, j])))
+        if t0 > now:
+            result["status"] = "APPROACHING"
+            result["eta"] = t0 - now
+        else:
+            result["status"] = "RECEDING"
+            result["eta"] = 0.0
+        return result
+
+def synthetic_pass(duration=20.0, t_closest=12.0, speed=15.0, distance=15.0,
+                   f0=1000.0, sweep_hz=0.25, sweep_span=400.0, rate=10.0, jitter=2.0, rng=None):
+    """(times, pitches) of a wailing siren passing at `speed` m/s, as heard."""
+    rng = rng or np.random.default_rng(0)
+    t = np.arange(0.0, duration, 1.0 / rate)
+    along = speed * (t - t_closest)
+    v_radial = -speed * along / np.sqrt(distance ** 2 + along ** 2)  # + towards us
+    source = f0 + 0.5 * sweep_span * np.sin(2 * np.pi * sweep_hz * t)
+    heard = source * SPEED_OF_SOUND / (SPEED_OF_SOUND - v_radial)
+    return t, heard + jitter * rng.standard_normal(len(t))
+
+def _self_check():
+    import time
+    print("closest approach at 12.0 s; an ETA before it must be within 1 s")
+    cost = []
+    for speed in (10.0, 15.0, 25.0):
+        for distance in (10.0, 15.0, 30.0):
+            t, pitch = synthetic_pass(speed=speed, distance=distance)
+            est = DopplerEstimator()
+            errors, first, receding = [], None, None
+            for ti, pi in zip(t, pitch):
+                est.add(ti, pi)
+                if round(ti * 10) % 5:
+                    continue
+                t0 = time.perf_counter()
+                r = est.estimate(ti)
+                cost.append(time.perf_counter() - t0)
+                if ti < 12.0:
+                    # before the pass: no status, or an ETA close to the truth
+                    assert r["status"] != "RECEDING", (speed, distance, ti)
+                    if r["status"] is None:
+                        assert r["eta"] is None and r["speed"] is None, r
+                    else:
+                        errors.append(abs(ti + r["eta"] - 12.0))
+                        first = ti if first is None else first
+                elif r["status"] == "RECEDING" and receding is None:
+                    receding = ti
+            assert all(e <= 1.0 for e in errors), (speed, distance, errors)
+            eta = "never" if first is None else f"at {first:4.1f}s, max error {max(errors):.1f}s"
+            rec = "never" if receding is None else f"at {receding:4.1f}s"
+            fitted = "-" if r["speed"] is None else f"{r['speed']:4.1f} m/s"
+            print(f"{speed:4.0f} m/s, {distance:4.0f} m: APPROACHING {eta:25} "
+                  f"RECEDING {rec:8} speed {fitted}")
+    print(f"{np.mean(cost) * 1000:.1f} ms per estimate")
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,256 @@
+# emergency_classifier.py
+"""
+Second-stage emergency-vehicle classifier.
+
+The stock COCO detector never emits "ambulance" or "fire truck", only car,
+truck and bus. This stage crops those boxes, batches them and runs a small
+CPU classifier for emergency vs. civilian:
+
+- with EMERGENCY_CLASSIFIER_WEIGHTS present, an ultralytics classification
+  model (any class whose name contains an emergency keyword counts);
+- otherwise a colour heuristic looking for a saturated red/blue light bar on
+  the roof and a mostly white body.
+
+No weights ship with the repo and the heuristic is untrained (it flags
+most white cars with a red roof sign), so make_stage() only switches the
+stage on by default when the weights are installed: out of the box nothing
+beyond the detector's own classes marks emergency vehicles. Train them with
+train_emergency_classifier.py. Either way the stage's hits are only votes:
+a vehicle becomes an emergency once the lane tracker has seen it over
+several frames (tracker.IoUTracker hysteresis), never from a single crop.
+
+The stage runs on detector output before the tracker update, with the ids
+of the tracks the boxes will join (IoUTracker.match). Results are cached
+per track id (quantized box for a new track), so a vehicle is classified
+once and only re-checked every reclassify_after seconds.
+"""
+
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+from detections import EMERGENCY_KEYWORDS
+
+EMERGENCY_CLASSIFIER_WEIGHTS = os.path.join(os.path.dirname(__file__), "models", "emergency_cls.pt")
+VEHICLE_LABELS = (b"car", b"truck", b"bus")
+CROP_SIZE = 64
+
+def colour_scores(crops):
+    """Heuristic emergency score for a (n, CROP_SIZE, CROP_SIZE, 3) BGR batch."""
+    n = len(crops)
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    hsv = cv2.cvtColor(crops.reshape(-1, CROP_SIZE, 3), cv2.COLOR_BGR2HSV).reshape(crops.shape)
+    h = hsv[..., 0].astype(np.int16)
+    s = hsv[..., 1]
+    v = hsv[..., 2]
+    bright = (s > 120) & (v > 150)
+    red = bright & ((h < 10) | (h > 170))
+    blue = bright & (h > 100) & (h < 130)
+    roof = CROP_SIZE * 3 // 10
+    light_bar = (red[:, :roof] | blue[:, :roof]).reshape(n, -1).mean(axis=1)
+    white = ((s < 40) & (v > 180))[:, roof:].reshape(n, -1).mean(axis=1)
+    score = 0.5 * np.minimum(light_bar / 0.05, 1.0) + 0.5 * np.minimum(white / 0.4, 1.0)
+    # needs a light bar (not a whole red/blue car) on a mostly white body
+    looks_emergency = (light_bar > 0.01) & (light_bar < 0.4) & (white > 0.25)
+    return np.where(looks_emergency, score, 0.0).astype(np.float32)
+
+class EmergencyClassifier:
+    """Batched emergency-vs-civilian classifier over vehicle crops."""
+
+    def __init__(self, weights=None):
+        weights = weights or EMERGENCY_CLASSIFIER_WEIGHTS
+        self.weights = weights if os.path.exists(weights) else None
+        self._model = None
+        self._emergency_idx = None
+
+    @property
+    def trained(self):
+        return self.weights is not None
+
+    def _load(self):
+        from ultralytics import YOLO
+        self._model = YOLO(self.weights, task="classify")
+        names = self._model.names
+        self._emergency_idx = [i for i, name in names.items()
+                               if any(k in name.lower() for k in EMERGENCY_KEYWORDS)]
+
+    def predict(self, crops):
+        """Emergency probability for each crop in the batch."""
+        if len(crops) == 0:
+            return np.zeros(0, dtype=np.float32)
+        if self.weights is None:
+            return colour_scores(crops)
+        if self._model is None:
+            self._load()
+        results = self._model(list(crops), imgsz=CROP_SIZE, verbose=False)
+        probs = np.stack([r.probs.data.cpu().numpy() for r in results])
+        return probs[:, self._emergency_idx].sum(axis=1).astype(np.float32)
+
+class CropCache:
+    """LRU of emergency probabilities keyed by track id or quantized box."""
+
+    def __init__(self, max_entries=512, reclassify_after=2.0, box_quant=16):
+        self.max_entries = max_entries
+        self.reclassify_after = reclassify_after
+        self.box_quant = box_quant
+        self._entries = OrderedDict()  # key -> (prob, classified_at)
+        self.hits = 0
+        self.misses = 0
+
+    def keys_for(self, dets):
+        q = self.box_quant
+        return [("t", t) if t >= 0 else ("b", lane, x1 // q, y1 // q, x2 // q, y2 // q)
+                for t, lane, x1, y1, x2, y2 in zip(
+                    dets["track_id"].tolist(), dets["lane"].tolist(), dets["x1"].tolist(),
+                    dets["y1"].tolist(), dets["x2"].tolist(), dets["y2"].tolist())]
+
+    def get(self, key, now):
+        """Cached probability, or None when missing/stale."""
+        entry = self._entries.get(key)
+        if entry is None or now - entry[1] > self.reclassify_after:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def last(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key, prob, now):
+        self._entries[key] = (prob, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class EmergencyStage:
+    """Marks car/truck/bus detections as emergency using the classifier."""
+
+    def __init__(self, classifier=None, threshold=0.5, cache=None, max_batch=32):
+        self.classifier = classifier or EmergencyClassifier()
+        self.threshold = threshold
+        self.cache = cache or CropCache()
+        self.max_batch = max_batch
+        self._crops = np.empty((max_batch, CROP_SIZE, CROP_SIZE, 3), dtype=np.uint8)
+        self.classified = 0
+
+    @property
+    def trained(self):
+        return self.classifier.trained
+
+    def apply(self, frame, dets, now):
+        """Return dets with is_emergency set from the classifier.
+
+        Apply it to detector output before the tracker update, so the flags
+        are per-frame votes the tracker confirms over several frames.
+        frame may be None (a predicted-only frame): then only cached results
+        are used and nothing new is classified.
+        """
+        if len(dets) == 0:
+            return dets
+        vehicle_rows = np.flatnonzero(np.isin(dets["label"], VEHICLE_LABELS))
+        if len(vehicle_rows) == 0:
+            return dets
+        keys = self.cache.keys_for(dets[vehicle_rows])
+        probs = np.zeros(len(vehicle_rows), dtype=np.float32)
+        todo = []
+        for i, key in enumerate(keys):
+            prob = self.cache.get(key, now)
+            if prob is None:
+                if frame is not None and len(todo) < self.max_batch:
+                    todo.append(i)
+                prob = self.cache.last(key) or 0.0
+            probs[i] = prob
+
+        if todo:
+            h, w = frame.shape[:2]
+            rows = dets[vehicle_rows[todo]]
+            x1 = np.clip(rows["x1"], 0, w - 1)
+            y1 = np.clip(rows["y1"], 0, h - 1)
+            x2 = np.clip(rows["x2"], x1 + 1, w)
+            y2 = np.clip(rows["y2"], y1 + 1, h)
+            for j, (a, b, c, d) in enumerate(zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())):
+                cv2.resize(frame[b:d, a:c], (CROP_SIZE, CROP_SIZE), dst=self._crops[j])
+            new_probs = self.classifier.predict(self._crops[:len(todo)])
+            self.classified += len(todo)
+            for i, prob in zip(todo, new_probs.tolist()):
+                self.cache.put(keys[i], prob, now)
+                probs[i] = prob
+
+        out = dets.copy()
+        out["is_emergency"][vehicle_rows] |= probs >= self.threshold
+        return out
+
+    def stats(self):
+        return {"classified": self.classified, "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses}
+
+def make_stage(enabled=None):
+    """An EmergencyStage, or None when disabled.
+
+    enabled=None: only when EMERGENCY_CLASSIFIER_WEIGHTS exist; True forces
+    the colour heuristic on without them.
+    """
+    if enabled is None:
+        enabled = os.path.exists(EMERGENCY_CLASSIFIER_WEIGHTS)
+    return EmergencyStage() if enabled else None
+
+def _synthetic_crops(kind, n, rng):
+    """n noisy BGR crops of a vehicle seen from above/behind."""
+    crops = np.empty((n, CROP_SIZE, CROP_SIZE, 3), dtype=np.uint8)
+    roof = CROP_SIZE * 3 // 10
+    for crop in crops:
+        crop[:] = rng.integers(60, 120)  # road
+        white = kind != "car"
+        crop[8:60, 4:60] = rng.integers(200, 250, 3) if white else rng.integers(0, 256, 3)
+        crop[roof + 2:roof + 14, 10:54] = rng.integers(20, 60)  # windscreen
+        if kind == "ambulance":
+            x = rng.integers(10, 40)
+            crop[4:roof, x:x + 12] = (0, 0, 255) if rng.random() < 0.5 else (255, 60, 0)
+        elif kind == "white van, tail lights":
+            crop[50:58, 6:14] = crop[50:58, 50:58] = (20, 20, 230)
+        elif kind == "white van, red livery":
+            crop[36:44, 4:60] = (30, 30, 220)
+        elif kind == "taxi, roof sign":
+            crop[2:8, 24:40] = (30, 30, 220)
+        crop[:] = np.clip(crop + rng.normal(0, 8, crop.shape), 0, 255)
+    return crops
+
+def _self_check():
+    from detections import empty_detections
+    from tracker import IoUTracker
+
+    rng = np.random.default_rng(0)
+    threshold = 0.5  # EmergencyStage default
+    print("colour heuristic, share of crops scored emergency:")
+    rates = {}
+    for kind in ("car", "white car", "white van, tail lights", "white van, red livery",
+                 "taxi, roof sign", "ambulance"):
+        rates[kind] = (colour_scores(_synthetic_crops(kind, 500, rng)) >= threshold).mean()
+        print(f"  {kind:24} {rates[kind]:5.1%}")
+    # roof signs look like light bars to the heuristic: why it is off by default
+    for kind in ("car", "white car", "white van, tail lights", "white van, red livery"):
+        assert rates[kind] <= 0.01, f"false positives on {kind}: {rates[kind]:.1%}"
+    assert rates["ambulance"] >= 0.5
+
+    # a single heuristic hit on a civilian track never makes it an emergency
+    tracker = IoUTracker()
+    dets = empty_detections(1)
+    dets["x1"], dets["y1"], dets["x2"], dets["y2"] = 100, 100, 200, 180
+    dets["label"] = b"car"
+    for k in range(20):
+        dets["is_emergency"] = k == 5
+        tracker.update(dets, k * 0.1)
+        assert not tracker.has_emergency(), f"one-frame hit raised an emergency at frame {k}"
+    for k in range(20, 23):
+        dets["is_emergency"] = True
+        tracker.update(dets, k * 0.1)
+    assert tracker.has_emergency()
+    print("tracker: one-frame hit ignored, three consecutive hits confirmed")
+    print(f"stage enabled by default: {make_stage() is not None} "
+          f"(weights {'found' if os.path.exists(EMERGENCY_CLASSIFIER_WEIGHTS) else 'missing'})")
+
+if __name__ == "__main__":
+    _self_check()
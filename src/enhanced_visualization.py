@@ -9,7 +9,9 @@ Can be used as an alternative to ui_simulation.py for more detailed display.
 import pygame
 import cv2
 import numpy as np
-from utils import shared_state
+from utils import all_detections, shared_state
+from detections import iter_boxes
+from frame_pool import FramePool
 import time
 
 COLORS = {
@@ -31,9 +33,12 @@ def cvimage_to_pygame(image):
     surface = pygame.surfarray.make_surface(image)
     return surface
 
+# overlays are drawn on pooled copies: no allocation per redraw
+_draw_pool = FramePool(slots=4)
+
 def draw_detection_overlay_advanced(frame, detections):
     """Draw advanced detection overlay with confidence, class info, and lane zones."""
-    frame_copy = frame.copy()
+    frame_copy = _draw_pool.copy(frame)
     h, w = frame.shape[:2]
     
     # Draw lane zones as semi-transparent regions
@@ -45,7 +50,7 @@ def draw_detection_overlay_advanced(frame, detections):
     }
     
     # Draw zone overlays (very transparent)
-    overlay = frame_copy.copy()
+    overlay = _draw_pool.copy(frame_copy)
     for zone_name, (x1, y1, x2, y2, color) in zones.items():
         cv2.rectangle(overlay, (x1, y1), (x2, y2), color, -1)
         cv2.putText(overlay, zone_name, (x1 + 10, y1 + 30),
@@ -53,12 +58,7 @@ def draw_detection_overlay_advanced(frame, detections):
     cv2.addWeighted(overlay, 0.08, frame_copy, 0.92, 0, frame_copy)
     
     # Draw detection boxes
-    for det in detections:
-        x1, y1, x2, y2 = det["x1"], det["y1"], det["x2"], det["y2"]
-        label = det["label"]
-        conf = det["conf"]
-        is_emergency = det["is_emergency"]
-        
+    for x1, y1, x2, y2, label, conf, is_emergency in iter_boxes(detections):
         # Color based on emergency status
         if is_emergency:
             color = (0, 0, 255)  # Red for emergency
@@ -136,22 +136,22 @@ class EnhancedTrafficUI:
         
         # Detections list
         line_h = 22
-        for i, det in enumerate(detections[:5]):  # Show top 5
+        for i, (x1, _, x2, _, label, conf, is_emergency) in enumerate(iter_boxes(detections[:5])):  # Show top 5
             yi = y + 30 + i * line_h
             if yi > y + h - 20:
                 break
             
             # Color indicator
             color_rect = pygame.Rect(x + 10, yi, 12, 12)
-            det_color = COLORS["EMERGENCY"] if det["is_emergency"] else (100, 200, 100)
+            det_color = COLORS["EMERGENCY"] if is_emergency else (100, 200, 100)
             pygame.draw.rect(self.screen, det_color, color_rect)
             
             # Text
-            text = f"{det['label'][:15]:15} {det['conf']:.1%} ({det['x2']-det['x1']}px)"
+            text = f"{label[:15]:15} {conf:.1%} ({x2-x1}px)"
             txt = self.font.render(text, True, COLORS["WHITE"])
             self.screen.blit(txt, (x + 30, yi - 2))
         
-        if not detections:
+        if len(detections) == 0:
             txt = self.font.render("No detections", True, COLORS["TEXT_DIM"])
             self.screen.blit(txt, (x + 10, y + 40))
     
@@ -229,9 +229,10 @@ class EnhancedTrafficUI:
         
         # Camera feed with enhanced overlay (left side)
         cam_x, cam_y, cam_w, cam_h = 20, 150, 600, 450
-        with shared_state.lock:
-            frame = shared_state.camera_frame.copy() if shared_state.camera_frame is not None else None
-            detections = shared_state.detections.copy() if shared_state.detections else []
+        # one consistent snapshot; the overlay drawer copies the read-only frame
+        snap = shared_state.snapshot()
+        frame = snap.overhead.frame
+        detections = all_detections(snap)
         
         if frame is not None:
             # Draw advanced overlay
@@ -10,18 +10,27 @@ Provides:
 Run: python flask_dashboard.py
 Then visit: http://localhost:5000
 
-Note: Run alongside main.py (in separate terminal/thread)
+Note: shared_state is per process. Run it in the sensors' process
+(run_demo_dashboard.py), or in its own process attached to the state they
+share: python demo.py --share, then python flask_dashboard.py --attach
 """
 
 from flask import Flask, render_template_string, Response, jsonify
 import cv2
 import numpy as np
 import threading
-from utils import shared_state
+from utils import LIGHTS_TOPIC, detections_topic, frame_topic, shared_state
+from detections import LANES, iter_boxes
+from frame_pool import FramePool
+from records import status_json
+import json
 import time
 
 app = Flask(__name__)
 
+# detections are drawn on pooled copies, one pool per lane (lanes may differ in size)
+_draw_pools = {lane: FramePool(slots=4) for lane in LANES}
+
 # HTML template for dashboard
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -130,25 +139,28 @@ HTML_TEMPLATE = """
         .refresh-rate { text-align: center; font-size: 0.9em; color: #aaa; margin-top: 10px; }
     </style>
     <script>
-        // Simple single-frame polling for all 4 lanes
-        class FramePoller {
+        // Loads a lane's JPEG when the server announces a new frame; at most
+        // one request in flight, frames published meanwhile are coalesced
+        class FrameLoader {
             constructor(lane, canvasId) {
                 this.lane = lane;
                 this.canvas = document.getElementById(canvasId);
                 this.ctx = this.canvas ? this.canvas.getContext('2d') : null;
-                this.running = true;
-                if (this.canvas) {
-                    this.start();
-                }
+                this.loading = false;
+                this.wanted = null;  // newest announced frame version
+                this.shown = null;
+                this.load(0);
             }
             
-            start() {
-                if (!this.running || !this.canvas) return;
+            load(version) {
+                this.wanted = version;
+                if (this.loading || !this.canvas) return;
+                this.loading = true;
                 
                 const img = new Image();
                 img.crossOrigin = 'anonymous';
+                const requested = this.wanted;
                 
-                // Fetch single JPEG frame
                 img.onload = () => {
                     try {
                         if (this.ctx) {
@@ -157,63 +169,68 @@ HTML_TEMPLATE = """
                     } catch (e) {
                         console.error(`Draw error (lane ${this.lane}):`, e);
                     }
-                    // Poll next frame after 100ms
-                    setTimeout(() => this.start(), 100);
+                    this.shown = requested;
+                    this.done();
                 };
                 
                 img.onerror = () => {
                     console.warn(`Frame load error (lane ${this.lane})`);
-                    setTimeout(() => this.start(), 500);
+                    this.done();
                 };
                 
-                // Use frame endpoint with cache-busting timestamp
-                img.src = `/frame/${this.lane}?t=${Date.now()}`;
+                // version in the URL keeps the browser from serving a cached frame
+                img.src = `/frame/${this.lane}?v=${requested}`;
             }
             
-            stop() {
-                this.running = false;
+            done() {
+                this.loading = false;
+                if (this.wanted !== this.shown) this.load(this.wanted);
             }
         }
         
-        // Start frame pollers for all lanes when page loads
+        // Start frame loaders for all lanes when page loads
         window.addEventListener('load', function() {
-            console.log('Starting frame pollers for all 4 lanes...');
-            window.pollers = {
-                N: new FramePoller('N', 'canvas-N'),
-                E: new FramePoller('E', 'canvas-E'),
-                S: new FramePoller('S', 'canvas-S'),
-                W: new FramePoller('W', 'canvas-W')
+            window.loaders = {
+                N: new FrameLoader('N', 'canvas-N'),
+                E: new FrameLoader('E', 'canvas-E'),
+                S: new FrameLoader('S', 'canvas-S'),
+                W: new FrameLoader('W', 'canvas-W')
             };
-            console.log('All frame pollers started');
+            
+            // the server pushes status and new-frame events (/api/events)
+            const events = new EventSource('/api/events');
+            events.addEventListener('status', e => updateStatus(JSON.parse(e.data)));
+            events.addEventListener('frame', e => {
+                for (const [lane, version] of Object.entries(JSON.parse(e.data))) {
+                    if (window.loaders[lane]) window.loaders[lane].load(version);
+                }
+            });
+            events.onerror = () => console.warn('Event stream interrupted, reconnecting...');
         });
         
         // Update status
-        function updateStatus() {
-            fetch('/api/status')
-                .then(r => r.json())
-                .then(data => {
-                    for (const lane of ['N', 'E', 'S', 'W']) {
-                        const light = document.getElementById(`light-${lane}`);
-                        const state = data.lights[lane];
-                        light.className = `light-indicator ${state.toLowerCase()}`;
+        function updateStatus(data) {
+            try {
+                for (const lane of ['N', 'E', 'S', 'W']) {
+                    const light = document.getElementById(`light-${lane}`);
+                    const state = data.lights[lane];
+                    light.className = `light-indicator ${state.toLowerCase()}`;
                         
-                        const ambulanceEl = document.getElementById(`ambulance-${lane}`);
-                        ambulanceEl.textContent = data.ambulance_detected[lane] ? '🚑 AMBULANCE' : 'No Ambulance';
-                        ambulanceEl.style.color = data.ambulance_detected[lane] ? '#ff0000' : '#888888';
-                    }
+                    const ambulanceEl = document.getElementById(`ambulance-${lane}`);
+                    ambulanceEl.textContent = data.ambulance_detected[lane] ? '🚑 AMBULANCE' : 'No Ambulance';
+                    ambulanceEl.style.color = data.ambulance_detected[lane] ? '#ff0000' : '#888888';
+                }
                     
-                    const modeEl = document.getElementById('mode-badge');
-                    modeEl.textContent = data.mode;
-                    modeEl.style.color = data.mode === 'PRIORITY' ? '#ff0000' : '#ffff00';
+                const modeEl = document.getElementById('mode-badge');
+                modeEl.textContent = data.mode;
+                modeEl.style.color = data.mode === 'PRIORITY' ? '#ff0000' : '#ffff00';
                     
-                    document.getElementById('priority-lane').textContent = data.priority_lane || 'None';
-                    document.getElementById('priority-lane').style.color = data.priority_lane ? '#ff0000' : '#00ff00';
-                })
-                .catch(e => console.error("Status update failed:", e));
+                document.getElementById('priority-lane').textContent = data.priority_lane || 'None';
+                document.getElementById('priority-lane').style.color = data.priority_lane ? '#ff0000' : '#00ff00';
+            } catch (e) {
+                console.error("Status update failed:", e);
+            }
         }
-        
-        setInterval(updateStatus, 500);
-        updateStatus();
     </script>
 </head>
 <body>
@@ -291,7 +308,7 @@ HTML_TEMPLATE = """
             <div style="text-align:center; margin-top:10px; color:#aaa; font-size:0.9em;">Change take effect immediately across all lanes.</div>
         </div>
         
-        <div class="refresh-rate">Updates every 500ms | Refresh your browser if stream stops</div>
+        <div class="refresh-rate">Live updates pushed by the server | Refresh your browser if stream stops</div>
     </div>
     <script>
         // Vehicle controls: load current params and apply updates
@@ -339,11 +356,13 @@ def generate_frames():
 
 def generate_frames_for_lane(lane):
     """Generate MJPEG stream for a specific lane."""
+    # one JPEG per published frame, instead of re-encoding on a timer
+    sub = shared_state.subscribe(frame_topic(lane), detections_topic(lane))
     while True:
         try:
-            with shared_state.lock:
-                frame = shared_state.camera_frames[lane].copy() if shared_state.camera_frames[lane] is not None else None
-                detections = shared_state.detections[lane].copy() if shared_state.detections[lane] else []
+            # frame and detections from the same snapshot; drawn on a copy below
+            snap = shared_state.lanes[lane]
+            frame, detections = snap.frame, snap.detections
             
             # If no frame, generate a placeholder
             if frame is None:
@@ -354,13 +373,8 @@ def generate_frames_for_lane(lane):
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (100, 100, 100), 1)
             
             # Draw detections directly on frame
-            frame_with_boxes = frame.copy()
-            for det in detections:
-                x1, y1, x2, y2 = det.get("x1", 0), det.get("y1", 0), det.get("x2", 0), det.get("y2", 0)
-                label = det.get("label", "unknown")
-                conf = det.get("conf", 0.0)
-                is_emergency = det.get("is_emergency", False)
-                
+            frame_with_boxes = _draw_pools[lane].copy(frame)
+            for x1, y1, x2, y2, label, conf, is_emergency in iter_boxes(detections):
                 # Use bright red for emergency vehicles, green for others
                 if is_emergency:
                     color = (0, 0, 255)  # Red in BGR
@@ -394,7 +408,7 @@ def generate_frames_for_lane(lane):
                    b'Content-Length: ' + str(len(frame_bytes)).encode() + b'\r\n\r\n'
                    + frame_bytes + b'\r\n')
             
-            time.sleep(0.033)  # ~30 FPS
+            sub.wait(timeout=1.0)  # next frame; resend the last one when the feed stalls
         except Exception as e:
             print(f"Stream error (lane {lane}): {e}")
             import traceback
@@ -420,9 +434,8 @@ def get_frame(lane):
         return "Invalid lane", 404
     
     try:
-        with shared_state.lock:
-            frame = shared_state.camera_frames[lane].copy() if shared_state.camera_frames[lane] is not None else None
-            detections = shared_state.detections[lane].copy() if shared_state.detections[lane] else []
+        snap = shared_state.lanes[lane]
+        frame, detections = snap.frame, snap.detections
         
         # If no frame, generate a placeholder
         if frame is None:
@@ -433,13 +446,8 @@ def get_frame(lane):
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (100, 100, 100), 1)
         
         # Draw detections directly on frame
-        frame_with_boxes = frame.copy()
-        for det in detections:
-            x1, y1, x2, y2 = det.get("x1", 0), det.get("y1", 0), det.get("x2", 0), det.get("y2", 0)
-            label = det.get("label", "unknown")
-            conf = det.get("conf", 0.0)
-            is_emergency = det.get("is_emergency", False)
-            
+        frame_with_boxes = _draw_pools[lane].copy(frame)
+        for x1, y1, x2, y2, label, conf, is_emergency in iter_boxes(detections):
             # Use bright red for emergency vehicles, green for others
             if is_emergency:
                 color = (0, 0, 255)  # Red in BGR
@@ -473,40 +481,52 @@ def get_frame(lane):
         ret, buffer = cv2.imencode('.jpg', placeholder)
         return Response(buffer.tobytes(), mimetype='image/jpeg')
 
+def status_payload():
+    """Lights and mode as the controller published them, lanes as the cameras did."""
+    payload = status_json(shared_state.snapshot())
+    payload["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return payload
+
 @app.route('/api/status')
 def api_status():
-    """JSON API endpoint for current system status."""
-    from traffic_controller import controller
-    
-    # Update controller state based on shared_state (this makes lights respond)
-    controller.update()
-    
-    with shared_state.lock:
-        lights = controller.lights.copy()
-        mode = controller.mode
-        priority_lane = controller.priority_lane
-        
-        # Build ambulance detected per lane
-        ambulance_detected = {
-            "N": shared_state.ambulance_detected["N"],
-            "E": shared_state.ambulance_detected["E"],
-            "S": shared_state.ambulance_detected["S"],
-            "W": shared_state.ambulance_detected["W"]
-        }
-    
-    return jsonify({
-        "lights": lights,
-        "mode": mode,
-        "priority_lane": priority_lane,
-        "ambulance_detected": ambulance_detected,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-    })
+    """JSON API endpoint for current system status.
+
+    Only reads the published snapshot: the controller ticks on its own
+    scheduler, however many browsers poll.
+    """
+    return jsonify(status_payload())
+
+@app.route('/api/events')
+def api_events():
+    """Server-sent events pushed as state is published.
+
+    "status": the /api/status payload whenever lights or detections change.
+    "frame": {lane: version} of new camera frames; the page then loads /frame/<lane>.
+    """
+    status_topics = [LIGHTS_TOPIC] + [detections_topic(lane) for lane in LANES]
+    frame_topics = {frame_topic(lane): lane for lane in LANES}
+
+    def stream():
+        sub = shared_state.subscribe(*status_topics, *frame_topics)
+        yield f"event: status\ndata: {json.dumps(status_payload())}\n\n"
+        while True:
+            changed = sub.wait(timeout=15.0)
+            if not changed:
+                yield ": keep-alive\n\n"  # lets the server notice closed connections
+                continue
+            frames = {frame_topics[t]: sub.seen[t] for t in changed if t in frame_topics}
+            if frames:
+                yield f"event: frame\ndata: {json.dumps(frames)}\n\n"
+            if len(frames) < len(changed):
+                yield f"event: status\ndata: {json.dumps(status_payload())}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/vehicle_params', methods=['GET'])
 def api_get_vehicle_params():
-    with shared_state.lock:
-        params = getattr(shared_state, 'vehicle_params', {"spawn_interval": (2.0,5.0), "speed_multiplier": 1.0})
+    params = getattr(shared_state, 'vehicle_params', {"spawn_interval": (2.0,5.0), "speed_multiplier": 1.0})
     # Convert tuples to lists for JSON
     p = {"spawn_interval": list(params.get('spawn_interval', (2.0,5.0))), "speed_multiplier": float(params.get('speed_multiplier', 1.0))}
     return jsonify(p)
@@ -527,19 +547,34 @@ def api_set_vehicle_params():
         if sv0 <= 0 or sv1 <= 0 or sv0 >= sv1:
             return jsonify({"error": "Invalid spawn interval range"}), 400
 
-        with shared_state.lock:
-            shared_state.vehicle_params = {"spawn_interval": (sv0, sv1), "speed_multiplier": mult}
+        shared_state.publish_vehicle_params({"spawn_interval": (sv0, sv1), "speed_multiplier": mult})
 
         return jsonify({"ok": True, "spawn_interval": [sv0, sv1], "speed_multiplier": mult})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Emergency Traffic AI web dashboard")
+    parser.add_argument("--attach", nargs="?", const="emergency_traffic_state", default=None,
+                        metavar="NAME",
+                        help="Show the state shared by another process (demo.py/main.py --share)")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
     print("=" * 60)
     print("Flask Dashboard starting...")
     print("=" * 60)
-    print("\nOpen your browser to: http://localhost:5000")
-    print("\nMake sure main.py is running in another terminal!")
+    print(f"\nOpen your browser to: http://localhost:{args.port}")
+    if args.attach:
+        from shm_state import share
+        share(export=("params",), follow=("lanes", "audio", "control"), name=args.attach)
+        print(f"\nAttached to shared state '{args.attach}'")
+    else:
+        # the lights advance on the controller's own schedule, not per request
+        from traffic_controller import start_controller_thread
+        start_controller_thread()
+        print("\nMake sure main.py is running in another terminal!")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    app.run(host='0.0.0.0', port=args.port, debug=False, threaded=True)
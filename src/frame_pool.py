@@ -0,0 +1,113 @@
+# frame_pool.py
+"""
+Preallocated, reference-counted frame buffers.
+
+A camera frame used to be copied on its way to every consumer: out of the
+capture ring, into shared_state, and again by each reader. With a pool the
+capture thread decodes straight into a pooled buffer and the very same
+memory is handed on as read-only views: to inference, to the shared state
+snapshot and to every UI or dashboard reader. Nothing is copied.
+
+The reference count is Python's own. Every buffer handed out is backed by a
+small lease object that all views of it keep alive (it is their NumPy base),
+and the buffer goes back to the free list when the last view is dropped, in
+whichever thread that happens. Consumers never release anything explicitly.
+
+    pool = FramePool(slots=8)
+    frame = pool.acquire((1080, 1920, 3))  # writable, not shared yet
+    cap.read(frame)
+    shared_state.publish_lane("N", frame=frame)  # published as a read-only view
+"""
+
+import threading
+from collections import deque
+import numpy as np
+
+class _Lease:
+    """Exposes one pooled block to NumPy; returns it to the pool when collected."""
+
+    __slots__ = ("__array_interface__", "block", "pool", "generation", "__weakref__")
+
+    def __init__(self, pool, block, generation):
+        self.block = block
+        self.pool = pool
+        self.generation = generation
+        self.__array_interface__ = block.__array_interface__
+
+    def __del__(self):
+        self.pool._release(self.block, self.generation)
+
+class FramePool:
+    """Free list of equally shaped frame buffers, allocated on first use.
+
+    slots: buffers preallocated for a shape. When all of them are still
+    referenced (a slow consumer holds on to frames), acquire() allocates one
+    more and the pool keeps it; stats() shows how often that happened.
+    """
+
+    def __init__(self, slots=8):
+        self.slots = slots
+        self.shape = None
+        self.dtype = None
+        self._free = deque()  # append/popleft are atomic: safe from __del__ in any thread
+        self._generation = 0  # bumped on reshape; stale buffers are not taken back
+        self._lock = threading.Lock()  # acquire() and the counters, never taken in _release
+        self.allocations = 0  # buffers ever allocated
+        self.acquired = 0  # buffers handed out
+        self.copies = 0  # frames copied into the pool (copy())
+        self.bytes_copied = 0
+        self._owned = 0  # buffers of the current shape, free or in use
+
+    def _reshape(self, shape, dtype):
+        self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+        self._generation += 1
+        self._free.clear()
+        for _ in range(self.slots):
+            self._free.append(np.empty(self.shape, self.dtype))
+        self.allocations += self.slots
+        self._owned = self.slots
+
+    def acquire(self, shape, dtype=np.uint8):
+        """A writable buffer of shape/dtype, owned by the caller until published."""
+        with self._lock:
+            if self.shape != tuple(shape) or self.dtype != np.dtype(dtype):
+                self._reshape(shape, dtype)
+            try:
+                block = self._free.popleft()
+            except IndexError:
+                block = np.empty(self.shape, self.dtype)  # pool exhausted
+                self.allocations += 1
+                self._owned += 1
+            self.acquired += 1
+            return np.asarray(_Lease(self, block, self._generation))
+
+    def copy(self, frame):
+        """Writable pooled copy of frame (e.g. to draw detections on)."""
+        out = self.acquire(frame.shape, frame.dtype)
+        np.copyto(out, frame)
+        with self._lock:
+            self.copies += 1
+            self.bytes_copied += frame.nbytes
+        return out
+
+    def _release(self, block, generation):
+        if generation == self._generation:
+            self._free.append(block)
+
+    def stats(self):
+        return {
+            "allocations": self.allocations,
+            "acquired": self.acquired,
+            "copies": self.copies,
+            "bytes_copied": self.bytes_copied,
+            "in_use": self._owned - len(self._free),
+            "free": len(self._free),
+        }
+
+def readonly(frame):
+    """Read-only view of a frame; shares the buffer (and keeps it leased)."""
+    if frame is None:
+        return None
+    view = frame.view()
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,213 @@
+# inference_pool.py
+"""
+Process-pool inference with shared-memory frame transport.
+
+Detection (YOLO pre-processing, forward pass and post-processing) runs in
+worker processes so it no longer competes for the GIL with the audio,
+controller, UI and Flask threads. Each lane has a shared-memory slot; the
+main process resizes the frame straight into it, workers read it in place,
+and only a small task tuple and the compact detection arrays cross the
+process boundary.
+"""
+
+import atexit
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+import queue
+import cv2
+import numpy as np
+import detections
+from model_registry import DEFAULT_BACKEND, DEFAULT_WEIGHTS, INFER_WIDTH
+
+class _LaneSlot:
+    """Shared-memory buffer holding one lane's resized frame.
+
+    generation counts the slots a lane has had; workers drop their
+    attachment to an older one. jobs are the tasks still reading the slot:
+    it is neither written nor unlinked before they are acknowledged.
+    """
+
+    def __init__(self, nbytes, generation=0):
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.generation = generation
+        self.jobs = set()  # task ids not yet answered
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def size(self):
+        return self.shm.size
+
+    def view(self, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+def _worker_main(task_q, result_q, weights, backend, conf_thresh, threads):
+    """Worker process: attach to lane slots by name and run detection."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from model_registry import get_model
+    model = get_model(weights, backend)
+    attached = {}  # lane -> (generation, SharedMemory)
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        task_id, items = task
+        smalls = []
+        for lane, shm_name, generation, small_shape, frame_shape in items:
+            gen, shm = attached.get(lane, (None, None))
+            if gen != generation:
+                if shm is not None:
+                    shm.close()  # the lane moved to a new slot
+                shm = shared_memory.SharedMemory(name=shm_name)
+                attached[lane] = (generation, shm)
+            smalls.append(np.ndarray(small_shape, dtype=np.uint8, buffer=shm.buf))
+        try:
+            results = model(smalls, conf=conf_thresh, verbose=False)
+            out = {lane: detections.from_yolo(res, frame_shape, small_shape, lane=lane)
+                   for (lane, _, _, small_shape, frame_shape), res in zip(items, results)}
+            result_q.put((task_id, out, None))
+        except Exception as e:
+            result_q.put((task_id, {}, repr(e)))
+        del smalls
+
+    for _, shm in attached.values():
+        shm.close()
+
+class ProcessInferencePool:
+    """Runs batched detection in worker processes.
+
+    infer() splits a batch across the workers, so several lanes are detected
+    in parallel on separate cores.
+    """
+
+    def __init__(self, workers=2, weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND,
+                 conf_thresh=0.35, infer_width=INFER_WIDTH, timeout=30.0):
+        self.workers = workers
+        self.infer_width = infer_width
+        self.timeout = timeout
+        self._slots = {}  # lane -> _LaneSlot
+        self._retired = []  # replaced slots still read by a timed-out task
+        self._jobs = {}  # task id -> slots it reads
+        self._task_id = 0
+        # spawn: workers must not inherit the parent's threads or torch state
+        ctx = mp.get_context("spawn")
+        self._task_qs = [ctx.Queue() for _ in range(workers)]
+        self._result_q = ctx.Queue()
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self._procs = [ctx.Process(target=_worker_main,
+                                   args=(q, self._result_q, weights, backend, conf_thresh, threads),
+                                   daemon=True)
+                       for q in self._task_qs]
+        for p in self._procs:
+            p.start()
+        # stats
+        self.batches = 0
+        self.errors = 0
+        atexit.register(self.close)
+
+    def _slot_for(self, lane, nbytes):
+        slot = self._slots.get(lane)
+        if slot is None or slot.size < nbytes or slot.jobs:
+            # too small, or a timed-out task may still read it: never overwrite,
+            # use a new slot (workers re-attach on the new generation)
+            generation = slot.generation + 1 if slot is not None else 0
+            if slot is not None:
+                self._retire(slot)
+            slot = _LaneSlot(nbytes, generation)
+            self._slots[lane] = slot
+        return slot
+
+    def _retire(self, slot):
+        if slot.jobs:
+            self._retired.append(slot)  # closed once its last task is answered
+        else:
+            slot.close()
+
+    def _acknowledge(self, task_id):
+        for slot in self._jobs.pop(task_id, ()):
+            slot.jobs.discard(task_id)
+            if not slot.jobs and slot in self._retired:
+                self._retired.remove(slot)
+                slot.close()
+
+    def _drain(self):
+        """Acknowledge late results of timed-out tasks without waiting."""
+        while self._jobs:
+            try:
+                task_id, _, _ = self._result_q.get_nowait()
+            except queue.Empty:
+                return
+            self._acknowledge(task_id)
+
+    def _stage(self, lane, frame):
+        """Resize a frame directly into its lane's shared-memory slot."""
+        h, w = frame.shape[:2]
+        small_shape = (int(h * self.infer_width / w), self.infer_width, 3)
+        slot = self._slot_for(lane, int(np.prod(small_shape)))
+        cv2.resize(frame, (small_shape[1], small_shape[0]), dst=slot.view(small_shape))
+        return slot, (lane, slot.name, slot.generation, small_shape, frame.shape)
+
+    def infer(self, frames):
+        """frames: [(lane, frame)]. Returns {lane: detection array}."""
+        self._drain()
+        staged = [self._stage(lane, frame) for lane, frame in frames]
+        # round-robin lanes over the workers
+        shards = [staged[i::self.workers] for i in range(self.workers)]
+        pending = set()
+        for q, shard in zip(self._task_qs, shards):
+            if shard:
+                self._task_id += 1
+                slots = [slot for slot, _ in shard]
+                for slot in slots:
+                    slot.jobs.add(self._task_id)
+                self._jobs[self._task_id] = slots
+                q.put((self._task_id, [item for _, item in shard]))
+                pending.add(self._task_id)
+
+        out = {}
+        while pending:
+            try:
+                task_id, lane_dets, error = self._result_q.get(timeout=self.timeout)
+            except queue.Empty:
+                self.errors += 1
+                print("[POOL] Inference timed out")
+                break
+            self._acknowledge(task_id)
+            if task_id not in pending:
+                continue  # stale result from a timed-out batch
+            pending.discard(task_id)
+            if error:
+                self.errors += 1
+                print(f"[POOL] Worker error: {error}")
+            out.update(lane_dets)
+        self.batches += 1
+        return out
+
+    def close(self):
+        for q in self._task_qs:
+            try:
+                q.put(None)
+            except (OSError, ValueError):
+                pass
+        for p in self._procs:
+            p.join(timeout=2.0)
+        for slot in list(self._slots.values()) + self._retired:
+            slot.close()
+        self._slots = {}
+        self._retired = []
+        self._jobs = {}
@@ -0,0 +1,113 @@
+# intersections.py
+"""
+Vectorized signal engine for many intersections.
+
+The state of N intersections lives in NumPy arrays, one entry (or row) per
+intersection: the lane whose turn it is in the normal cycle, when that turn
+started, the mode, the priority lane and the light of every lane. step()
+advances all of them at once with array operations, so a corridor of
+thousands of intersections costs about as many Python calls per tick as
+a single one.
+
+Sensors only set inputs: ambulance[i] is the lane an emergency vehicle is
+approaching at intersection i (-1 for none) and receding[i] tells that a
+siren is driving away. traffic_controller.TrafficController is a one-row
+view over an engine with the original single-intersection API.
+
+    engine = IntersectionEngine(1000, offsets=np.arange(1000) * 2.0)  # green wave
+    engine.ambulance[17] = 2  # lane S
+    engine.step(time.time())
+    engine.lights[17]  # light codes per lane (records.LIGHT_STATES)
+"""
+
+import numpy as np
+from records import LIGHT_CODE
+
+# Timing for normal cycle (8 seconds per lane: 6s GREEN + 1s YELLOW + 1s RED)
+GREEN_TIME = 6.0      # 6 seconds green per lane in normal mode
+YELLOW_TIME = 1.0     # 1 second yellow
+RED_TIME = 1.0        # 1 second red (transition time)
+CYCLE_TIME = GREEN_TIME + YELLOW_TIME + RED_TIME  # 8 seconds total per lane
+POST_PRIORITY_BUFFER = 0.0  # seconds after ambulance before returning to normal (set to 0 to remove delay)
+
+MODES = ("NORMAL", "PRIORITY")
+NORMAL, PRIORITY = 0, 1
+NO_LANE = -1
+RED, YELLOW, GREEN = LIGHT_CODE["RED"], LIGHT_CODE["YELLOW"], LIGHT_CODE["GREEN"]
+
+class IntersectionEngine:
+    """Signal state of n intersections with `lanes` approaches each.
+
+    green/yellow/red: per-lane phase durations in seconds, scalars or one
+    value per intersection. offsets: seconds each intersection's cycle is
+    shifted by (e.g. a green wave along a corridor).
+    """
+
+    def __init__(self, n, lanes=4, green=GREEN_TIME, yellow=YELLOW_TIME, red=RED_TIME,
+                 offsets=0.0, now=0.0, post_priority=POST_PRIORITY_BUFFER):
+        self.n = n
+        self.lanes = lanes
+        self.green = np.broadcast_to(np.asarray(green, dtype=np.float64), (n,)).copy()
+        self.yellow = np.broadcast_to(np.asarray(yellow, dtype=np.float64), (n,)).copy()
+        self.cycle = self.green + self.yellow + np.broadcast_to(np.asarray(red, dtype=np.float64), (n,))
+        self.post_priority = post_priority
+        # state
+        self.phase = np.zeros(n, dtype=np.int8)  # lane whose turn it is (0=N, 1=E, ...)
+        self.last_switch = now - np.broadcast_to(np.asarray(offsets, dtype=np.float64), (n,))
+        self.mode = np.full(n, NORMAL, dtype=np.int8)
+        self.priority = np.full(n, NO_LANE, dtype=np.int8)
+        self.priority_start = np.zeros(n)
+        self.last_emergency = np.zeros(n)
+        self.lights = np.full((n, lanes), RED, dtype=np.int8)
+        self.lights[:, 0] = GREEN  # lane 0 starts green
+        # inputs, set by sensors before a step
+        self.ambulance = np.full(n, NO_LANE, dtype=np.int8)
+        self.receding = np.zeros(n, dtype=bool)
+        self._rows = np.arange(n)
+
+    def set_priority(self, idx, lanes, now):
+        """Give lanes (one per index in idx) green, all others red."""
+        self.mode[idx] = PRIORITY
+        self.priority[idx] = lanes
+        self.priority_start[idx] = now
+        self.last_switch[idx] = now
+        self.lights[idx] = RED
+        self.lights[idx, lanes] = GREEN
+
+    def normal_cycle_step(self, idx, now):
+        """Advance the normal N->E->S->W cycle of intersections idx (indices or a slice) to now."""
+        phase = self.phase[idx]
+        last_switch = self.last_switch[idx]
+        switch = now - last_switch > self.cycle[idx]
+        phase = np.where(switch, (phase + 1) % self.lanes, phase)
+        last_switch = np.where(switch, now, last_switch)
+        self.phase[idx] = phase
+        self.last_switch[idx] = last_switch
+        elapsed = now - last_switch
+        green = self.green[idx]
+        code = np.where(elapsed <= green, GREEN,
+                        np.where(elapsed <= green + self.yellow[idx], YELLOW, RED))
+        self.lights[idx] = RED
+        self.lights[self._rows[idx], phase] = code
+
+    def step(self, now):
+        """Advance every intersection to time now from the current inputs.
+
+        An intersection with an ambulance gets (or keeps) priority for that
+        lane; one without returns to the normal cycle once the siren recedes
+        or post_priority seconds passed since its last emergency.
+        """
+        has = self.ambulance >= 0
+        if has.any():
+            idx = np.flatnonzero(has)
+            self.set_priority(idx, self.ambulance[idx], now)
+            self.last_emergency[idx] = now
+        release = (~has & (self.mode == PRIORITY)
+                   & (self.receding | (now - self.last_emergency > self.post_priority)))
+        self.mode[release] = NORMAL
+        self.priority[release] = NO_LANE
+        normal = ~has & (self.mode == NORMAL)
+        if normal.all():
+            self.normal_cycle_step(slice(None), now)
+        elif normal.any():
+            self.normal_cycle_step(np.flatnonzero(normal), now)
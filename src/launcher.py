@@ -180,35 +180,37 @@ def main():
             if not os.path.exists("main_enhanced.py"):
                 print("Creating main_enhanced.py...")
                 with open("main_enhanced.py", "w") as f:
-                    f.write("""import time
-import threading
-from camera_detection import start_camera_thread
-from sound_detection import start_audio_thread
-from traffic_controller import controller
+                    f.write("""from runtime import Runtime, build_intersection
 from enhanced_visualization import EnhancedTrafficUI
-from utils import shared_state
+from utils import LIGHTS_TOPIC, OVERHEAD_TOPIC, SIREN_TOPIC, detections_topic, shared_state
 
 def main_loop():
-    start_camera_thread(0)
-    start_audio_thread()
+    # camera, audio and controller as supervised stages (restarted on failure)
+    runtime = Runtime()
+    build_intersection(runtime, camera_index=0)
+    runtime.start_thread()
     ui = EnhancedTrafficUI(1400, 900)
+    sub = shared_state.subscribe(LIGHTS_TOPIC, OVERHEAD_TOPIC, SIREN_TOPIC,
+                                 *(detections_topic(lane) for lane in "NESW"))
     running = True
     try:
         while running:
             for event in __import__("pygame").event.get():
                 if event.type == __import__("pygame").QUIT:
                     running = False
-            lights, mode, pr = controller.update()
-            with shared_state.lock:
-                amb_det = shared_state.ambulance_detected
-                siren_det = shared_state.siren_detected
-                detections = shared_state.detections.copy()
+            snap = shared_state.snapshot()
+            lights, mode, pr = snap.control.lights, snap.control.mode, snap.control.priority_lane
+            amb_det = {lane: s.ambulance for lane, s in snap.lanes.items()}
+            siren_det = snap.audio.siren_detected
+            detections = {lane: s.detections for lane, s in snap.lanes.items()}
             ui.draw(lights, mode, pr, detections, amb_det, siren_det)
-            time.sleep(0.02)
+            sub.wait(timeout=0.05)  # until new state, still handling window events
     except KeyboardInterrupt:
         pass
     finally:
         ui.quit()
+        runtime.stop()
+        runtime.join()
         print("Exiting...")
 
 if __name__ == "__main__":
@@ -282,8 +284,7 @@ if __name__ == "__main__":
             print("  2. Read ENHANCEMENTS.md for detailed documentation")
             print("  3. Check README.md for original system info\n")
             print("For custom scripts, you can import:")
-            print("  from camera_detection import start_camera_thread")
-            print("  from sound_detection import start_audio_thread")
+            print("  from runtime import Runtime, build_intersection")
             print("  from traffic_controller import controller")
             print("  from utils import shared_state\n")
         
@@ -1,19 +1,65 @@
 # main.py
-import time
-import threading
-from camera_detection import start_camera_thread
-from sound_detection import start_audio_thread
-from traffic_controller import controller
-from ui_simulation import TrafficUI
-from utils import shared_state
-
-def main_loop():
-    # start sensors
-    start_camera_thread(0)
-    start_audio_thread()
+import argparse
+import asyncio
+from runtime import Runtime, add_controller_stage, build_intersection
+from utils import LIGHTS_TOPIC, OVERHEAD_TOPIC, SIREN_TOPIC, detections_topic, shared_state
+from detections import LANES
 
+UI_EVENT_INTERVAL = 0.05  # seconds; longest wait before handling window events
+DEFAULT_SEGMENT = "emergency_traffic_state"
+
+# what each process role runs, and the shared-memory parts it
+# (exports, follows): every part has exactly one exporting role
+ROLES = {
+    "all": (("lanes", "audio", "control"), ("params",)),  # everything in one process
+    "sensors": (("lanes", "audio"), ()),  # cameras, detection and audio only
+    "controller": (("control",), ("lanes", "audio")),  # the traffic controller only
+    "ui": ((), ("lanes", "audio", "control")),  # the pygame UI only
+}
+
+def run_headless(runtime):
+    """Run the stages in this thread until Ctrl+C / SIGTERM."""
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        pass
+    print(runtime.report())
+
+def main_loop(camera_sources=None, audio_channels=1, share=None, role="all"):
+    # start sensors: camera_sources maps lane -> camera index/video path for
+    # one camera per approach; otherwise a single overhead camera is used.
+    # audio_channels=4 uses a mic array to locate sirens per lane (doa.py)
+    # share: name of a shared-memory segment to publish the state to (shm_state.py)
+    # role: run only part of the intersection in this process (ROLES); the
+    # other roles run in their own processes attached to the same segment
+    # sensors, inference and the controller run as supervised stages
+    # (runtime.py): a camera that fails is reopened with backoff
+    if share:
+        from shm_state import share as share_state
+        export, follow = ROLES[role]
+        share_state(export=export, follow=follow, name=share)
+
+    runtime = None
+    if role in ("all", "sensors"):
+        runtime = Runtime()
+        build_intersection(runtime, camera_sources=camera_sources, camera_index=0,
+                           audio_channels=audio_channels, controller=role == "all")
+    elif role == "controller":
+        runtime = Runtime()
+        add_controller_stage(runtime)
+    if role != "all" and role != "ui":
+        run_headless(runtime)
+        return
+    if runtime is not None:
+        runtime.start_thread()
+
+    from ui_simulation import TrafficUI
     ui = TrafficUI(1100, 700)
     running = True
+    # redraw only when something shown on screen was published
+    sub = shared_state.subscribe(LIGHTS_TOPIC, OVERHEAD_TOPIC, SIREN_TOPIC,
+                                 *(detections_topic(lane) for lane in LANES))
+    dirty = True
 
     try:
         while running:
@@ -22,19 +68,35 @@ def main_loop():
                 if event.type == __import__("pygame").QUIT:
                     running = False
 
-            # update controller
-            lights, mode, pr = controller.update()
-
             # render UI
-            ui.draw(lights, mode, pr)
+            if dirty:
+                control = shared_state.control
+                ui.draw(control.lights, control.mode, control.priority_lane)
 
-            # small sleep to free CPU a bit
-            time.sleep(0.02)
+            # sleep until new state arrives (window events are still handled)
+            dirty = bool(sub.wait(timeout=UI_EVENT_INTERVAL))
     except KeyboardInterrupt:
         pass
     finally:
         ui.quit()
         print("Exiting...")
+        if runtime is not None:
+            runtime.stop()
+            runtime.join()
+            print(runtime.report())
 
 if __name__ == "__main__":
-    main_loop()
+    parser = argparse.ArgumentParser(
+        description="Emergency Traffic AI",
+        epilog="One process per role: python main.py --role sensors & "
+               "python main.py --role controller & python main.py --role ui")
+    parser.add_argument("--share", nargs="?", const=DEFAULT_SEGMENT, default=None,
+                        metavar="NAME",
+                        help="Publish the state to shared memory (flask_dashboard.py --attach)")
+    parser.add_argument("--role", choices=list(ROLES), default="all",
+                        help="Run only the sensors, the controller or the UI in this process, "
+                             "sharing state through the --share segment (default: everything)")
+    args = parser.parse_args()
+    if args.role != "all" and args.share is None:
+        args.share = DEFAULT_SEGMENT  # roles only work together through the segment
+    main_loop(share=args.share, role=args.role)
@@ -0,0 +1,73 @@
+# model_registry.py
+"""
+Lazy, shared detector models.
+
+Nothing is loaded at import time. The first call to get_model() loads the
+weights, runs a few warmup passes on a blank frame so the first real frame
+doesn't pay the cold-start cost, and caches the instance so every camera
+worker in the process shares it. Load and warmup times are recorded.
+"""
+
+import threading
+import time
+import numpy as np
+
+DEFAULT_WEIGHTS = "yolov8n.pt"  # ultralytics downloads it on first load
+DEFAULT_BACKEND = "torch"  # see detector_backends.BACKENDS
+INFER_WIDTH = 640  # frames are resized to this width before inference
+WARMUP_RUNS = 2
+WARMUP_SHAPE = (480, 640, 3)
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self.timings = {}  # (weights, backend) -> {"load": s, "warmup": s, ...}
+
+    def get(self, weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND,
+            warmup_runs=WARMUP_RUNS, warmup_shape=WARMUP_SHAPE, warmup_batch=1):
+        key = (weights, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            # another worker may have loaded it while we waited
+            model = self._models.get(key)
+            if model is None:
+                model = self._load(weights, backend, warmup_runs, warmup_shape, warmup_batch)
+                self._models[key] = model
+        return model
+
+    def _load(self, weights, backend, warmup_runs, warmup_shape, warmup_batch):
+        from detector_backends import export_model, load_model
+
+        t0 = time.time()
+        model = load_model(export_model(weights, backend))
+        load_time = time.time() - t0
+
+        t0 = time.time()
+        dummy = [np.zeros(warmup_shape, dtype=np.uint8)] * warmup_batch
+        for _ in range(warmup_runs):
+            model(dummy if warmup_batch > 1 else dummy[0], verbose=False)
+        warmup_time = time.time() - t0
+
+        self.timings[(weights, backend)] = {
+            "load": load_time,
+            "warmup": warmup_time,
+            "warmup_runs": warmup_runs,
+        }
+        print(f"[MODEL] Loaded {weights} ({backend}) in {load_time:.2f}s, "
+              f"warmup ({warmup_runs} runs) {warmup_time:.2f}s")
+        return model
+
+    def is_loaded(self, weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND):
+        return (weights, backend) in self._models
+
+    def stats(self):
+        return dict(self.timings)
+
+# Process-wide registry shared by all camera workers
+registry = ModelRegistry()
+
+def get_model(weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND, **kwargs):
+    return registry.get(weights, backend, **kwargs)
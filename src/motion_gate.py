@@ -0,0 +1,81 @@
+# motion_gate.py
+"""
+Motion-gated inference scheduling.
+
+A cheap pre-stage that compares a heavily downsampled grayscale frame against
+a running background model. Lanes with motion are inferred at the ceiling
+rate; quiet lanes back off to the floor rate until motion shows up again.
+"""
+
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """Decides per frame whether a lane needs a full detector pass."""
+
+    def __init__(self, min_rate=1.0, max_rate=15.0, threshold=0.01,
+                 pixel_delta=15, size=(80, 60), alpha=0.05, hold=2.0):
+        """
+        min_rate / max_rate: inferences per second on quiet / moving lanes.
+        threshold: fraction of changed pixels that counts as motion.
+        pixel_delta: grayscale difference for a pixel to count as changed.
+        size: (w, h) of the downsampled frame used for differencing.
+        alpha: background learning rate.
+        hold: seconds to stay at full rate after the last motion.
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.size = size
+        self.alpha = alpha
+        self.hold = hold
+
+        self._background = None
+        self._gray = np.empty((size[1], size[0]), dtype=np.float32)
+        self.last_motion = 0.0
+        self.last_inference = 0.0
+        self.last_score = 0.0
+        # counters
+        self.inferred = 0
+        self.skipped = 0
+
+    def motion_score(self, frame):
+        """Fraction of downsampled pixels that differ from the background."""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        self._gray[:] = small
+        if self._background is None:
+            self._background = self._gray.copy()
+            return 1.0
+        diff = cv2.absdiff(self._gray, self._background)
+        cv2.accumulateWeighted(self._gray, self._background, self.alpha)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def active(self, now):
+        return now - self.last_motion < self.hold
+
+    def should_infer(self, frame, now=None):
+        now = time.time() if now is None else now
+        self.last_score = self.motion_score(frame)
+        if self.last_score >= self.threshold:
+            self.last_motion = now
+        rate = self.max_rate if self.active(now) else self.min_rate
+        # 10% slack so capture jitter doesn't halve the effective rate
+        if now - self.last_inference >= 0.9 / rate:
+            self.last_inference = now
+            self.inferred += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        total = self.inferred + self.skipped
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / total if total else 0.0,
+            "motion": self.last_score,
+        }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Offline high-throughput analysis of recorded intersection video.
+
+Takes one recording per lane, splits each into fixed-length segments and
+processes the segments in parallel worker processes, decoding and detecting
+as fast as the hardware allows (no real-time sleeps). Results are written to
+an output directory:
+
+- timeline.csv          one row per analysed frame and lane:
+                        frame, time_s, lane, vehicles, emergency
+- detections_<lane>.npy every detection of a lane (DETECTION_DTYPE plus a
+                        "frame" column)
+
+Each segment runs its own tracker, so emergency status needs a couple of
+frames to confirm at the start of every segment.
+
+Usage:
+    python offline_analysis.py --lane N=north.mp4 --lane E=east.mp4 --out results/
+    python offline_analysis.py --lane N=north.mp4 --segment-seconds 120 --workers 8 --stride 2
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import detections
+from detections import DETECTION_DTYPE
+from model_registry import DEFAULT_BACKEND, DEFAULT_WEIGHTS
+
+OFFLINE_DTYPE = np.dtype(DETECTION_DTYPE.descr + [("frame", np.int32)])
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open {path}")
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    return frames, fps
+
+def plan_segments(video_paths, segment_seconds):
+    """Split every lane's recording into (lane, path, start, end, fps) tasks."""
+    tasks = []
+    for lane, path in video_paths.items():
+        n_frames, fps = video_info(path)
+        seg_len = max(1, int(segment_seconds * fps))
+        for start in range(0, n_frames, seg_len):
+            tasks.append((lane, path, start, min(start + seg_len, n_frames), fps))
+    return tasks
+
+def _init_worker(threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def process_segment(lane, path, start, end, fps, stride=1, batch=8, conf=0.35,
+                    weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND):
+    """Worker: decode [start, end) of one recording and detect every stride-th frame.
+
+    Returns (lane, start, frame_idx, vehicles, emergency, detections).
+    """
+    from camera_detection import resize_for_inference
+    from model_registry import get_model
+    from tracker import IoUTracker
+
+    model = get_model(weights, backend, warmup_batch=batch)
+    tracker = IoUTracker()
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    frame_idx, vehicles, emergency, all_dets = [], [], [], []
+    pending = []  # (frame_no, frame) waiting for a full batch
+
+    def flush():
+        smalls = [resize_for_inference(f) for _, f in pending]
+        results = model(smalls, conf=conf, verbose=False)
+        for (frame_no, frame), small, res in zip(pending, smalls, results):
+            dets = tracker.update(detections.from_yolo(res, frame.shape, small.shape, lane=lane),
+                                  frame_no / fps)
+            frame_idx.append(frame_no)
+            vehicles.append(len(dets))
+            emergency.append(tracker.has_emergency())
+            out = np.empty(len(dets), dtype=OFFLINE_DTYPE)
+            for name in DETECTION_DTYPE.names:
+                out[name] = dets[name]
+            out["frame"] = frame_no
+            all_dets.append(out)
+        pending.clear()
+
+    for frame_no in range(start, end):
+        if frame_no % stride:
+            # grab() skips the decode of frames we don't analyse
+            if not cap.grab():
+                break
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        pending.append((frame_no, frame))
+        if len(pending) >= batch:
+            flush()
+    if pending:
+        flush()
+    cap.release()
+
+    dets = np.concatenate(all_dets) if all_dets else np.empty(0, dtype=OFFLINE_DTYPE)
+    return lane, start, np.array(frame_idx, np.int32), np.array(vehicles, np.int32), \
+        np.array(emergency, np.bool_), dets
+
+def analyze(video_paths, out_dir, segment_seconds=60.0, workers=None, stride=1,
+            batch=8, conf=0.35, weights=DEFAULT_WEIGHTS, backend=DEFAULT_BACKEND):
+    """Process all recordings in parallel and write the timeline to out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = plan_segments(video_paths, segment_seconds)
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"[OFFLINE] {len(tasks)} segments over {len(video_paths)} lane(s), {workers} workers")
+
+    fps_by_lane = {lane: fps for lane, _, _, _, fps in tasks}
+    t0 = time.time()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        futures = [pool.submit(process_segment, lane, path, start, end, fps,
+                               stride, batch, conf, weights, backend)
+                   for lane, path, start, end, fps in tasks]
+        for done, fut in enumerate(as_completed(futures), 1):
+            lane, start, *rest = fut.result()
+            results[(lane, start)] = rest
+            print(f"\r[OFFLINE] {done}/{len(tasks)} segments", end="", flush=True)
+    print()
+
+    frames_total = 0
+    with open(os.path.join(out_dir, "timeline.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "time_s", "lane", "vehicles", "emergency"])
+        for lane in video_paths:
+            keys = sorted(k for k in results if k[0] == lane)
+            lane_dets = []
+            for key in keys:
+                frame_idx, vehicles, emergency, dets = results[key]
+                fps = fps_by_lane[lane]
+                writer.writerows(zip(frame_idx.tolist(), np.round(frame_idx / fps, 3).tolist(),
+                                     [lane] * len(frame_idx), vehicles.tolist(),
+                                     emergency.astype(int).tolist()))
+                lane_dets.append(dets)
+                frames_total += len(frame_idx)
+            np.save(os.path.join(out_dir, f"detections_{lane}.npy"),
+                    np.concatenate(lane_dets) if lane_dets else np.empty(0, OFFLINE_DTYPE))
+
+    elapsed = time.time() - t0
+    print(f"[OFFLINE] {frames_total} frames in {elapsed:.1f}s "
+          f"({frames_total / max(elapsed, 1e-6):.1f} frames/s) -> {out_dir}")
+    return frames_total, elapsed
+
+def parse_lane_paths(items):
+    """["N=north.mp4", ...] -> {"N": "north.mp4", ...}"""
+    paths = {}
+    for item in items or []:
+        lane, sep, path = item.partition("=")
+        lane = lane.upper()
+        if not sep or lane not in detections.LANES:
+            raise ValueError(f"Expected LANE=path with LANE in N/E/S/W, got {item!r}")
+        paths[lane] = path
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline analysis of recorded intersection video")
+    parser.add_argument("--lane", action="append", required=True,
+                        help="LANE=path, one per recorded approach (e.g. N=north.mp4)")
+    parser.add_argument("--out", default="offline_results", help="Output directory")
+    parser.add_argument("--segment-seconds", type=float, default=60.0,
+                        help="Length of the segments processed in parallel")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--stride", type=int, default=1, help="Analyse every Nth frame")
+    parser.add_argument("--batch", type=int, default=8, help="Frames per forward pass")
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    analyze(parse_lane_paths(args.lane), args.out, segment_seconds=args.segment_seconds,
+            workers=args.workers, stride=args.stride, batch=args.batch, conf=args.conf,
+            backend=args.backend)
+
+if __name__ == "__main__":
+    main()
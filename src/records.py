@@ -0,0 +1,94 @@
+# records.py
+"""
+Compact light-state records and the JSON the dashboard needs.
+
+Detections already are one structured array per frame (detections.py).
+Lights are four byte codes behind a read-only mapping (Lights), so they
+still read like the {"N": "GREEN", ...} dicts everywhere.
+
+The demo's vehicles stay dicts in per-lane lists: at a dozen per lane a
+record array's NumPy call overhead costs more than the dicts do.
+"""
+
+from collections.abc import Mapping
+from operator import itemgetter
+from detections import LANES, LANE_INDEX, to_dicts
+
+LIGHT_STATES = ("RED", "YELLOW", "GREEN")
+LIGHT_CODE = {state: i for i, state in enumerate(LIGHT_STATES)}
+_lane_states = itemgetter(*LANES)
+
+class Lights(Mapping):
+    """Immutable lane -> light state mapping, one byte code per lane.
+
+    There are only 3 ** 4 distinct states, so instances are shared: build them
+    with Lights.from_codes(codes) or Lights.from_mapping(), and publishing the same
+    lights again allocates nothing.
+    """
+
+    __slots__ = ("codes",)
+    _shared = {}  # codes -> instance
+    _by_states = {}  # per-lane state names (None: missing) -> instance
+
+    def __init__(self, codes):
+        self.codes = bytes(codes)
+
+    @classmethod
+    def from_codes(cls, codes):
+        """The shared instance for a sequence of per-lane codes (LANES order)."""
+        codes = bytes(codes)
+        lights = cls._shared.get(codes)
+        if lights is None:
+            lights = cls._shared.setdefault(codes, cls(codes))
+        return lights
+
+    @classmethod
+    def from_mapping(cls, lights):
+        """The shared instance for a lane -> state mapping (missing lanes RED)."""
+        if type(lights) is Lights:  # not isinstance: the ABC check costs more than the rest
+            return lights
+        try:
+            states = _lane_states(lights)
+        except KeyError:
+            states = tuple(map(lights.get, LANES))
+        shared = cls._by_states.get(states)
+        if shared is None:
+            codes = [LIGHT_CODE[state or "RED"] for state in states]
+            shared = cls._by_states.setdefault(states, cls.from_codes(codes))
+        return shared
+
+    def __getitem__(self, lane):
+        return LIGHT_STATES[self.codes[LANE_INDEX[lane]]]
+
+    def __iter__(self):
+        return iter(LANES)
+
+    def __len__(self):
+        return len(LANES)
+
+    def __eq__(self, other):
+        if isinstance(other, Lights):
+            return self.codes == other.codes
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        return hash(self.codes)
+
+    def __repr__(self):
+        return f"Lights({dict(self)})"
+
+    def to_json(self):
+        return {lane: LIGHT_STATES[c] for lane, c in zip(LANES, self.codes)}
+
+def status_json(snap, with_detections=False):
+    """The dashboard's /api/status payload from a StateSnapshot (utils.py)."""
+    control = snap.control
+    out = {
+        "lights": Lights.from_mapping(control.lights).to_json(),
+        "mode": control.mode,
+        "priority_lane": control.priority_lane,
+        "ambulance_detected": {lane: s.ambulance for lane, s in snap.lanes.items()},
+    }
+    if with_detections:
+        out["detections"] = {lane: to_dicts(s.detections) for lane, s in snap.lanes.items()}
+    return out
@@ -13,8 +13,11 @@ import threading
 import time
 import sys
 from demo import DemoCamera, DemoAudio
+from traffic_controller import start_controller_thread
 
 def start_demo_threads(video=None, audio=None):
+    start_controller_thread()
+
     cam = DemoCamera(video)
     cam_thread = threading.Thread(target=cam.run, daemon=True)
     cam_thread.start()
@@ -0,0 +1,518 @@
+# runtime.py
+"""
+Supervised asyncio runtime for the sensor and control loops.
+
+Capture, inference, publishing, audio and the controller run as stages on
+one event loop instead of bare daemon threads. A stage is a coroutine;
+blocking work (camera reads, YOLO, PortAudio) runs in the runtime's thread
+pool via stage.call(), so the loop itself only moves items between stages.
+
+Stages are connected by bounded Channels. A full channel either blocks the
+producer (backpressure, e.g. detections waiting to be published) or, for
+camera frames, drops the oldest item (latest frame wins). Either way
+nothing queues up without bound, and the counters show where items wait.
+
+Every stage is supervised: when it raises, the error is logged and the
+stage is restarted after an exponential backoff (reset once it has run
+cleanly for a while). A watchdog flags a running stage that has produced
+nothing for stall_after seconds. stop() (or Ctrl+C / SIGTERM when run in
+the main thread) shuts down gracefully: producers stop, consumers drain
+what is already queued, blocking loops see the stop event, and whatever is
+still running after the grace period is cancelled.
+
+    runtime = Runtime()
+    build_intersection(runtime, camera_sources={"N": 0, "E": "east.mp4"})
+    runtime.start_thread()
+    ...
+    print(runtime.report())
+    runtime.stop(); runtime.join()
+
+Run `python runtime.py --lane N=0 --lane E=east.mp4` for a headless
+intersection that prints the stage and queue statistics.
+"""
+
+import argparse
+import asyncio
+import functools
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+GRACE = 3.0  # seconds stages get to finish after stop()
+BACKOFF = 0.5  # first restart delay, doubled per consecutive failure
+MAX_BACKOFF = 30.0
+RESET_AFTER = 10.0  # a stage that ran this long before failing restarts after BACKOFF again
+WATCHDOG_INTERVAL = 1.0
+
+class ChannelClosed(Exception):
+    """Raised by Channel.get() once the channel is closed and drained."""
+
+_CLOSED = object()
+
+class Channel:
+    """Bounded queue between two stages.
+
+    drop_oldest=False: put() waits while the channel is full (backpressure).
+    drop_oldest=True: put() never waits; the oldest item is discarded.
+    """
+
+    def __init__(self, name, maxsize, drop_oldest=False):
+        self.name = name
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+        self._closing = None
+        # stats
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.blocked = 0.0  # seconds producers waited on a full channel
+
+    async def put(self, item):
+        if self.closed:
+            raise ChannelClosed(self.name)
+        if self.drop_oldest:
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(item)
+        elif self.queue.full():
+            t0 = time.perf_counter()
+            await self.queue.put(item)
+            self.blocked += time.perf_counter() - t0
+        else:
+            self.queue.put_nowait(item)
+        self.put_count += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def get(self):
+        item = await self.queue.get()
+        if item is _CLOSED:
+            self.queue.put_nowait(_CLOSED)  # for any other consumer
+            raise ChannelClosed(self.name)
+        self.get_count += 1
+        return item
+
+    async def get_batch(self, key):
+        """Wait for one item, then take everything queued; newest per key(item) wins."""
+        newest = {}
+        item = await self.get()
+        while True:
+            newest[key(item)] = item
+            if self.queue.empty():
+                return list(newest.values())
+            item = self.queue.get_nowait()
+            if item is _CLOSED:
+                # leave it for the next get(), after this batch
+                self.queue.put_nowait(_CLOSED)
+                return list(newest.values())
+            self.get_count += 1
+
+    def close(self):
+        """No more puts; consumers get the queued items, then ChannelClosed."""
+        self.closed = True
+        if self.queue.full():
+            if not self.drop_oldest:
+                # behind any blocked producer, once a consumer makes room
+                self._closing = asyncio.ensure_future(self.queue.put(_CLOSED))
+                return
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(_CLOSED)
+
+    def stats(self):
+        return {
+            "depth": self.queue.qsize() - (1 if self.closed and not self.queue.empty() else 0),
+            "maxsize": self.maxsize,
+            "put": self.put_count,
+            "got": self.get_count,
+            "dropped": self.dropped,
+            "max_depth": self.max_depth,
+            "blocked_s": round(self.blocked, 3),
+        }
+
+class Stage:
+    """One supervised stage; passed to its own coroutine function."""
+
+    def __init__(self, runtime, name, func, restart=True, stall_after=None, stats=None):
+        self.runtime = runtime
+        self.name = name
+        self.func = func
+        self.restart = restart
+        self.stall_after = stall_after  # seconds without count() before the watchdog warns
+        self.extra_stats = stats  # callable returning more counters, or None
+        self.state = "idle"
+        self.restarts = 0
+        self.failures = 0
+        self.stalls = 0
+        self.stalled = False
+        self.last_error = None
+        self.processed = 0
+        self.rate = 0.0  # items/s over the last full second
+        self.last_item = None
+        self._window_start = None
+        self._window_count = 0
+
+    @property
+    def active(self):
+        """False once the runtime is stopping; loops should then return."""
+        return not self.runtime.stop_event.is_set()
+
+    def count(self, n=1):
+        """Record n processed items (throughput and stall detection)."""
+        now = time.monotonic()
+        self.processed += n
+        self.last_item = now
+        self.stalled = False
+        if self._window_start is None:
+            self._window_start = now
+        self._window_count += n
+        if now - self._window_start >= 1.0:
+            self.rate = self._window_count / (now - self._window_start)
+            self._window_start, self._window_count = now, 0
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking function in the runtime's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.runtime.executor,
+                                          functools.partial(func, *args, **kwargs))
+
+    def idle_for(self):
+        since = self.last_item if self.last_item is not None else self.runtime.started_at
+        return time.monotonic() - since if since is not None else 0.0
+
+    def stats(self):
+        out = {
+            "state": self.state,
+            "processed": self.processed,
+            "rate": round(self.rate, 2),
+            "idle_s": round(self.idle_for(), 2),
+            "restarts": self.restarts,
+            "failures": self.failures,
+            "stalls": self.stalls,
+            "last_error": self.last_error,
+        }
+        if self.extra_stats is not None:
+            out.update(self.extra_stats())
+        return out
+
+def blocking(func, *args, **kwargs):
+    """Stage body for a blocking loop func(*args, stop=<threading.Event>, tick=<callable>, **kwargs).
+
+    The loop runs in the thread pool and must return once stop is set; it
+    calls tick(n=1) per item it handles, which is stage.count, so the stats
+    and the watchdog cover it (camera_loop, SirenStream.run and
+    ControllerScheduler.run all take stop and tick).
+    """
+    async def body(stage):
+        await stage.call(func, *args, stop=stage.runtime.stop_event, tick=stage.count, **kwargs)
+    body.__name__ = getattr(func, "__name__", "blocking")
+    return body
+
+class Runtime:
+    """Runs and supervises stages on one asyncio event loop."""
+
+    def __init__(self, grace=GRACE, backoff=BACKOFF, max_backoff=MAX_BACKOFF,
+                 reset_after=RESET_AFTER, verbose=True):
+        self.grace = grace
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reset_after = reset_after
+        self.verbose = verbose
+        self.stages = {}
+        self.channels = {}
+        self.stop_event = threading.Event()  # seen by blocking loops and stage.active
+        self.executor = None
+        self.started_at = None
+        self._loop = None
+        self._stopping = None  # asyncio.Event mirror of stop_event
+        self._thread = None
+        self._on_stop = []
+
+    def log(self, message):
+        if self.verbose:
+            print(f"[RUNTIME] {message}")
+
+    def channel(self, name, maxsize, drop_oldest=False):
+        ch = self.channels[name] = Channel(name, maxsize, drop_oldest)
+        return ch
+
+    def on_stop(self, callback):
+        """Call callback() when shutdown begins (e.g. to end a loop with a running flag)."""
+        self._on_stop.append(callback)
+
+    def stage(self, name, func, restart=True, stall_after=None, stats=None):
+        """Add a stage: func is `async def func(stage)`, run until it returns."""
+        st = self.stages[name] = Stage(self, name, func, restart, stall_after, stats)
+        return st
+
+    async def _supervise(self, st):
+        delay = self.backoff
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            st.state = "running"
+            try:
+                await st.func(st)
+                if self.stop_event.is_set():
+                    break
+                self.log(f"{st.name} finished")
+                st.state = "finished"
+                return
+            except ChannelClosed:
+                st.state = "stopped"
+                return
+            except asyncio.CancelledError:
+                st.state = "cancelled"
+                raise
+            except Exception as e:
+                st.failures += 1
+                st.last_error = f"{type(e).__name__}: {e}"
+                if self.stop_event.is_set():
+                    break
+                if not st.restart:
+                    self.log(f"{st.name} failed: {st.last_error}")
+                    st.state = "failed"
+                    return
+            if time.monotonic() - started >= self.reset_after:
+                delay = self.backoff
+            self.log(f"{st.name} failed: {st.last_error}; restarting in {delay:.1f}s")
+            st.state = "backoff"
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.max_backoff)
+            st.restarts += 1
+        st.state = "stopped"
+
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            for st in self.stages.values():
+                if st.stall_after is None or st.state != "running" or st.stalled:
+                    continue
+                if st.idle_for() >= st.stall_after:
+                    st.stalled = True  # reported once per stall
+                    st.stalls += 1
+                    self.log(f"{st.name} stalled: nothing for {st.idle_for():.1f}s")
+
+    async def run(self):
+        """Run all stages until stop(); then shut down gracefully."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.stages) + 4,
+                                           thread_name_prefix="runtime")
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    self._loop.add_signal_handler(sig, self.stop)
+                except (NotImplementedError, RuntimeError):
+                    pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+        if self.stop_event.is_set():  # stop() before the loop was up
+            self._stopping.set()
+        tasks = {asyncio.create_task(self._supervise(st), name=st.name): st
+                 for st in self.stages.values()}
+        watchdog = asyncio.create_task(self._watchdog())
+        self.log(f"started {len(tasks)} stages")
+        try:
+            await self._stopping.wait()
+        finally:
+            for callback in self._on_stop:
+                callback()
+            for ch in self.channels.values():
+                ch.close()
+            done, pending = await asyncio.wait(tasks, timeout=self.grace) if tasks else ((), ())
+            for task in pending:
+                self.log(f"{tasks[task].name} did not stop within {self.grace}s; cancelling")
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            watchdog.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.log("stopped")
+
+    def stop(self):
+        """Request a graceful shutdown; safe from any thread or signal handler."""
+        self.stop_event.set()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass  # loop already finished
+
+    def start_thread(self):
+        """Run the event loop in a background thread (e.g. beside a pygame UI)."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),),
+                                        name="runtime", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout if timeout is not None else self.grace + 1.0)
+
+    def stats(self):
+        return {
+            "stages": {name: st.stats() for name, st in self.stages.items()},
+            "channels": {name: ch.stats() for name, ch in self.channels.items()},
+        }
+
+    def report(self):
+        lines = [f"{'stage':<16} {'state':<9} {'items':>8} {'rate/s':>8} {'idle s':>7} "
+                 f"{'restarts':>8}  last error"]
+        for name, st in self.stages.items():
+            lines.append(f"{name:<16} {st.state:<9} {st.processed:8d} {st.rate:8.1f} "
+                         f"{st.idle_for():7.1f} {st.restarts:8d}  {st.last_error or ''}")
+        if self.channels:
+            lines.append(f"{'channel':<16} {'depth':>9} {'put':>8} {'dropped':>8} {'blocked s':>9}")
+            for name, ch in self.channels.items():
+                s = ch.stats()
+                lines.append(f"{name:<16} {s['depth']:>4}/{s['maxsize']:<4} {s['put']:8d} "
+                             f"{s['dropped']:8d} {s['blocked_s']:9.2f}")
+        return "\n".join(lines)
+
+def add_lane_stages(runtime, sources, **engine_kwargs):
+    """Capture -> inference -> publish for one camera per lane.
+
+    sources: dict lane -> camera index or video path. Every capture stage
+    feeds one `frames` channel (newest frame per lane wins); inference runs
+    the newest frame of each lane as one batch and hands the results to the
+    publish stage through `detections`, which blocks inference when
+    publishing falls behind. Returns the LaneInferenceEngine.
+    """
+    from capture import CaptureSource
+    from camera_detection import LaneInferenceEngine
+
+    # created once: a restarted capture stage reopens the camera, keeping its frame pool
+    captures = {lane: CaptureSource(source, name=f"lane {lane}") for lane, source in sources.items()}
+    engine = LaneInferenceEngine({lane: c.ring for lane, c in captures.items()}, **engine_kwargs)
+    engine.captures = captures
+    frames = runtime.channel("frames", maxsize=2 * len(sources), drop_oldest=True)
+    results = runtime.channel("detections", maxsize=4)
+
+    def capture_stage(lane, src):
+        async def capture(stage):
+            cap = await stage.call(src.open)
+            try:
+                while stage.active:
+                    if await stage.call(src.read, cap):
+                        _, captured_at, frame = src.ring.latest()
+                        await frames.put((lane, captured_at, frame))
+                        stage.count()
+                    else:
+                        await asyncio.sleep(0.1)
+            finally:
+                cap.release()
+        return capture
+
+    async def infer(stage):
+        while True:
+            items = await frames.get_batch(key=lambda item: item[0])
+            start = time.monotonic()
+            batch, fresh = engine.select(items)
+            lane_results = await stage.call(engine.detect, batch, fresh)
+            await results.put((batch, lane_results, fresh))
+            stage.count(len(fresh))
+            # hold the engine's ceiling rate
+            remaining = engine.period - (time.monotonic() - start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    async def publish(stage):
+        while True:
+            batch, lane_results, fresh = await results.get()
+            engine.publish(batch, lane_results, fresh)
+            stage.count()
+
+    for lane, src in captures.items():
+        runtime.stage(f"capture:{lane}", capture_stage(lane, src), stall_after=5.0, stats=src.stats)
+    runtime.stage("infer", infer, stall_after=10.0,
+                  stats=lambda: {"batches": engine.batches,
+                                 "batch_ms": round(engine.last_batch_time * 1000, 1),
+                                 "frame_age_ms": round(engine.last_frame_age * 1000, 1)})
+    runtime.stage("publish", publish)
+    return engine
+
+def build_intersection(runtime, camera_sources=None, camera_index=0, audio_channels=1,
+                       audio_device=None, audio=True, controller=True, **engine_kwargs):
+    """Add the stages main.py used to start as daemon threads.
+
+    camera_sources: dict lane -> camera index or video path (one camera per
+    approach, LaneInferenceEngine); otherwise the single overhead camera
+    camera_index runs camera_loop. engine_kwargs go to LaneInferenceEngine.
+    Returns the engine (None for the overhead camera).
+    """
+    engine = None
+    if camera_sources:
+        engine = add_lane_stages(runtime, camera_sources, **engine_kwargs)
+    elif camera_index is not None:
+        from camera_detection import camera_loop
+        runtime.stage("camera", blocking(camera_loop, camera_index), stall_after=10.0)
+
+    if audio:
+        from sound_detection import SirenStream
+        from siren_classifier import load_default
+        classifier = load_default()
+        streams = []
+
+        async def siren(stage):
+            stream = SirenStream(channels=audio_channels, device=audio_device, classifier=classifier)
+            streams[:] = [stream]
+            await stage.call(stream.run, stop=runtime.stop_event, tick=stage.count)
+
+        runtime.stage("audio", siren, stall_after=5.0,
+                      stats=lambda: streams[0].stats() if streams else {})
+
+    if controller:
+        add_controller_stage(runtime)
+    return engine
+
+def add_controller_stage(runtime):
+    """The traffic controller's fixed-rate scheduler as a supervised stage."""
+    from traffic_controller import scheduler
+    return runtime.stage("controller", blocking(scheduler.run), stall_after=2.0,
+                         stats=scheduler.stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the intersection as supervised stages")
+    parser.add_argument("--lane", action="append", default=[], metavar="LANE=SOURCE",
+                        help="Camera index or video per lane, e.g. N=0 E=east.mp4 "
+                             "(default: one overhead camera)")
+    parser.add_argument("--camera", type=int, default=0, help="Overhead camera index")
+    parser.add_argument("--channels", type=int, default=1, help="Microphone channels")
+    parser.add_argument("--no-audio", action="store_true", help="Run without the microphone")
+    parser.add_argument("--stats-interval", type=float, default=5.0,
+                        help="Seconds between statistics reports (0: only at exit)")
+    args = parser.parse_args()
+
+    sources = {}
+    for item in args.lane:
+        lane, _, source = item.partition("=")
+        if lane not in ("N", "E", "S", "W") or not source:
+            parser.error(f"Expected LANE=SOURCE with LANE in N/E/S/W, got {item!r}")
+        sources[lane] = int(source) if source.isdigit() else source
+
+    runtime = Runtime()
+    build_intersection(runtime, camera_sources=sources or None, camera_index=args.camera,
+                       audio_channels=args.channels, audio=not args.no_audio)
+
+    async def reporter(stage):
+        while stage.active:
+            await asyncio.sleep(args.stats_interval)
+            print(runtime.report() + "\n")
+
+    if args.stats_interval > 0:
+        runtime.stage("report", reporter, restart=False)
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        pass
+    print(runtime.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+# shm_state.py
+"""
+Cross-process shared state in one named shared-memory segment.
+
+SharedState (utils.py) lives inside one interpreter. This module lays the
+same state out in a fixed-size shared-memory segment, so the detectors, the
+controller, the UI and the dashboard can run as separate processes, each on
+its own core, attaching to the segment by name and restarting independently.
+
+Layout (all NumPy structured records over the segment's buffer):
+
+    header    magic, layout version, frame ring geometry
+    control   lights, mode and priority lane
+    audio     siren flag, bearing, per-lane confidence, Doppler status
+    params    vehicle simulation parameters
+    lane x 4  ambulance flag, detections (DETECTION_DTYPE, fixed capacity)
+              and the index/shape/version of the newest frame
+    frames    per lane, a ring of FRAME_SLOTS frame buffers
+
+Every record is guarded by a seqlock: the writer makes its sequence number
+odd, writes, and makes it even again; a reader copies the record and
+retries if the number changed underneath it. Readers never block the
+writer, which is never slowed down by a crashed or stalled reader. Frames go
+into the next ring slot (with a seqlock of their own) before the lane
+record points at them, so a reader copying a frame is never overwritten
+unless it falls a whole ring behind.
+
+A writer that dies mid-write leaves a sequence number odd. Readers give up
+after READ_TIMEOUT and keep the last consistent copy, marked stale, and the
+next process that exports the part rounds its sequence numbers (and the
+lane frame slots') up to even before writing.
+
+Each part has one writing process. A StateBridge connects a process's local
+shared_state to the segment: the parts it exports are copied in whenever
+they are published locally, and the parts it follows are mirrored out
+(polling the sequence numbers), republished locally and so wake the local
+subscribers as usual. The rest of the code keeps using shared_state.
+
+    python demo.py --share                    # simulator exports lanes/audio/control
+    python flask_dashboard.py --attach        # dashboard in its own process
+
+    python main.py --role sensors             # or one process per component:
+    python main.py --role controller          # cameras/audio, controller and UI
+    python main.py --role ui                  # on the default segment
+
+Snapshots carry the writer's timestamp, and the audio part is rewritten
+every AUDIO_REFRESH even when it has not changed, so a follower can tell a
+steady siren from a sensor that has stopped.
+
+The segment outlives the processes that use it (a restarted component
+reattaches to the same state); remove it with `python shm_state.py --unlink`.
+The overhead camera frame is not shared.
+"""
+
+import argparse
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import cv2
+import numpy as np
+from detections import DETECTION_DTYPE, LANES
+from frame_pool import FramePool
+from records import Lights
+from utils import (LIGHTS_TOPIC, PARAMS_TOPIC, SIREN_TOPIC, detections_topic,
+                   frame_topic, shared_state)
+
+DEFAULT_NAME = "emergency_traffic_state"
+MAGIC = 0x45544149  # "ETAI"
+LAYOUT_VERSION = 1
+FRAME_SHAPE = (720, 1280, 3)  # largest frame stored; bigger frames are scaled down
+FRAME_SLOTS = 3
+MAX_DETECTIONS = 64  # per lane; extra detections are dropped
+POLL_INTERVAL = 0.005  # seconds between sequence checks of followed parts
+READ_TIMEOUT = 0.05  # seconds a reader waits for a write in progress
+AUDIO_REFRESH = 0.1  # seconds; an unchanged audio snapshot is still re-exported this often
+PARTS = ("lanes", "audio", "control", "params")
+
+MODE_CODES = ["NORMAL", "PRIORITY"]
+APPROACH_CODES = [None, "APPROACHING", "RECEDING"]
+NO_LANE = -1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", np.uint32),
+    ("layout", np.uint32),
+    ("frame_shape", np.uint32, (3,)),
+    ("slots", np.uint32),
+    ("max_detections", np.uint32),
+], align=True)
+
+def _record(fields):
+    return np.dtype([("seq", np.uint64)] + fields, align=True)
+
+CONTROL_DTYPE = _record([
+    ("lights", np.int8, (len(LANES),)),
+    ("mode", np.int8),
+    ("priority_lane", np.int8),
+    ("timestamp", np.float64),
+])
+
+AUDIO_DTYPE = _record([
+    ("siren_detected", np.bool_),
+    ("approach", np.int8),
+    ("bearing", np.float64),  # NaN: none
+    ("lane_confidence", np.float32, (len(LANES),)),
+    ("eta", np.float64),  # NaN: none
+    ("speed", np.float64),  # NaN: none
+    ("timestamp", np.float64),
+])
+
+PARAMS_DTYPE = _record([
+    ("spawn_interval", np.float64, (2,)),
+    ("speed_multiplier", np.float64),
+])
+
+def lane_dtype(max_detections=MAX_DETECTIONS, slots=FRAME_SLOTS):
+    return _record([
+        ("ambulance", np.bool_),
+        ("timestamp", np.float64),
+        ("det_version", np.uint64),
+        ("n_detections", np.int32),
+        ("detections", DETECTION_DTYPE, (max_detections,)),
+        ("frame_version", np.uint64),
+        ("frame_slot", np.int32),
+        ("frame_shape", np.int32, (3,)),
+        ("slot_seq", np.uint64, (slots,)),
+    ])
+
+def _align(offset, to=64):
+    return (offset + to - 1) // to * to
+
+def _none_if_nan(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+def _untrack(shm):
+    # the segment belongs to no single process: keep Python from unlinking
+    # it when the process that created (or attached to) it exits
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+class _Seqlock:
+    """Write/read helpers for one 0-d record with a "seq" field."""
+
+    @staticmethod
+    def write(record, **fields):
+        record["seq"] += 1  # odd: write in progress
+        for key, value in fields.items():
+            record[key] = value
+        record["seq"] += 1
+
+    @staticmethod
+    def read(record, previous=None, timeout=READ_TIMEOUT):
+        """(seq, consistent copy of the record, stale).
+
+        If no consistent copy can be taken within timeout (the writer died
+        mid-write), returns the current seq with previous (the last
+        consistent copy, or a possibly torn one without it) and stale=True.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = int(record["seq"])
+            if not seq & 1:
+                copy = record.copy()
+                if int(record["seq"]) == seq:
+                    return seq, copy, False
+            if time.monotonic() > deadline:
+                return seq, record.copy() if previous is None else previous, True
+            time.sleep(0)  # writer in progress
+
+    @staticmethod
+    def recover(seqs):
+        """Round odd sequence numbers up to even (before a new writer's first write)."""
+        seqs += seqs & 1
+
+class SharedStateSegment:
+    """The shared-memory segment: fixed layout, attach by name.
+
+    create=True makes a new segment with the given geometry; otherwise the
+    geometry is read from the header of an existing one.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, create=False, frame_shape=FRAME_SHAPE,
+                 slots=FRAME_SLOTS, max_detections=MAX_DETECTIONS):
+        self.name = name
+        if create:
+            self.frame_shape, self.slots, self.max_detections = tuple(frame_shape), slots, max_detections
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self._size())
+            self._map()
+            self.header["magic"] = MAGIC
+            self.header["layout"] = LAYOUT_VERSION
+            self.header["frame_shape"] = self.frame_shape
+            self.header["slots"] = slots
+            self.header["max_detections"] = max_detections
+            self._init_records()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            header = np.ndarray((), HEADER_DTYPE, buffer=self.shm.buf)
+            if int(header["magic"]) != MAGIC or int(header["layout"]) != LAYOUT_VERSION:
+                self.shm.close()
+                raise ValueError(f"shared memory {name!r} is not a layout-{LAYOUT_VERSION} state segment")
+            self.frame_shape = tuple(int(v) for v in header["frame_shape"])
+            self.slots = int(header["slots"])
+            self.max_detections = int(header["max_detections"])
+            del header
+            self._map()
+        self._last = {}  # part or lane -> last consistent record copy
+        _untrack(self.shm)
+
+    @classmethod
+    def open(cls, name=DEFAULT_NAME, **geometry):
+        """Attach to the segment, creating it if no process has yet."""
+        try:
+            return cls(name)
+        except FileNotFoundError:
+            try:
+                return cls(name, create=True, **geometry)
+            except FileExistsError:  # another process created it meanwhile
+                return cls(name)
+
+    def _offsets(self):
+        self.lane_dtype = lane_dtype(self.max_detections, self.slots)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        offsets = {}
+        offset = 0
+        for part, size in (("header", HEADER_DTYPE.itemsize), ("control", CONTROL_DTYPE.itemsize),
+                           ("audio", AUDIO_DTYPE.itemsize), ("params", PARAMS_DTYPE.itemsize),
+                           ("lanes", self.lane_dtype.itemsize * len(LANES)),
+                           ("frames", self.frame_bytes * self.slots * len(LANES))):
+            offsets[part] = offset
+            offset = _align(offset + size)
+        return offsets, offset
+
+    def _size(self):
+        return self._offsets()[1]
+
+    def _map(self):
+        offsets, _ = self._offsets()
+        buf = self.shm.buf
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=buf, offset=offsets["header"])
+        self.control = np.ndarray((), CONTROL_DTYPE, buffer=buf, offset=offsets["control"])
+        self.audio = np.ndarray((), AUDIO_DTYPE, buffer=buf, offset=offsets["audio"])
+        self.params = np.ndarray((), PARAMS_DTYPE, buffer=buf, offset=offsets["params"])
+        self.lanes = {lane: np.ndarray((), self.lane_dtype, buffer=buf,
+                                       offset=offsets["lanes"] + i * self.lane_dtype.itemsize)
+                      for i, lane in enumerate(LANES)}
+        self.frames = np.ndarray((len(LANES), self.slots, self.frame_bytes), np.uint8,
+                                 buffer=buf, offset=offsets["frames"])
+
+    def _init_records(self):
+        self.control["priority_lane"] = NO_LANE
+        for field in ("bearing", "eta", "speed"):
+            self.audio[field] = np.nan
+        self.params["spawn_interval"] = (2.0, 5.0)
+        self.params["speed_multiplier"] = 1.0
+        for record in self.lanes.values():
+            record["frame_slot"] = -1
+
+    # --- writers (one process per part) ---
+
+    def recover(self, parts):
+        """Take over writing parts: end any write a dead writer left open."""
+        for part in parts:
+            if part == "lanes":
+                for record in self.lanes.values():
+                    _Seqlock.recover(record["seq"])
+                    _Seqlock.recover(record["slot_seq"])
+            else:
+                _Seqlock.recover(getattr(self, part)["seq"])
+
+    def _fit(self, shape):
+        """Largest shape <= the ring geometry with the frame's aspect ratio."""
+        h, w = shape[:2]
+        max_h, max_w, _ = self.frame_shape
+        if h <= max_h and w <= max_w:
+            return tuple(shape)
+        scale = min(max_h / h, max_w / w)
+        return (max(1, int(h * scale)), max(1, int(w * scale))) + tuple(shape[2:])
+
+    def write_frame(self, lane, frame):
+        """Copy a frame into the lane's next ring slot; returns (slot, shape)."""
+        if frame.ndim != 3 or frame.shape[2] != self.frame_shape[2] or frame.dtype != np.uint8:
+            raise ValueError(f"frames must be uint8 with {self.frame_shape[2]} channels")
+        record = self.lanes[lane]
+        slot = (int(record["frame_slot"]) + 1) % self.slots
+        shape = self._fit(frame.shape)
+        dst = self.frames[LANES.index(lane), slot, :int(np.prod(shape))].reshape(shape)
+        seqs = record["slot_seq"]
+        seqs[slot] += 1
+        if shape == frame.shape:
+            np.copyto(dst, frame)
+        else:
+            cv2.resize(frame, (shape[1], shape[0]), dst=dst)
+        seqs[slot] += 1
+        return slot, shape
+
+    def write_lane(self, lane, snap, frame_changed=True, detections_changed=True):
+        """Store a LaneSnapshot (utils.py)."""
+        record = self.lanes[lane]
+        fields = {"ambulance": snap.ambulance, "timestamp": snap.timestamp}
+        if frame_changed and snap.frame is not None:
+            slot, shape = self.write_frame(lane, snap.frame)
+            fields.update(frame_slot=slot, frame_shape=shape,
+                          frame_version=int(record["frame_version"]) + 1)
+        if detections_changed:
+            dets = snap.detections[:self.max_detections]
+            fields.update(n_detections=len(dets), det_version=int(record["det_version"]) + 1)
+        record["seq"] += 1  # as _Seqlock.write, with the detection rows in between
+        for key, value in fields.items():
+            record[key] = value
+        if detections_changed:
+            record["detections"][:len(dets)] = dets
+        record["seq"] += 1
+
+    def write_audio(self, snap):
+        """Store an AudioSnapshot."""
+        _Seqlock.write(
+            self.audio,
+            siren_detected=snap.siren_detected,
+            approach=APPROACH_CODES.index(snap.approach),
+            bearing=_nan_if_none(snap.bearing),
+            lane_confidence=[snap.lane_confidence.get(lane, 0.0) for lane in LANES],
+            eta=_nan_if_none(snap.eta),
+            speed=_nan_if_none(snap.speed),
+            timestamp=snap.timestamp,
+        )
+
+    def write_control(self, snap):
+        """Store a ControlSnapshot."""
+        _Seqlock.write(
+            self.control,
+            lights=list(Lights.from_mapping(snap.lights).codes),
+            mode=MODE_CODES.index(snap.mode),
+            priority_lane=LANES.index(snap.priority_lane) if snap.priority_lane else NO_LANE,
+            timestamp=snap.timestamp,
+        )
+
+    def write_params(self, params):
+        _Seqlock.write(self.params, spawn_interval=tuple(params["spawn_interval"]),
+                       speed_multiplier=float(params["speed_multiplier"]))
+
+    # --- readers ---
+
+    def seq(self, part, lane=None):
+        """Current sequence number of a part (lanes: of one lane)."""
+        record = self.lanes[lane] if part == "lanes" else getattr(self, part)
+        return int(record["seq"])
+
+    def _read(self, key, record):
+        seq, copy, stale = _Seqlock.read(record, self._last.get(key))
+        if not stale:
+            self._last[key] = copy
+        return seq, copy, stale
+
+    def read_frame(self, lane, slot, shape, pool):
+        """Copy of one ring slot into a pooled buffer, or None if it was
+        overwritten (or is mid-write: a dead writer's slot stays unreadable
+        until the next exporter recovers it)."""
+        record = self.lanes[lane]
+        src = self.frames[LANES.index(lane), slot, :int(np.prod(shape))].reshape(shape)
+        seq = int(record["slot_seq"][slot])
+        if seq & 1:
+            return None
+        out = pool.acquire(shape)
+        np.copyto(out, src)
+        return out if int(record["slot_seq"][slot]) == seq else None
+
+    # each read_* returns (seq, value, stale); stale: the last consistent
+    # value, the writer never finished its latest write
+
+    def read_lane(self, lane):
+        """(seq, record copy, stale) of one lane."""
+        return self._read(lane, self.lanes[lane])
+
+    def read_audio(self):
+        seq, rec, stale = self._read("audio", self.audio)
+        return seq, {
+            "siren_detected": bool(rec["siren_detected"]),
+            "approach": APPROACH_CODES[int(rec["approach"])],
+            "bearing": _none_if_nan(rec["bearing"]),
+            "lane_confidence": {lane: float(c) for lane, c in zip(LANES, rec["lane_confidence"])},
+            "eta": _none_if_nan(rec["eta"]),
+            "speed": _none_if_nan(rec["speed"]),
+            "timestamp": float(rec["timestamp"]),
+        }, stale
+
+    def read_control(self):
+        seq, rec, stale = self._read("control", self.control)
+        lane = int(rec["priority_lane"])
+        return seq, (Lights.from_codes(rec["lights"].astype(np.uint8)),
+                     MODE_CODES[int(rec["mode"])], LANES[lane] if lane != NO_LANE else None), stale
+
+    def read_params(self):
+        seq, rec, stale = self._read("params", self.params)
+        return seq, {"spawn_interval": tuple(float(v) for v in rec["spawn_interval"]),
+                     "speed_multiplier": float(rec["speed_multiplier"])}, stale
+
+    def close(self):
+        # drop every view first, or the buffer cannot be released
+        self.header = self.control = self.audio = self.params = self.lanes = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        resource_tracker.register(self.shm._name, "shared_memory")  # unlink() unregisters it
+        self.shm.unlink()
+
+class StateBridge:
+    """Connects a process's local shared_state to a SharedStateSegment.
+
+    export: parts this process writes (copied into the segment as they are
+    published locally). follow: parts other processes write (mirrored into
+    the local shared_state). A part must have exactly one exporting process.
+    """
+
+    def __init__(self, segment, export=(), follow=(), state=shared_state,
+                 poll_interval=POLL_INTERVAL):
+        unknown = (set(export) | set(follow)) - set(PARTS)
+        if unknown or set(export) & set(follow):
+            raise ValueError(f"export/follow must be disjoint subsets of {PARTS}")
+        self.segment = segment
+        self.export = tuple(export)
+        self.follow = tuple(follow)
+        self.state = state
+        self.poll_interval = poll_interval
+        self.running = True
+        self.pool = FramePool(slots=4 * len(LANES))  # mirrored frames
+        self.exported = 0
+        self.mirrored = 0
+        self.torn_frames = 0  # frames overwritten while being copied (retried later)
+        self.stale_reads = 0  # records left mid-write by a dead writer
+        self.skipped_frames = 0  # local frames the segment cannot hold
+        self._threads = []
+
+    def start(self):
+        for target, needed in ((self._export_loop, self.export), (self._follow_loop, self.follow)):
+            if needed:
+                t = threading.Thread(target=target, daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def stop(self):
+        self.running = False
+        for t in self._threads:
+            t.join(timeout=1.0)
+
+    # local -> segment
+
+    def _export_loop(self):
+        topics = []
+        if "lanes" in self.export:
+            topics += [frame_topic(lane) for lane in LANES] + [detections_topic(lane) for lane in LANES]
+        topics += [topic for part, topic in (("audio", SIREN_TOPIC), ("control", LIGHTS_TOPIC),
+                                             ("params", PARAMS_TOPIC)) if part in self.export]
+        sub = self.state.subscribe(*topics)
+        sent = {}  # lane -> (frame, detections) objects last written
+        audio_version = None
+        # the audio stream republishes every hop but only notifies on a change:
+        # poll it, so a steady siren keeps its timestamp fresh in the segment
+        timeout = AUDIO_REFRESH if "audio" in self.export else 1.0
+        changed = topics  # write everything once at start
+        self.segment.recover(self.export)  # a previous exporter may have died mid-write
+        while self.running:
+            for lane in LANES:
+                if frame_topic(lane) in changed or detections_topic(lane) in changed:
+                    snap = self.state.lanes[lane]
+                    last_frame, last_dets = sent.get(lane, (None, None))
+                    dets_changed = snap.detections is not last_dets
+                    try:
+                        self.segment.write_lane(lane, snap, frame_changed=snap.frame is not last_frame,
+                                                detections_changed=dets_changed)
+                    except ValueError as e:
+                        # e.g. a grayscale frame: share the lane without it
+                        self.skipped_frames += 1
+                        print(f"[SHM] Lane {lane} frame not shared: {e}")
+                        self.segment.write_lane(lane, snap, frame_changed=False,
+                                                detections_changed=dets_changed)
+                    sent[lane] = (snap.frame, snap.detections)
+            if "audio" in self.export and self.state.audio.version != audio_version:
+                audio_version = self.state.audio.version
+                self.segment.write_audio(self.state.audio)
+            if LIGHTS_TOPIC in changed:
+                self.segment.write_control(self.state.control)
+            if PARAMS_TOPIC in changed:
+                self.segment.write_params(self.state.vehicle_params)
+            self.exported += len(changed)
+            changed = sub.wait(timeout=timeout)
+
+    # segment -> local
+
+    def _follow_loop(self):
+        seen = {}
+        frames_seen = {}
+        dets_seen = {}
+        while self.running:
+            if "lanes" in self.follow:
+                for lane in LANES:
+                    if self.segment.seq("lanes", lane) != seen.get(lane):
+                        seen[lane] = self._mirror_lane(lane, frames_seen, dets_seen)
+            for part in ("audio", "control", "params"):
+                if part in self.follow and self.segment.seq(part) != seen.get(part):
+                    seen[part] = self._mirror(part)
+            time.sleep(self.poll_interval)
+
+    def _mirror_lane(self, lane, frames_seen, dets_seen):
+        seq, rec, stale = self.segment.read_lane(lane)
+        if stale:
+            self.stale_reads += 1
+            return seq  # nothing new to mirror until the seq moves again
+        # the writer's timestamps: staleness checks see when it measured, not
+        # when this process mirrored
+        fields = {"ambulance": bool(rec["ambulance"]), "now": float(rec["timestamp"])}
+        frame_version = int(rec["frame_version"])
+        if frame_version and frame_version != frames_seen.get(lane):
+            frame = self.segment.read_frame(lane, int(rec["frame_slot"]),
+                                            tuple(int(v) for v in rec["frame_shape"]), self.pool)
+            if frame is None:
+                self.torn_frames += 1
+                return None  # look again on the next poll
+            fields["frame"] = frame
+            frames_seen[lane] = frame_version
+        det_version = int(rec["det_version"])
+        if det_version != dets_seen.get(lane):
+            fields["detections"] = rec["detections"][:int(rec["n_detections"])].copy()
+            dets_seen[lane] = det_version
+        self.state.publish_lane(lane, **fields)
+        self.mirrored += 1
+        return seq
+
+    def _mirror(self, part):
+        seq, value, stale = getattr(self.segment, f"read_{part}")()
+        if stale:
+            self.stale_reads += 1
+            return seq  # nothing new to mirror until the seq moves again
+        if part == "audio":
+            self.state.publish_audio(**value)
+        elif part == "control":
+            self.state.publish_control(*value)
+        else:
+            self.state.publish_vehicle_params(value)
+        self.mirrored += 1
+        return seq
+
+    def stats(self):
+        return {"exported": self.exported, "mirrored": self.mirrored, "torn_frames": self.torn_frames,
+                "stale_reads": self.stale_reads, "skipped_frames": self.skipped_frames}
+
+def share(export=(), follow=(), name=DEFAULT_NAME, **geometry):
+    """Open (or create) the named segment and start bridging shared_state to it."""
+    return StateBridge(SharedStateSegment.open(name, **geometry), export, follow).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or remove the shared-memory state segment")
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--unlink", action="store_true", help="Remove the segment")
+    args = parser.parse_args()
+    try:
+        segment = SharedStateSegment(args.name)
+    except FileNotFoundError:
+        print(f"No segment named {args.name!r}")
+        return
+    if args.unlink:
+        segment.unlink()
+        print(f"Removed {args.name!r}")
+    else:
+        print(f"{args.name}: {segment.shm.size / 1e6:.1f} MB, frames up to {segment.frame_shape}, "
+              f"{segment.slots} slots per lane, {segment.max_detections} detections per lane")
+        print("control:", segment.read_control()[1])
+        print("audio:  ", segment.read_audio()[1])
+        for lane in LANES:
+            _, rec, _ = segment.read_lane(lane)
+            print(f"lane {lane}: ambulance={bool(rec['ambulance'])} detections={int(rec['n_detections'])} "
+                  f"frames={int(rec['frame_version'])}")
+    segment.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# siren_classifier.py
+"""
+Lightweight learned siren classifier.
+
+Features are log-mel statistics of each analysis window, computed for a
+whole batch of windows at once: the window is cut into short frames, one
+rfft covers every frame of every window, a cached mel filterbank reduces
+them to N_MELS bands, and the per-band mean, spread and frame-to-frame
+change (sirens sweep) summarise the window. A logistic regression in plain
+NumPy turns that into a probability; its decision threshold is picked for
+high precision on held-out data, so a single window is enough to decide.
+
+Train with train_siren_classifier.py; the model is a small .npz file.
+"""
+
+import functools
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SIREN_CLASSIFIER_PATH = os.path.join(os.path.dirname(__file__), "models", "siren_clf.npz")
+N_MELS = 40
+FRAME = 1024  # samples per STFT frame inside a window
+FRAME_HOP = 512
+F_MIN, F_MAX = 100.0, 5000.0
+DYNAMIC_RANGE = np.log(1e6)  # 60 dB in natural-log power
+MIN_RMS = 1e-3  # quieter windows are never a siren (features are level-invariant)
+
+def _hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + f / 700.0)
+
+def _mel_to_hz(m):
+    return 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+
+@functools.lru_cache(maxsize=8)
+def mel_filterbank(sample_rate, n_fft=FRAME, n_mels=N_MELS, f_min=F_MIN, f_max=F_MAX):
+    """(n_fft // 2 + 1, n_mels) triangular filterbank, cached per setup."""
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = _mel_to_hz(np.linspace(_hz_to_mel(f_min), _hz_to_mel(f_max), n_mels + 2))
+    lower, centre, upper = edges[:-2], edges[1:-1], edges[2:]
+    rising = (freqs[:, None] - lower) / (centre - lower)
+    falling = (upper - freqs[:, None]) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+def log_mel_features(windows, sample_rate):
+    """Feature matrix (n, 3 * N_MELS) for a (n, samples) batch of windows."""
+    windows = np.asarray(windows, dtype=np.float32)
+    if windows.ndim == 1:
+        windows = windows[None]
+    frames = sliding_window_view(windows, FRAME, axis=1)[:, ::FRAME_HOP]  # (n, t, FRAME)
+    spec = np.fft.rfft(frames * np.hanning(FRAME).astype(np.float32), axis=2)
+    power = spec.real ** 2 + spec.imag ** 2
+    mel = np.log(power @ mel_filterbank(sample_rate) + 1e-10)  # (n, t, N_MELS)
+    # 60 dB dynamic range per frame, so clean recordings look like noisy ones
+    mel = np.maximum(mel, mel.max(axis=2, keepdims=True) - DYNAMIC_RANGE)
+    # loudness-invariant: relative to each frame's mean level
+    mel -= mel.mean(axis=2, keepdims=True)
+    delta = np.abs(np.diff(mel, axis=1)).mean(axis=1)
+    return np.concatenate([mel.mean(axis=1), mel.std(axis=1), delta], axis=1).astype(np.float32)
+
+class SirenClassifier:
+    """Logistic regression over log_mel_features with a precision-tuned threshold."""
+
+    def __init__(self, weights=None, bias=0.0, mean=None, std=None, threshold=0.5):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+        self.threshold = threshold
+
+    def fit(self, features, labels, epochs=500, lr=0.5, l2=1e-3):
+        """Full-batch gradient descent on standardized features."""
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0) + 1e-6
+        x = (features - self.mean) / self.std
+        y = labels.astype(np.float32)
+        self.weights = np.zeros(x.shape[1], dtype=np.float32)
+        self.bias = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+            err = p - y
+            self.weights -= lr * (x.T @ err / len(y) + l2 * self.weights)
+            self.bias -= lr * float(err.mean())
+        return self
+
+    def predict_features(self, features):
+        x = (features - self.mean) / self.std
+        return 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+
+    def predict_proba(self, windows, sample_rate):
+        """Siren probability per window of a (n, samples) batch."""
+        return self.predict_features(log_mel_features(windows, sample_rate))
+
+    def predict(self, windows, sample_rate):
+        windows = np.asarray(windows, dtype=np.float32)
+        loud = np.sqrt(np.mean(np.square(windows), axis=-1)) >= MIN_RMS
+        return loud & (self.predict_proba(windows, sample_rate) >= self.threshold)
+
+    def tune_threshold(self, features, labels, min_precision=0.99):
+        """Lowest threshold whose precision on (features, labels) reaches min_precision."""
+        probs = self.predict_features(features)
+        for threshold in np.linspace(0.05, 0.99, 95):
+            flagged = probs >= threshold
+            if flagged.any() and labels[flagged].mean() >= min_precision:
+                self.threshold = float(threshold)
+                return self.threshold
+        self.threshold = 0.99
+        return self.threshold
+
+    def save(self, path=SIREN_CLASSIFIER_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean,
+                 std=self.std, threshold=self.threshold)
+
+    @classmethod
+    def load(cls, path=SIREN_CLASSIFIER_PATH):
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]), data["mean"], data["std"],
+                       float(data["threshold"]))
+
+def load_default():
+    """The trained classifier if one has been saved, otherwise None."""
+    if os.path.exists(SIREN_CLASSIFIER_PATH):
+        return SirenClassifier.load()
+    return None
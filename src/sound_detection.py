@@ -1,72 +1,383 @@
 # sound_detection.py
-import sounddevice as sd
 import numpy as np
 import threading
 import time
-from scipy.signal import find_peaks
+import argparse
+import functools
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
 from utils import shared_state
+try:
+    import sounddevice as sd
+except Exception:
+    sd = None  # offline analysis (--wav) works without an audio device
 
 SAMPLE_RATE = 22050
 CHUNK = int(0.8 * SAMPLE_RATE)  # 0.8 sec
 
+HOP = int(0.1 * SAMPLE_RATE)  # analyse a new overlapping window every 0.1 sec
+BAND = (500, 2000)  # siren band, Hz
+MAX_BATCH = 256  # windows per STFT block (bounds memory on long signals)
+
+@functools.lru_cache(maxsize=8)
+def _analysis_setup(n, sample_rate):
+    """Hann window, siren-band mask and band frequencies for n-sample windows (cached)."""
+    window = np.hanning(n).astype(np.float32)
+    freqs = np.fft.rfftfreq(n, 1.0 / sample_rate)
+    band_mask = (freqs > BAND[0]) & (freqs < BAND[1])
+    return window, band_mask, freqs[band_mask]
+
+def frame_signal(signal, window=CHUNK, hop=HOP):
+    """(n_windows, window) strided view of a 1D signal, no copy."""
+    if len(signal) < window:
+        return np.empty((0, window), dtype=np.float32)
+    return sliding_window_view(signal, window)[::hop]
+
+def _detect_block(windows, sample_rate):
+    win, band_mask, band_freqs = _analysis_setup(windows.shape[1], sample_rate)
+    spec = np.abs(sp_fft.rfft(windows * win, axis=1, workers=-1))
+    band = spec[:, band_mask]
+    band_energy = band.sum(axis=1)
+    total_energy = spec.sum(axis=1) + 1e-8
+    ratio = band_energy / total_energy
+
+    # fallback: strong periodic peaks in band (siren often has harmonics);
+    # local maxima above 30% of the band maximum, one per plateau
+    mid = band[:, 1:-1]
+    is_peak = (mid > band[:, :-2]) & (mid >= band[:, 2:]) & \
+        (mid >= 0.3 * band.max(axis=1, keepdims=True))
+    n_peaks = is_peak.sum(axis=1)
+
+    # heuristic thresholds; below 1e4 total energy is too quiet
+    loud = total_energy >= 1e4
+    is_siren = loud & (((ratio > 0.15) & (band_energy > 1e4)) | ((n_peaks >= 2) & (ratio > 0.07)))
+
+    # dominant in-band frequency, parabolic interpolation between bins
+    k = np.clip(band.argmax(axis=1), 1, band.shape[1] - 2)
+    rows = np.arange(len(band))
+    left, centre, right = band[rows, k - 1], band[rows, k], band[rows, k + 1]
+    denom = left - 2 * centre + right
+    shift = np.where(denom < 0, 0.5 * (left - right) / np.where(denom < 0, denom, -1.0), 0.0)
+    pitch = band_freqs[k] + shift * (sample_rate / windows.shape[1])
+    return ratio, band_energy, total_energy, is_siren, pitch.astype(np.float32)
+
+def detect_siren_batch(x, sample_rate=SAMPLE_RATE, window=None, hop=HOP):
+    """Siren analysis of many windows with one STFT per block.
+
+    x: a (n, window) stack of windows, or a 1D signal that is framed into
+    overlapping windows of `window` samples (default 0.8 s) every `hop`.
+    Returns a dict of per-window arrays: ratio, band_energy, total_energy,
+    is_siren and pitch (dominant in-band frequency, Hz).
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = frame_signal(x, window or int(0.8 * sample_rate), hop)
+    parts = [_detect_block(x[i:i + MAX_BATCH], sample_rate)
+             for i in range(0, len(x), MAX_BATCH)]
+    if not parts:
+        empty = np.zeros(0, dtype=np.float32)
+        return {"ratio": empty, "band_energy": empty, "total_energy": empty,
+                "is_siren": np.zeros(0, dtype=bool), "pitch": empty}
+    ratio, band_energy, total_energy, is_siren, pitch = (np.concatenate(a) for a in zip(*parts))
+    return {"ratio": ratio, "band_energy": band_energy,
+            "total_energy": total_energy, "is_siren": is_siren, "pitch": pitch}
+
 def detect_siren_chunk(chunk, sample_rate=SAMPLE_RATE):
     # chunk: 1D numpy array of float32
-    # compute FFT
-    windowed = chunk * np.hanning(len(chunk))
-    fft = np.abs(np.fft.rfft(windowed))
-    freqs = np.fft.rfftfreq(len(windowed), 1.0 / sample_rate)
-
-    # energy in siren band
-    band_mask = (freqs > 500) & (freqs < 2000)
-    band_energy = np.sum(fft[band_mask])
-    total_energy = np.sum(fft) + 1e-8
-    ratio = band_energy / total_energy
+    return bool(detect_siren_batch(chunk[None, :], sample_rate)["is_siren"][0])
+
+RING_SECONDS = 4.0
+DOPPLER_INTERVAL = 0.25  # seconds between approach/recede estimates (doppler.py)
+VOTE_WINDOWS = 6  # recent windows in the majority vote
+
+class AudioRing:
+    """Single-producer/single-consumer sample ring.
+
+    The audio callback claims a block's region (`reserved`) before copying
+    it in and only advances `written` afterwards, and the reader only reads,
+    so neither side takes a lock. A reader checks its window against
+    `reserved` before and after copying: a window that was, or is being,
+    overwritten (the reader fell more than a ring's worth behind) is
+    detected and counted as an overrun.
+    """
+
+    def __init__(self, capacity, channels=1):
+        self.capacity = capacity
+        shape = (capacity,) if channels == 1 else (capacity, channels)
+        self.buf = np.zeros(shape, dtype=np.float32)
+        self.written = 0  # total samples ever written
+        self.reserved = 0  # end of the block being written (== written between blocks)
+
+    def write(self, block):
+        n = len(block)
+        begin = self.written
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            begin += n - self.capacity
+            n = self.capacity
+        # claim the region first, so a reader copying it sees the overwrite
+        self.reserved = begin + n
+        start = begin % self.capacity
+        first = min(n, self.capacity - start)
+        self.buf[start:start + first] = block[:first]
+        self.buf[:n - first] = block[first:]
+        self.written = self.reserved
+
+    def read(self, end, length, out=None):
+        """Copy samples [end - length, end) into out; None if overwritten."""
+        begin = end - length
+        if begin < 0 or self.reserved - begin > self.capacity:
+            return None
+        out = np.empty((length,) + self.buf.shape[1:], dtype=np.float32) if out is None else out
+        start = begin % self.capacity
+        first = min(length, self.capacity - start)
+        out[:first] = self.buf[start:start + first]
+        out[first:] = self.buf[:length - first]
+        # the writer may have lapped us, or started a block over the window,
+        # while copying
+        if self.reserved - begin > self.capacity:
+            return None
+        return out
+
+class SirenStream:
+    """Callback-driven microphone capture with overlapping-window analysis.
 
-    # heuristic thresholds
-    if total_energy < 1e4:
-        return False  # too quiet
-    if ratio > 0.15 and band_energy > 1e4:
-        return True
+    The sounddevice callback only copies samples into an AudioRing. A
+    separate analysis thread takes a CHUNK-long window every `hop` samples,
+    so coverage has no gaps and a siren onset is seen within one hop.
 
-    # fallback: detect strong periodic peaks in band (siren often has harmonics)
-    peaks, _ = find_peaks(fft[band_mask], height=np.max(fft[band_mask]) * 0.3)
-    if len(peaks) >= 2 and ratio > 0.07:
-        return True
+    With a multi-channel array (channels > 1) the siren decision uses the
+    channel mean and a doa.DoaEstimator locates the siren, publishing a
+    per-lane siren confidence.
 
-    return False
+    With a trained siren_classifier.SirenClassifier each window is decided
+    on its own; the heuristic detector needs a majority vote of windows.
 
-def audio_loop():
-    # moving window detection to stabilize
-    recent = [False]*6
+    window and hop default to CHUNK and HOP scaled to sample_rate, so they
+    keep spanning 0.8 s and 0.1 s at any rate.
+    """
+
+    def __init__(self, window=None, hop=None, sample_rate=SAMPLE_RATE, device=None,
+                 channels=1, doa=None, classifier=None):
+        window = window or CHUNK * sample_rate // SAMPLE_RATE
+        hop = hop or HOP * sample_rate // SAMPLE_RATE
+        self.window = window
+        self.hop = hop
+        self.sample_rate = sample_rate
+        self.device = device
+        self.channels = channels
+        if channels > 1 and doa is None:
+            from doa import DoaEstimator
+            doa = DoaEstimator(sample_rate)
+        self.doa = doa
+        self.lane_confidence = None
+        if doa is not None:
+            from doa import LaneSirenConfidence
+            self.lane_confidence = LaneSirenConfidence()
+        from doppler import DopplerEstimator
+        self.doppler = DopplerEstimator()
+        self._doppler_due = 0.0
+        self.ring = AudioRing(int(RING_SECONDS * sample_rate), channels)
+        self.running = True
+        self.next_end = window  # sample count at which the next window ends
+        # grows to the backlog
+        self._scratch = np.empty((1, window) + self.ring.buf.shape[1:], dtype=np.float32)
+        self.classifier = classifier
+        self.recent = [False] * VOTE_WINDOWS
+        self.min_votes = 1 if classifier is not None else 2
+        # counters
+        self.input_overflows = 0  # PortAudio dropped input
+        self.ring_overruns = 0  # analysis fell more than a ring behind
+        self.windows_analysed = 0
+
+    def _callback(self, indata, frames, time_info, status):
+        if status and status.input_overflow:
+            self.input_overflows += 1
+        self.ring.write(indata[:, 0] if self.channels == 1 else indata)
+
+    def analyse_pending(self):
+        """Analyse every complete window in one batch; returns the number processed."""
+        if self.ring.written - self.next_end > self.ring.capacity - self.window:
+            # too far behind: skip ahead to the newest full window
+            self.ring_overruns += 1
+            self.next_end = self.ring.written
+        n = max(0, (self.ring.written - self.next_end) // self.hop + 1)
+        if n == 0:
+            return 0
+        if len(self._scratch) < n:
+            self._scratch = np.empty((n,) + self._scratch.shape[1:], dtype=np.float32)
+        ok = np.ones(n, dtype=bool)
+        ends = self.next_end + self.hop * np.arange(n)
+        for i in range(n):
+            ok[i] = self.ring.read(int(ends[i]), self.window, self._scratch[i]) is not None
+        self.next_end += n * self.hop
+        self.ring_overruns += int((~ok).sum())
+        windows = self._scratch[:n][ok]
+        mono = windows if self.channels == 1 else windows.mean(axis=2)
+        result = detect_siren_batch(mono, self.sample_rate)
+        if self.classifier is not None and len(mono):
+            result["is_siren"] = self.classifier.predict(mono, self.sample_rate)
+        if self.doa is None:
+            for is_siren in result["is_siren"].tolist():
+                self.publish(is_siren)
+        elif len(windows):
+            located = self.doa.estimate(windows)
+            for is_siren, scores, bearing in zip(result["is_siren"].tolist(),
+                                                 located["lane_scores"], located["bearing"].tolist()):
+                self.publish(is_siren, scores, bearing)
+        siren = result["is_siren"]
+        self.update_doppler(ends[ok][siren] / self.sample_rate, result["pitch"][siren],
+                            ends[-1] / self.sample_rate)
+        self.windows_analysed += len(result["is_siren"])
+        return n
+
+    def update_doppler(self, times, pitches, now):
+        """Feed siren pitches (stream-clock seconds) and publish the Doppler
+        status every DOPPLER_INTERVAL."""
+        for t, pitch in zip(np.atleast_1d(times).tolist(), np.atleast_1d(pitches).tolist()):
+            self.doppler.add(t, pitch)
+        if now < self._doppler_due:
+            return
+        self._doppler_due = now + DOPPLER_INTERVAL
+        last = self.doppler.last_heard()
+        if last is not None and now - last <= 1.0:
+            status = self.doppler.estimate(now)
+        else:
+            status = {"status": None, "eta": None, "speed": None}
+        shared_state.publish_audio(approach=status["status"], eta=status["eta"],
+                                   speed=status["speed"])
+
+    def publish(self, is_siren, lane_scores=None, bearing=None):
+        self.recent.pop(0)
+        self.recent.append(is_siren)
+        # majority vote
+        siren_flag = sum(self.recent) >= self.min_votes
+        if lane_scores is not None:
+            self.lane_confidence.update(is_siren, lane_scores)
+        if lane_scores is None:
+            shared_state.publish_audio(siren_detected=siren_flag)
+        else:
+            shared_state.publish_audio(siren_detected=siren_flag,
+                                       lane_confidence=self.lane_confidence.as_dict(),
+                                       bearing=bearing if siren_flag else None)
+
+    def run(self, stop=None, tick=None):
+        """Capture and analyse until stop is set; tick(n) per n windows analysed."""
+        with sd.InputStream(samplerate=self.sample_rate, channels=self.channels, dtype='float32',
+                            blocksize=self.hop // 4, device=self.device,
+                            callback=self._callback):
+            while self.running and (stop is None or not stop.is_set()):
+                n = self.analyse_pending()
+                if n == 0:
+                    # wait roughly until the next hop is due
+                    time.sleep(self.hop / self.sample_rate / 2)
+                elif tick is not None:
+                    tick(n)
+
+    def run_source(self, source):
+        """Analyse a non-live source (e.g. audio_source.WavStream) like the mic.
+
+        Blocks go through the same ring and analysis; a fast source should
+        use blocks shorter than the ring so nothing is overwritten.
+        """
+        for block in source.blocks():
+            if not self.running:
+                break
+            self.ring.write(block)
+            self.analyse_pending()
+
+    def stats(self):
+        return {
+            "input_overflows": self.input_overflows,
+            "ring_overruns": self.ring_overruns,
+            "windows_analysed": self.windows_analysed,
+            "lag_samples": self.ring.written - self.next_end + self.hop,
+        }
+
+def audio_loop(channels=1, device=None, tracker=False):
+    from siren_classifier import load_default
+    classifier = load_default()
+    if classifier is not None and not tracker:
+        print("[AUDIO] Using learned siren classifier (single-window decisions)")
     while True:
         try:
-            audio = sd.rec(CHUNK, samplerate=SAMPLE_RATE, channels=1, dtype='float32')
-            sd.wait()
-            audio = audio.flatten()
-            is_siren = detect_siren_chunk(audio)
-            recent.pop(0)
-            recent.append(is_siren)
-            # majority vote
-            siren_flag = sum(recent) >= 2
-
-            with shared_state.lock:
-                shared_state.siren_detected = siren_flag
-                if siren_flag:
-                    shared_state.last_emergency_time = time.time()
-            # small sleep to avoid tight loop
-            time.sleep(0.15)
+            if tracker:
+                from siren_tracker import TrackerStream
+                TrackerStream(device=device).run()
+            else:
+                SirenStream(channels=channels, device=device, classifier=classifier).run()
         except Exception as e:
             print("Audio error:", e)
             time.sleep(0.5)
 
-def start_audio_thread():
-    t = threading.Thread(target=audio_loop, daemon=True)
+def start_audio_thread(channels=1, device=None, tracker=False):
+    """channels > 1 enables direction finding with the default mic array;
+    tracker=True uses the low-latency siren_tracker (mono) instead."""
+    t = threading.Thread(target=audio_loop, args=(channels, device, tracker), daemon=True)
     t.start()
     return t
 
+def analyze_wav(path, window_seconds=0.8, hop_seconds=0.1, block_seconds=60.0,
+                classifier=None):
+    """Offline siren analysis of a WAV file, streamed from a memory map.
+
+    Returns (times, result): window end times in seconds and the
+    detect_siren_batch arrays. With a classifier its decisions replace
+    the heuristic is_siren.
+    """
+    from audio_source import WavStream
+    source = WavStream(path, block_seconds=block_seconds, realtime=False)
+    sample_rate = source.sample_rate
+    window = int(window_seconds * sample_rate)
+    hop = int(hop_seconds * sample_rate)
+    tail = np.zeros(0, dtype=np.float32)  # samples not yet covered by a window start
+    parts = []
+    for block in source.blocks():
+        signal = np.concatenate([tail, block])
+        part = detect_siren_batch(signal, sample_rate, window, hop)
+        if classifier is not None and len(part["is_siren"]):
+            part["is_siren"] = classifier.predict(frame_signal(signal, window, hop), sample_rate)
+        tail = signal[len(part["is_siren"]) * hop:]
+        parts.append(part)
+    result = {key: np.concatenate([p[key] for p in parts]) if parts else
+              np.zeros(0, dtype=bool if key == "is_siren" else np.float32)
+              for key in ("ratio", "band_energy", "total_energy", "is_siren", "pitch")}
+    times = (np.arange(len(result["is_siren"])) * hop + window) / sample_rate
+    return times, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Siren detection (live microphone or WAV file)")
+    parser.add_argument("--wav", type=str, default=None, help="Analyse a WAV file instead of the microphone")
+    parser.add_argument("--csv", type=str, default=None, help="With --wav, write per-window results here")
+    parser.add_argument("--channels", type=int, default=1,
+                        help="Input channels; 4 enables direction finding with the mic array")
+    parser.add_argument("--tracker", action="store_true",
+                        help="Use the incremental sliding-DFT tracker (siren_tracker.py)")
+    args = parser.parse_args()
+
+    if args.wav is None:
+        start_audio_thread(args.channels, tracker=args.tracker)
+        while True:
+            audio = shared_state.audio  # one consistent snapshot
+            if args.channels > 1:
+                conf = " ".join(f"{lane}={c:.2f}" for lane, c in audio.lane_confidence.items())
+                print("Siren:", audio.siren_detected, "bearing:", audio.bearing, conf)
+            else:
+                print("Siren:", audio.siren_detected)
+            time.sleep(0.5)
+
+    from siren_classifier import load_default
+    t0 = time.time()
+    times, result = analyze_wav(args.wav, classifier=load_default())
+    elapsed = time.time() - t0
+    print(f"{len(times)} windows ({times[-1] if len(times) else 0:.1f}s of audio) in {elapsed:.2f}s, "
+          f"siren in {int(result['is_siren'].sum())}")
+    if args.csv:
+        np.savetxt(args.csv, np.column_stack([times, result["ratio"], result["band_energy"],
+                                              result["total_energy"], result["is_siren"]]),
+                   delimiter=",", header="time_s,ratio,band_energy,total_energy,is_siren",
+                   comments="", fmt=["%.3f", "%.4f", "%.1f", "%.1f", "%d"])
+        print(f"Wrote {args.csv}")
+
 if __name__ == "__main__":
-    start_audio_thread()
-    while True:
-        with shared_state.lock:
-            print("Siren:", shared_state.siren_detected)
-        time.sleep(0.5)
+    main()
@@ -0,0 +1,183 @@
+# tracker.py
+"""
+Lightweight IoU multi-object tracker.
+
+Runs after the detector and gives every vehicle a stable track id. Tracks
+carry a constant-velocity motion model, so on frames where inference is
+skipped their boxes are predicted forward instead of disappearing. Emergency
+status is voted per track over time rather than decided from one frame.
+"""
+
+import itertools
+import numpy as np
+from detections import empty_detections
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (n, 4) and (m, 4) xyxy boxes."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+def _boxes(dets):
+    if len(dets) == 0:
+        return np.zeros((0, 4), np.float32)
+    return np.stack([dets["x1"], dets["y1"], dets["x2"], dets["y2"]], axis=1).astype(np.float32)
+
+def greedy_match(iou, threshold):
+    """Highest-IoU-first assignment. Returns (pairs, unmatched_rows, unmatched_cols)."""
+    pairs = []
+    if iou.size:
+        rows, cols = np.nonzero(iou >= threshold)
+        order = np.argsort(-iou[rows, cols])
+        used_r, used_c = set(), set()
+        for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+            if r in used_r or c in used_c:
+                continue
+            used_r.add(r)
+            used_c.add(c)
+            pairs.append((r, c))
+    matched_r = {r for r, _ in pairs}
+    matched_c = {c for _, c in pairs}
+    return (pairs,
+            [r for r in range(iou.shape[0]) if r not in matched_r],
+            [c for c in range(iou.shape[1]) if c not in matched_c])
+
+class IoUTracker:
+    """Tracks boxes of one camera/lane across detector and skipped frames."""
+
+    _ids = itertools.count(1)  # ids are unique across all trackers
+
+    def __init__(self, iou_threshold=0.3, max_age=1.0, min_hits=2,
+                 velocity_smoothing=0.5, emergency_alpha=0.4,
+                 emergency_on=0.6, emergency_off=0.3):
+        """
+        max_age: seconds a track survives without a matching detection.
+        min_hits: detections before a track is reported.
+        emergency_alpha: weight of each new vote in the per-track score.
+        emergency_on / emergency_off: hysteresis thresholds on that score.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.velocity_smoothing = velocity_smoothing
+        self.emergency_alpha = emergency_alpha
+        self.emergency_on = emergency_on
+        self.emergency_off = emergency_off
+
+        self.boxes = np.zeros((0, 4), dtype=np.float32)     # xyxy at last_time
+        self.measured = np.zeros((0, 4), dtype=np.float32)  # xyxy of the last detection
+        self.velocity = np.zeros((0, 4), dtype=np.float32)  # px per second
+        self.last_seen = np.zeros(0)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.emergency_score = np.zeros(0, dtype=np.float32)
+        self.emergency = np.zeros(0, dtype=np.bool_)
+        self.meta = empty_detections()  # label/cls/conf/lane of the last detection
+        self.last_time = None
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _advance(self, now):
+        if self.last_time is not None and len(self.boxes):
+            self.boxes += self.velocity * (now - self.last_time)
+        self.last_time = now
+
+    def _prune(self, now):
+        keep = (now - self.last_seen) <= self.max_age
+        if not keep.all():
+            self.boxes = self.boxes[keep]
+            self.measured = self.measured[keep]
+            self.velocity = self.velocity[keep]
+            self.last_seen = self.last_seen[keep]
+            self.hits = self.hits[keep]
+            self.emergency_score = self.emergency_score[keep]
+            self.emergency = self.emergency[keep]
+            self.meta = self.meta[keep]
+
+    def match(self, dets, now):
+        """A copy of dets carrying the id of the track each box will join in
+        update(dets, now) (-1: a new track). The tracker is not changed, so a
+        per-frame stage can key its results by track before the update."""
+        boxes = self.boxes
+        if self.last_time is not None and len(boxes):
+            boxes = boxes + self.velocity * (now - self.last_time)
+        pairs, _, _ = greedy_match(iou_matrix(boxes, _boxes(dets)), self.iou_threshold)
+        out = dets.copy()
+        for r, c in pairs:
+            out["track_id"][c] = self.meta["track_id"][r]
+        return out
+
+    def update(self, dets, now):
+        """Fold in a detector frame; returns the tracked detections."""
+        self._advance(now)
+
+        det_boxes = _boxes(dets)
+        pairs, _, new_cols = greedy_match(iou_matrix(self.boxes, det_boxes), self.iou_threshold)
+
+        if pairs:
+            rows = np.array([r for r, _ in pairs])
+            cols = np.array([c for _, c in pairs])
+            # velocity from detection to detection, ignoring predicted frames
+            dt = (now - self.last_seen[rows]).astype(np.float32)
+            moved = dt > 0
+            if moved.any():
+                r, c = rows[moved], cols[moved]
+                measured = (det_boxes[c] - self.measured[r]) / dt[moved, None]
+                k = self.velocity_smoothing
+                self.velocity[r] = k * self.velocity[r] + (1 - k) * measured
+            self.boxes[rows] = det_boxes[cols]
+            self.measured[rows] = det_boxes[cols]
+            self.last_seen[rows] = now
+            self.hits[rows] += 1
+            votes = dets["is_emergency"][cols].astype(np.float32)
+            a = self.emergency_alpha
+            self.emergency_score[rows] = (1 - a) * self.emergency_score[rows] + a * votes
+            track_ids = self.meta["track_id"][rows]
+            self.meta[rows] = dets[cols]
+            self.meta["track_id"][rows] = track_ids
+
+        if new_cols:
+            cols = np.array(new_cols)
+            n = len(cols)
+            self.boxes = np.concatenate([self.boxes, det_boxes[cols]])
+            self.measured = np.concatenate([self.measured, det_boxes[cols]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((n, 4), np.float32)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(n, now)])
+            self.hits = np.concatenate([self.hits, np.ones(n, np.int32)])
+            self.emergency_score = np.concatenate(
+                [self.emergency_score, dets["is_emergency"][cols] * self.emergency_alpha])
+            self.emergency = np.concatenate([self.emergency, np.zeros(n, np.bool_)])
+            meta = dets[cols].copy()
+            meta["track_id"] = [next(self._ids) for _ in range(n)]
+            self.meta = np.concatenate([self.meta, meta])
+
+        # hysteresis so one missed vote doesn't flip the track
+        self.emergency = np.where(self.emergency, self.emergency_score > self.emergency_off,
+                                  self.emergency_score >= self.emergency_on)
+        self._prune(now)
+        return self.tracks()
+
+    def predict(self, now):
+        """Move tracks forward for a frame the detector skipped."""
+        self._advance(now)
+        self._prune(now)
+        return self.tracks()
+
+    def tracks(self):
+        """Confirmed tracks as a detection array (boxes at last update/predict)."""
+        confirmed = self.hits >= self.min_hits
+        out = self.meta[confirmed].copy()
+        boxes = np.rint(self.boxes[confirmed]).astype(np.int32)
+        out["x1"], out["y1"], out["x2"], out["y2"] = boxes.T if len(boxes) else ([], [], [], [])
+        out["is_emergency"] = self.emergency[confirmed]
+        return out
+
+    def has_emergency(self):
+        return bool((self.emergency & (self.hits >= self.min_hits)).any())
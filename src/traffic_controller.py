@@ -1,95 +1,224 @@
 # traffic_controller.py
+import threading
 import time
+from collections import deque
+import numpy as np
 from utils import shared_state
+# the cycle timing lives with the engine; re-exported for existing imports
+from intersections import (CYCLE_TIME, GREEN_TIME, MODES, NO_LANE, POST_PRIORITY_BUFFER,
+                           RED_TIME, YELLOW_TIME, IntersectionEngine)
+from records import Lights
 
-# Timing for normal cycle (8 seconds per lane: 6s GREEN + 1s YELLOW + 1s RED)
-GREEN_TIME = 6.0      # 6 seconds green per lane in normal mode
-YELLOW_TIME = 1.0     # 1 second yellow
-RED_TIME = 1.0        # 1 second red (transition time)
-CYCLE_TIME = GREEN_TIME + YELLOW_TIME + RED_TIME  # 8 seconds total per lane
-POST_PRIORITY_BUFFER = 0.0  # seconds after ambulance before returning to normal (set to 0 to remove delay)
+# per-lane siren confidence (mic array) that preempts a lane. The Doppler
+# ETA is not used to time preemption: the pitch only starts to drop about a
+# second before the pass, too late to clear a lane (doppler.py); Doppler
+# only releases priority once the siren is RECEDING.
+AUDIO_PREEMPT_THRESHOLD = 0.8
+AUDIO_STALE_AFTER = 1.0  # seconds: an older audio snapshot (stalled stream) is ignored
 
 LANES = ["N", "E", "S", "W"]
+TICK_RATE = 20.0  # controller updates per second (ControllerScheduler)
+JITTER_SAMPLES = 1000  # recent ticks kept for the jitter statistics
 
 class TrafficController:
-    def __init__(self):
-        self.current_lane_idx = 0  # which lane is currently green (0=N, 1=E, 2=S, 3=W)
-        self.mode = "NORMAL"  # or "PRIORITY"
-        self.lights = {l: "RED" for l in LANES}
-        self.lights["N"] = "GREEN"  # Start with North green
-        self.last_switch = time.time()
-        self.priority_lane = None
-        self.priority_start_time = 0
+    """One intersection: a row of an IntersectionEngine fed from shared_state.
+
+    By default the controller owns a one-intersection engine. Given a
+    shared engine (a corridor), it is a view of row `index`; update() then
+    steps the whole engine, so a corridor driver should rather set the
+    inputs of all rows and call engine.step() once per tick itself.
+    """
+
+    def __init__(self, engine=None, index=0):
+        self.engine = engine or IntersectionEngine(1, lanes=len(LANES), now=time.time())
+        self.index = index
+        self._row = np.array([index])
+        self._lock = threading.Lock()  # one update() at a time
+
+    # the single-intersection attributes, read from (and written to) the engine
+    @property
+    def current_lane_idx(self):
+        """Which lane's turn it is in the normal cycle (0=N, 1=E, 2=S, 3=W)."""
+        return int(self.engine.phase[self.index])
+
+    @property
+    def mode(self):
+        return MODES[self.engine.mode[self.index]]
+
+    @mode.setter
+    def mode(self, mode):
+        self.engine.mode[self.index] = MODES.index(mode)
+
+    @property
+    def priority_lane(self):
+        lane = self.engine.priority[self.index]
+        return LANES[lane] if lane != NO_LANE else None
+
+    @priority_lane.setter
+    def priority_lane(self, lane):
+        self.engine.priority[self.index] = LANES.index(lane) if lane else NO_LANE
+
+    @property
+    def last_switch(self):
+        return float(self.engine.last_switch[self.index])
+
+    @property
+    def priority_start_time(self):
+        return float(self.engine.priority_start[self.index])
+
+    @property
+    def lights(self):
+        """Read-only lane -> "RED"/"YELLOW"/"GREEN" mapping (records.Lights)."""
+        return Lights.from_codes(self.engine.lights[self.index].astype(np.uint8))
 
     def set_priority(self, lane):
         """Set traffic to priority mode for a specific lane."""
         if lane not in LANES:
             return
-        self.mode = "PRIORITY"
-        self.priority_lane = lane
-        self.priority_start_time = time.time()
-        
         # All red except priority lane
-        for l in LANES:
-            self.lights[l] = "RED"
-        self.lights[lane] = "GREEN"
-        self.last_switch = time.time()
+        self.engine.set_priority(self._row, LANES.index(lane), time.time())
 
     def normal_cycle_step(self):
         """Cycle through lanes N->E->S->W in normal mode with 8s per lane (6G + 1Y + 1R)."""
-        now = time.time()
-        
-        # Check if time to switch to next lane (complete 8s cycle)
-        if now - self.last_switch > CYCLE_TIME:
-            self.current_lane_idx = (self.current_lane_idx + 1) % len(LANES)
-            self.last_switch = now
-        
-        # Update light states
-        for i, lane in enumerate(LANES):
-            elapsed = now - self.last_switch
-            
-            if i == self.current_lane_idx:
-                # This lane is currently cycling
-                if elapsed <= GREEN_TIME:
-                    self.lights[lane] = "GREEN"
-                elif elapsed <= GREEN_TIME + YELLOW_TIME:
-                    self.lights[lane] = "YELLOW"
-                else:
-                    self.lights[lane] = "RED"
-            else:
-                self.lights[lane] = "RED"
+        self.engine.normal_cycle_step(self._row, time.time())
 
     def update(self):
-        """Update traffic controller state based on detections."""
-        with shared_state.lock:
+        """Update traffic controller state based on detections.
+
+        Reads one snapshot of the sensors (no shared lock) and publishes the
+        resulting lights as a new control snapshot. Only ControllerScheduler
+        calls this, at a fixed rate; everything else reads the published
+        snapshot (shared_state.control). The private lock keeps a direct call
+        (e.g. from a test or a script) from interleaving with a tick.
+        """
+        snap = shared_state.snapshot()
+        now = time.time()
+        # a stalled audio stream must not hold a lane with its last siren
+        audio = snap.audio if now - snap.audio.timestamp <= AUDIO_STALE_AFTER else None
+        with self._lock:
             # Check if any lane has ambulance
             ambulance_lane = None
             for lane in LANES:
-                if shared_state.ambulance_detected[lane]:
+                if snap.lanes[lane].ambulance:
                     ambulance_lane = lane
                     break
+            if ambulance_lane is None and audio is not None:
+                # not in camera view yet: a siren located by the mic array
+                lane, conf = max(audio.lane_confidence.items(), key=lambda kv: kv[1])
+                # a siren that has passed (RECEDING) no longer preempts
+                if conf >= AUDIO_PREEMPT_THRESHOLD and audio.approach != "RECEDING":
+                    ambulance_lane = lane
             
-            if ambulance_lane:
-                # Priority mode: ambulance detected
-                self.set_priority(ambulance_lane)
-                shared_state.priority_mode = True
-                shared_state.priority_lane = ambulance_lane
-            else:
-                # No ambulance detected
-                if self.mode == "PRIORITY":
-                    # Check if enough time has passed since last ambulance
-                    if time.time() - shared_state.last_emergency_time > POST_PRIORITY_BUFFER:
-                        # Return to normal cycling
-                        self.mode = "NORMAL"
-                        shared_state.priority_mode = False
-                        shared_state.priority_lane = None
-                        # Keep current lane green and continue cycle
-                
-                # Normal cycling
-                if self.mode == "NORMAL":
-                    self.normal_cycle_step()
-        
-        return self.lights, self.mode, self.priority_lane
+            # Priority mode while an ambulance is detected; otherwise back to
+            # the normal cycle once the siren recedes or the buffer has passed
+            engine, i = self.engine, self.index
+            engine.ambulance[i] = LANES.index(ambulance_lane) if ambulance_lane else NO_LANE
+            engine.receding[i] = audio is not None and audio.approach == "RECEDING"
+            engine.last_emergency[i] = shared_state.last_emergency_time
+            engine.step(now)
+
+            control = shared_state.control
+            lights, mode, priority_lane = self.lights, self.mode, self.priority_lane
+            if (control.lights != lights or control.mode != mode
+                    or control.priority_lane != priority_lane):
+                shared_state.publish_control(lights, mode, priority_lane)
+            return dict(lights), mode, priority_lane
 
 # Global controller instance
 controller = TrafficController()
+
+class ControllerScheduler:
+    """Runs TrafficController.update() at a fixed rate from one thread.
+
+    Ticks are due at absolute deadlines (start + k / rate), so a slow tick
+    doesn't shift the ones after it. A tick that starts late counts towards
+    the jitter statistics; if an update overruns whole periods, the missed
+    ticks are skipped (counted, not replayed in a burst).
+    """
+
+    def __init__(self, ctrl=None, rate=TICK_RATE):
+        self.ctrl = ctrl or controller
+        self.period = 1.0 / rate
+        self.ticks = 0
+        self.missed = 0  # deadlines skipped because an update overran
+        self._lateness = deque(maxlen=JITTER_SAMPLES)  # tick start - deadline, seconds
+        self._duration = deque(maxlen=JITTER_SAMPLES)  # update() time, seconds
+
+    def run(self, stop=None, tick=None):
+        """Tick until stop (a threading.Event) is set; tick() after each update."""
+        stop = stop or threading.Event()
+        deadline = time.perf_counter()
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining > 0 and stop.wait(remaining):
+                return
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            self.ctrl.update()
+            end = time.perf_counter()
+            self._lateness.append(start - deadline)
+            self._duration.append(end - start)
+            self.ticks += 1
+            if tick is not None:
+                tick()
+            deadline += self.period
+            if end > deadline:
+                skipped = int((end - deadline) // self.period) + 1
+                self.missed += skipped
+                deadline += skipped * self.period
+
+    def stats(self):
+        """Tick counters and jitter/update-time percentiles (ms) over recent ticks."""
+        out = {"rate": 1.0 / self.period, "ticks": self.ticks, "missed": self.missed}
+        for name, samples in (("jitter", self._lateness), ("update", self._duration)):
+            ms = np.array(list(samples) or [0.0]) * 1000
+            out[f"{name}_mean_ms"] = round(float(ms.mean()), 3)
+            out[f"{name}_p99_ms"] = round(float(np.percentile(ms, 99)), 3)
+            out[f"{name}_max_ms"] = round(float(ms.max()), 3)
+        return out
+
+scheduler = ControllerScheduler(controller)
+
+def controller_loop(ctrl=None, stop=None):
+    """Drive the controller at TICK_RATE until stop is set."""
+    sched = scheduler if ctrl is None or ctrl is controller else ControllerScheduler(ctrl)
+    sched.run(stop)
+
+_controller_thread = None
+
+def start_controller_thread():
+    """Run the controller scheduler in a daemon thread (once per process)."""
+    global _controller_thread
+    if _controller_thread is None or not _controller_thread.is_alive():
+        _controller_thread = threading.Thread(target=scheduler.run, name="controller", daemon=True)
+        _controller_thread.start()
+    return _controller_thread
+
+def _self_check():
+    ctrl = TrafficController()
+    shared_state.publish_audio(siren_detected=True, approach=None, eta=None,
+                               lane_confidence={"N": 0.0, "E": 0.7, "S": 0.1, "W": 0.0})
+    _, mode, lane = ctrl.update()
+    assert (mode, lane) == ("NORMAL", None), (mode, lane)
+    print(f"siren located with confidence 0.7: {mode}")
+    shared_state.publish_audio(siren_detected=True, approach=None, eta=None,
+                               lane_confidence={"N": 0.0, "E": 0.9, "S": 0.1, "W": 0.0})
+    _, mode, lane = ctrl.update()
+    assert (mode, lane) == ("PRIORITY", "E"), (mode, lane)
+    print(f"fresh siren, no Doppler estimate yet: {mode} for lane {lane}")
+    shared_state.publish_audio(approach="RECEDING")
+    _, mode, lane = ctrl.update()
+    assert (mode, lane) == ("NORMAL", None), (mode, lane)
+    print(f"Doppler says RECEDING: {mode}, priority released")
+    shared_state.publish_audio(approach=None)
+    assert ctrl.update()[1] == "PRIORITY"
+    # the audio stream stalls: its last snapshot (still a siren) ages out
+    shared_state.audio = shared_state.audio._replace(
+        timestamp=time.time() - AUDIO_STALE_AFTER - 0.5)
+    _, mode, lane = ctrl.update()
+    assert (mode, lane) == ("NORMAL", None), (mode, lane)
+    print(f"stale siren ({AUDIO_STALE_AFTER + 0.5:.1f} s old): {mode}, priority released")
+
+if __name__ == "__main__":
+    _self_check()
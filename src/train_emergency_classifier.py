@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Collect vehicle crops and train the second-stage emergency classifier.
+
+No weights ship with the repo, so out of the box EmergencyStage is off and
+nothing beyond the COCO detector (which has no emergency classes) flags
+emergency vehicles. This script produces EMERGENCY_CLASSIFIER_WEIGHTS:
+
+1. collect: run the detector over videos and save every car/truck/bus crop
+   (CROP_SIZE square, as the stage sees them) into one folder;
+2. sort the crops by hand into an ultralytics classification dataset,
+
+       data/train/ambulance/  data/train/civilian/
+       data/val/ambulance/    data/val/civilian/
+
+   (any class whose name contains ambulance/fire/police counts as
+   emergency, e.g. fire_truck, police_car);
+3. train: fine-tune a small classification model, report the emergency
+   recall and false-positive rate on val next to the colour heuristic, and
+   install the weights where EmergencyClassifier looks for them.
+
+Usage:
+    python train_emergency_classifier.py collect lane_n.mp4 lane_e.mp4 --out crops/
+    python train_emergency_classifier.py train data/ --epochs 30
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import cv2
+import numpy as np
+import detections
+from detections import EMERGENCY_KEYWORDS
+from emergency_classifier import (CROP_SIZE, EMERGENCY_CLASSIFIER_WEIGHTS, VEHICLE_LABELS,
+                                  EmergencyClassifier, colour_scores)
+
+BASE_MODEL = "yolov8n-cls.pt"
+
+def collect(videos, out_dir, every=5, conf=0.35):
+    """Save the vehicle crops of every `every`-th frame; returns the count."""
+    from camera_detection import resize_for_inference
+    from model_registry import get_model
+    model = get_model()
+    os.makedirs(out_dir, exist_ok=True)
+    saved = 0
+    for video in videos:
+        cap = cv2.VideoCapture(video)
+        name = os.path.splitext(os.path.basename(video))[0]
+        index = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            index += 1
+            if index % every:
+                continue
+            small = resize_for_inference(frame)
+            dets = detections.from_yolo(model(small, conf=conf, verbose=False)[0],
+                                        frame.shape, small.shape)
+            dets = dets[np.isin(dets["label"], VEHICLE_LABELS)]
+            for j, (x1, y1, x2, y2) in enumerate(zip(dets["x1"].tolist(), dets["y1"].tolist(),
+                                                     dets["x2"].tolist(), dets["y2"].tolist())):
+                crop = frame[max(y1, 0):y2, max(x1, 0):x2]
+                if crop.size:
+                    cv2.imwrite(os.path.join(out_dir, f"{name}_{index:06d}_{j}.jpg"),
+                                cv2.resize(crop, (CROP_SIZE, CROP_SIZE)))
+                    saved += 1
+        cap.release()
+    return saved
+
+def _load_split(data, split):
+    """(crops, is_emergency, class names) of a dataset split."""
+    crops, labels, names = [], [], []
+    for class_dir in sorted(glob.glob(os.path.join(data, split, "*", ""))):
+        name = os.path.basename(os.path.dirname(class_dir))
+        emergency = any(k in name.lower() for k in EMERGENCY_KEYWORDS)
+        for path in sorted(glob.glob(os.path.join(class_dir, "*"))):
+            image = cv2.imread(path)
+            if image is not None:
+                crops.append(cv2.resize(image, (CROP_SIZE, CROP_SIZE)))
+                labels.append(emergency)
+                names.append(name)
+    return np.array(crops, dtype=np.uint8).reshape(-1, CROP_SIZE, CROP_SIZE, 3), \
+        np.array(labels, dtype=bool), names
+
+def report(name, probs, labels, threshold=0.5):
+    flagged = probs >= threshold
+    recall = flagged[labels].mean() if labels.any() else float("nan")
+    false_pos = flagged[~labels].mean() if (~labels).any() else float("nan")
+    print(f"{name:10} emergency recall {recall:6.1%}  false positives {false_pos:6.1%}")
+
+def train(data, epochs=30, base=BASE_MODEL, out=EMERGENCY_CLASSIFIER_WEIGHTS):
+    from ultralytics import YOLO
+    model = YOLO(base)
+    model.train(data=data, epochs=epochs, imgsz=CROP_SIZE, verbose=False)
+    best = os.path.join(str(model.trainer.save_dir), "weights", "best.pt")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    shutil.copyfile(best, out)
+    print(f"\nSaved {out}\n")
+
+    crops, labels, _ = _load_split(data, "val")
+    if len(crops):
+        report("trained", EmergencyClassifier(out).predict(crops), labels)
+        report("heuristic", colour_scores(crops), labels)
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the second-stage emergency classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("collect", help="Save vehicle crops from videos for labelling")
+    p.add_argument("videos", nargs="+")
+    p.add_argument("--out", default="crops", help="Folder for the crops")
+    p.add_argument("--every", type=int, default=5, help="Use every n-th frame")
+    p = sub.add_parser("train", help="Train on a labelled crop dataset and install the weights")
+    p.add_argument("data", help="Dataset root with train/<class>/ and val/<class>/ folders")
+    p.add_argument("--epochs", type=int, default=30)
+    p.add_argument("--base", default=BASE_MODEL, help="Classification model to fine-tune")
+    p.add_argument("--out", default=EMERGENCY_CLASSIFIER_WEIGHTS)
+    args = parser.parse_args()
+
+    if args.command == "collect":
+        print(f"Saved {collect(args.videos, args.out, args.every)} crops to {args.out}")
+    else:
+        train(args.data, args.epochs, args.base, args.out)
+
+if __name__ == "__main__":
+    main()
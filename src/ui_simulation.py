@@ -2,7 +2,9 @@
 import pygame
 import cv2
 import numpy as np
-from utils import shared_state
+from utils import all_detections, shared_state
+from detections import iter_boxes
+from frame_pool import FramePool
 
 # Pygame colors
 COLORS = {
@@ -21,15 +23,13 @@ def cvimage_to_pygame(image):
     surface = pygame.surfarray.make_surface(image)
     return surface
 
+# boxes are drawn on a pooled copy: no allocation per redraw
+_draw_pool = FramePool(slots=2)
+
 def draw_detections_on_frame(frame, detections):
     """Draw bounding boxes and labels on frame."""
-    frame_copy = frame.copy()
-    for det in detections:
-        x1, y1, x2, y2 = det["x1"], det["y1"], det["x2"], det["y2"]
-        label = det["label"]
-        conf = det["conf"]
-        is_emergency = det["is_emergency"]
-        
+    frame_copy = _draw_pool.copy(frame)
+    for x1, y1, x2, y2, label, conf, is_emergency in iter_boxes(detections):
         # Use bright color for emergency, dim for others
         if is_emergency:
             color = (0, 0, 255)  # Red in BGR
@@ -118,10 +118,11 @@ class TrafficUI:
             self.screen.blit(self.bigfont.render(pr_text, True, (255,200,0)), (20, 60))
 
         # show small camera preview if available
-        with shared_state.lock:
-            frame = shared_state.camera_frame.copy() if shared_state.camera_frame is not None else None
-            detections = shared_state.detections.copy() if shared_state.detections else []
-            siren_flag = shared_state.siren_detected
+        # one consistent snapshot; the box drawer copies the read-only frame
+        snap = shared_state.snapshot()
+        frame = snap.overhead.frame
+        detections = all_detections(snap)
+        siren_flag = snap.audio.siren_detected
 
         if frame is not None:
             # Draw bounding boxes on frame
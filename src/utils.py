@@ -1,40 +1,284 @@
 # utils.py
+"""
+Shared state between the sensor threads, the controller and the UIs.
+
+Every piece of state is an immutable, versioned snapshot (a namedtuple). A
+writer builds a new snapshot and swaps it in with one reference assignment,
+which is atomic in CPython, so readers never take a lock, never block a
+writer and never see a half-written update. Arrays inside a snapshot are
+read-only views, so readers use them without copying.
+
+Each snapshot has a single writer: the camera engine for a lane, the audio
+stream, the traffic controller. Versions come from one global counter, so
+changed_since(v) tells a reader whether anything was published after the
+snapshot it last looked at.
+
+Instead of polling, a consumer subscribes to topics and sleeps until one of
+them is published (threads with wait(), asyncio tasks with wait_async()):
+
+    "frame:N"        new camera frame for lane N (E/S/W alike)
+    "detections:N"   new detections / ambulance flag for lane N
+    "frame:overhead" new frame from the single overhead camera
+    "siren"          new audio snapshot
+    "lights"         the controller published different lights or mode
+    "params"         new vehicle simulation parameters
+
+    sub = shared_state.subscribe("lights", "siren")
+    while True:
+        changed = sub.wait(timeout=1.0)  # [] on timeout
+"""
+
+import asyncio
+import itertools
 import threading
 import time
+from collections import namedtuple
+from detections import LANES, concat, empty_detections
+from frame_pool import readonly as _readonly
+from records import Lights
+
+LaneSnapshot = namedtuple("LaneSnapshot", "version frame detections ambulance timestamp")
+AudioSnapshot = namedtuple("AudioSnapshot", "version siren_detected bearing lane_confidence "
+                                            "approach eta speed timestamp")
+ControlSnapshot = namedtuple("ControlSnapshot", "version lights mode priority_lane timestamp")
+StateSnapshot = namedtuple("StateSnapshot", "version lanes overhead audio control")
+
+_KEEP = object()  # publish_lane: leave this field as it was
+
+def frame_topic(lane):
+    return f"frame:{lane}"
+
+def detections_topic(lane):
+    return f"detections:{lane}"
+
+OVERHEAD_TOPIC = "frame:overhead"
+SIREN_TOPIC = "siren"
+LIGHTS_TOPIC = "lights"
+PARAMS_TOPIC = "params"
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+class Subscription:
+    """Topics one consumer waits on, with the versions it has already seen."""
+
+    def __init__(self, state, topics):
+        self.state = state
+        self.topics = tuple(topics)
+        self.seen = {topic: state.topic_version(topic) for topic in self.topics}
+
+    def pending(self):
+        """Topics published since they were last taken."""
+        return [t for t in self.topics if self.state.topic_version(t) > self.seen[t]]
+
+    def _take(self):
+        changed = self.pending()
+        for topic in changed:
+            self.seen[topic] = self.state.topic_version(topic)
+        return changed
+
+    def wait(self, timeout=None):
+        """Block until a topic is published; the changed topics, [] on timeout."""
+        with self.state._changed:
+            self.state._changed.wait_for(self.pending, timeout)
+            return self._take()
+
+    async def wait_async(self, timeout=None):
+        """wait() for asyncio: suspends the task, not the event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self.state._changed:
+                if self.pending():
+                    return self._take()
+                future = loop.create_future()
+                self.state._async_waiters.add((loop, future))
+            try:
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return []
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return []
+            finally:
+                with self.state._changed:
+                    self.state._async_waiters.discard((loop, future))
 
 class SharedState:
     def __init__(self):
-        self.lock = threading.Lock()
-        # 4-lane camera system
-        self.camera_frames = {
-            "N": None,  # North
-            "E": None,  # East
-            "S": None,  # South
-            "W": None   # West
-        }
-        self.detections = {
-            "N": [],  # detections per lane
-            "E": [],
-            "S": [],
-            "W": []
-        }
-        self.ambulance_detected = {
-            "N": False,  # ambulance per lane
-            "E": False,
-            "S": False,
-            "W": False
-        }
-        # priority/control
-        self.priority_mode = False
-        self.priority_lane = None  # which lane has ambulance (N/E/S/W)
+        self._versions = itertools.count(1)  # next() is atomic
+        # 4-lane camera system: one snapshot per lane (N/E/S/W)
+        self.lanes = {lane: LaneSnapshot(0, None, _readonly(empty_detections()), False, 0.0)
+                      for lane in LANES}
+        # single overhead camera (camera_loop)
+        self.overhead = LaneSnapshot(0, None, _readonly(empty_detections()), False, 0.0)
+        # siren_detected; mic array only (doa.py): bearing in degrees and
+        # per-lane confidence 0..1; Doppler (doppler.py): "APPROACHING" /
+        # "RECEDING" / None, seconds to closest approach, speed in m/s
+        self.audio = AudioSnapshot(0, False, None, {lane: 0.0 for lane in LANES},
+                                   None, None, None, 0.0)
+        # lights (records.Lights) and mode as last published by the traffic controller
+        self.control = ControlSnapshot(0, Lights.from_mapping({}), "NORMAL", None, 0.0)
         self.last_emergency_time = 0.0
-        self.siren_detected = False
         # Parameters for vehicle simulation (can be updated at runtime via dashboard)
         # spawn_interval: tuple(min_seconds, max_seconds)
         # speed_multiplier: float applied to spawned vehicle speeds
+        # (replaced as a whole, never mutated)
         self.vehicle_params = {
             "spawn_interval": (2.0, 5.0),
             "speed_multiplier": 1.0
         }
+        # pub/sub: latest version per topic; held only to notify, never by readers
+        self._topic_versions = {}
+        self._changed = threading.Condition(threading.Lock())
+        self._async_waiters = set()
+
+    # --- pub/sub ---
+
+    def subscribe(self, *topics):
+        return Subscription(self, topics)
+
+    def topic_version(self, topic):
+        return self._topic_versions.get(topic, 0)
+
+    def _notify(self, version, *topics):
+        with self._changed:
+            for topic in topics:
+                self._topic_versions[topic] = version
+            self._changed.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    # --- writers ---
+
+    def publish_lane(self, lane, frame=_KEEP, detections=_KEEP, ambulance=_KEEP, now=None):
+        """Swap in a new snapshot for one lane; returns its version."""
+        old = self.lanes[lane]
+        now = now or time.time()
+        snap = LaneSnapshot(
+            next(self._versions),
+            old.frame if frame is _KEEP else _readonly(frame),
+            old.detections if detections is _KEEP else _readonly(detections),
+            old.ambulance if ambulance is _KEEP else bool(ambulance),
+            now,
+        )
+        self.lanes[lane] = snap
+        if snap.ambulance:
+            self.last_emergency_time = now
+        topics = []
+        if frame is not _KEEP:
+            topics.append(frame_topic(lane))
+        if detections is not _KEEP or ambulance is not _KEEP:
+            topics.append(detections_topic(lane))
+        self._notify(snap.version, *topics)
+        return snap.version
+
+    def publish_overhead(self, frame):
+        self.overhead = LaneSnapshot(next(self._versions), _readonly(frame),
+                                     self.overhead.detections, False, time.time())
+        self._notify(self.overhead.version, OVERHEAD_TOPIC)
+        return self.overhead.version
+
+    def publish_audio(self, timestamp=None, **fields):
+        """Swap in a new audio snapshot with the given fields replaced.
+
+        timestamp: when the fields were measured (default now), e.g. by the
+        process that shared them (shm_state.py).
+        """
+        now = timestamp or time.time()
+        old = self.audio
+        snap = old._replace(version=next(self._versions), timestamp=now, **fields)
+        self.audio = snap
+        if snap.siren_detected:
+            self.last_emergency_time = now
+        if snap[1:-1] != old[1:-1]:  # the stream republishes every hop; wake on change only
+            self._notify(snap.version, SIREN_TOPIC)
+        return snap.version
+
+    def publish_vehicle_params(self, params):
+        """Replace vehicle_params as a whole (readers never see a mix)."""
+        self.vehicle_params = dict(params)
+        self._notify(next(self._versions), PARAMS_TOPIC)
+
+    def publish_control(self, lights, mode, priority_lane):
+        self.control = ControlSnapshot(next(self._versions), Lights.from_mapping(lights), mode,
+                                       priority_lane, time.time())
+        self._notify(self.control.version, LIGHTS_TOPIC)
+        return self.control.version
+
+    # --- readers ---
+
+    @property
+    def version(self):
+        """Version of the newest snapshot published so far."""
+        return max(max(s.version for s in self.lanes.values()), self.overhead.version,
+                   self.audio.version, self.control.version)
+
+    def snapshot(self):
+        """Every part at once, without blocking anyone."""
+        return StateSnapshot(self.version, dict(self.lanes), self.overhead,
+                             self.audio, self.control)
+
+    def changed_since(self, version):
+        return self.version > version
+
+    def lanes_changed_since(self, version):
+        return [lane for lane, snap in self.lanes.items() if snap.version > version]
+
+    # --- read-only views in the old attribute shapes ---
+
+    @property
+    def camera_frames(self):
+        return {lane: snap.frame for lane, snap in self.lanes.items()}
+
+    @property
+    def detections(self):
+        return {lane: snap.detections for lane, snap in self.lanes.items()}
+
+    @property
+    def ambulance_detected(self):
+        return {lane: snap.ambulance for lane, snap in self.lanes.items()}
+
+    @property
+    def camera_frame(self):
+        return self.overhead.frame
+
+    @property
+    def siren_detected(self):
+        return self.audio.siren_detected
+
+    @property
+    def siren_bearing(self):
+        return self.audio.bearing
+
+    @property
+    def siren_lane_confidence(self):
+        return self.audio.lane_confidence
+
+    @property
+    def siren_approach(self):
+        return self.audio.approach
+
+    @property
+    def siren_eta(self):
+        return self.audio.eta
+
+    @property
+    def siren_speed(self):
+        return self.audio.speed
+
+    @property
+    def priority_mode(self):
+        return self.control.mode == "PRIORITY"
+
+    @property
+    def priority_lane(self):
+        return self.control.priority_lane
+
+def all_detections(snap):
+    """Every lane's detections of a StateSnapshot as one array."""
+    return concat(s.detections for s in snap.lanes.values())
 
 shared_state = SharedState()